@@ -1,5 +1,25 @@
-from flask import Flask, jsonify
-import time, threading, random, math
+from flask import Flask, jsonify, request
+from werkzeug.serving import WSGIRequestHandler
+import time, threading, random, math, asyncio
+
+# HTTP/1.1 so the load balancer can keep upstream connections alive. Werkzeug
+# >= 2.1 still answers every request with "Connection: close", so against the
+# Flask front-end the LB reports 0 reused connections (see /stats)
+WSGIRequestHandler.protocol_version = "HTTP/1.1"
+
+# Long-lived requests: `?duration=<s>` holds the connection open that long.
+# Capped below the load balancer's upstream timeout (30s).
+MAX_HOLD_DURATION = 25.0
+
+def parse_duration(raw):
+    """`duration` query value -> hold time in seconds (0 = short request)"""
+    try:
+        duration = float(raw) if raw is not None else 0.0
+    except ValueError:
+        return 0.0
+    if duration != duration:  # NaN
+        return 0.0
+    return max(0.0, min(duration, MAX_HOLD_DURATION))
 
 class ServerInstance:
     def __init__(self, port, base_delay, name, A, k):
@@ -23,6 +43,7 @@ class ServerInstance:
         self.CRASH_DURATION = 10
 
         self.app.add_url_rule("/", "index", self.index)
+        self.app.add_url_rule("/health", "health", self.health)
 
     def model_cpu(self, active_reqs):
         """Non-linear real-world CPU saturation model"""
@@ -38,63 +59,124 @@ class ServerInstance:
         jitter = random.uniform(-0.05, 0.05)
         return max(0.01, base * cpu_factor + jitter)
 
-    def index(self):
-        # 🟥 Handle crash mode
+    # ---------------------- REQUEST LIFECYCLE ----------------------
+    # Shared by the threaded (Flask) and async (aiohttp) front-ends.
+
+    def check_crashed(self):
+        """Returns the 503 body while the node is down, None once it serves again"""
         if self.is_crashed:
             elapsed = time.time() - self.crash_start_time
             if elapsed < self.CRASH_DURATION:
-                return jsonify({
+                return {
                     "server": self.name,
                     "port": self.port,
                     "status": "crashed",
                     "cpu_usage": 100,
                     "remaining": round(self.CRASH_DURATION - elapsed, 1),
-                }), 503
-            else:
-                self.is_crashed = False
-                self.cpu_overload_count = 0
-                print(f"♻️ {self.name} RECOVERED")
+                }
+            self.is_crashed = False
+            self.cpu_overload_count = 0
+            print(f"♻️ {self.name} RECOVERED")
+        return None
+
+    def plan_request(self, duration=0.0):
+        """Compute CPU + delay for an admitted request
+
+        A long-lived request holds its slot for `duration` on top of the
+        processing delay, so it keeps counting in active_requests."""
+        cpu = self.model_cpu(self.active_requests)
+        delay = self.model_delay(self.base_delay, cpu)
+        return cpu, delay + duration
+
+    def complete_request(self, cpu, delay, duration=0.0):
+        """Crash logic once the delay has elapsed -> (body, status)"""
+        if duration > 0:
+            # Load built up while the connection was held open
+            cpu = max(cpu, self.model_cpu(self.active_requests))
+
+        if cpu > 95:
+            self.cpu_overload_count += 1
+        else:
+            self.cpu_overload_count = 0
+
+        if self.cpu_overload_count >= 3:  # require 3 consecutive overloads
+            self.is_crashed = True
+            self.crash_start_time = time.time()
+            print(f"💥 {self.name} CRASHED (CPU stayed >95%)")
+            return {
+                "server": self.name,
+                "port": self.port,
+                "status": "crashed_now",
+                "cpu_usage": 100,
+                "delay": delay,
+            }, 503
+
+        return {
+            "server": self.name,
+            "port": self.port,
+            "status": "handled",
+            "delay": round(delay, 3),
+            "cpu_usage": int(cpu),
+            "active_requests": self.active_requests,
+            "connection_type": "long-lived" if duration > 0 else "short",
+            "hold": duration
+        }, 200
+
+    def index(self):
+        # 🟥 Handle crash mode
+        crashed = self.check_crashed()
+        if crashed is not None:
+            return jsonify(crashed), 503
         
         with self.lock:
             self.active_requests += 1
         
         try:
-            # Compute CPU + delay
-            cpu = self.model_cpu(self.active_requests)
-            delay = self.model_delay(self.base_delay, cpu)
+            duration = parse_duration(request.args.get("duration"))
+            cpu, delay = self.plan_request(duration)
             time.sleep(delay)
-
-            # Crash logic
-            if cpu > 95:
-                self.cpu_overload_count += 1
-            else:
-                self.cpu_overload_count = 0
-
-            if self.cpu_overload_count >= 3:  # require 3 consecutive overloads
-                self.is_crashed = True
-                self.crash_start_time = time.time()
-                print(f"💥 {self.name} CRASHED (CPU stayed >95%)")
-                return jsonify({
-                    "server": self.name,
-                    "port": self.port,
-                    "status": "crashed_now",
-                    "cpu_usage": 100,
-                    "delay": delay,
-                }), 503
-
-            return jsonify({
-                "server": self.name,
-                "port": self.port,
-                "status": "handled",
-                "delay": round(delay, 3),
-                "cpu_usage": int(cpu),
-                "active_requests": self.active_requests
-            })
+            body, status = self.complete_request(cpu, delay, duration)
+            return jsonify(body), status
         
         finally:
             with self.lock:
                 self.active_requests -= 1
 
+    def health_check(self):
+        """Liveness probe for the LB: no CPU model, no failure injection"""
+        crashed = self.check_crashed()
+        if crashed is not None:
+            return crashed, 503
+        return {"server": self.name, "status": "ok", "active_requests": self.active_requests}, 200
+
+    def health(self):
+        body, status = self.health_check()
+        return jsonify(body), status
+
+    async def async_health(self, request):
+        from aiohttp import web
+
+        body, status = self.health_check()
+        return web.json_response(body, status=status)
+
+    async def async_index(self, request):
+        from aiohttp import web
+
+        crashed = self.check_crashed()
+        if crashed is not None:
+            return web.json_response(crashed, status=503)
+
+        # Single event loop: no lock needed around the counter
+        self.active_requests += 1
+        try:
+            duration = parse_duration(request.query.get("duration"))
+            cpu, delay = self.plan_request(duration)
+            await asyncio.sleep(delay)
+            body, status = self.complete_request(cpu, delay, duration)
+            return web.json_response(body, status=status)
+        finally:
+            self.active_requests -= 1
+
     def run(self):
         print(f"🚀 {self.name} started on port {self.port}")
         self.app.run(port=self.port, debug=False, use_reloader=False, threaded=True)
@@ -102,18 +184,70 @@ class ServerInstance:
 
 # ---------------------- CLUSTER CONFIG ------------------------
 
+# (port, base_delay, name, A, k)
+NODES = [
+    (8001, 0.10, "Server_Fast", 70, 0.15),
+    (8002, 0.35, "Server_Medium", 90, 0.25),
+    (8003, 0.90, "Server_Slow", 120, 0.40),
+]
+
 def start_node(port, base_delay, name, A, k):
     node = ServerInstance(port, base_delay, name, A, k)
     node.run()
 
-if __name__ == "__main__":
-    print("\n--- BACKEND CLUSTER (REALISTIC MODE) ---")
+def raise_fd_limit(target=65536):
+    """Every open connection is a file descriptor: lift the soft limit"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY:
+        target = min(target, hard)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+def run_async_cluster(nodes):
+    """All nodes in ONE event loop: thousands of concurrent sleeps, no thread each"""
+    from aiohttp import web
+
+    raise_fd_limit()
+
+    async def serve():
+        runners = []
+        for node in nodes:
+            app = web.Application()
+            app.router.add_get("/", node.async_index)
+            app.router.add_get("/health", node.async_health)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", node.port, backlog=4096).start()
+            runners.append(runner)
+            print(f"🚀 {node.name} started on port {node.port} (async)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
 
-    t1 = threading.Thread(target=start_node, args=(8001, 0.10, "Server_Fast", 70, 0.15))
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
 
-    t2 = threading.Thread(target=start_node, args=(8002, 0.35, "Server_Medium", 90, 0.25))
+if __name__ == "__main__":
+    import argparse
 
-    t3 = threading.Thread(target=start_node, args=(8003, 0.90, "Server_Slow", 120, 0.40))
+    parser = argparse.ArgumentParser(description="Backend cluster")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                        help="threaded: Flask, one thread per request | async: aiohttp event loop")
+    args = parser.parse_args()
 
+    print(f"\n--- BACKEND CLUSTER (REALISTIC MODE, {args.mode}) ---")
 
-    t1.start(); t2.start(); t3.start()
+    if args.mode == "async":
+        run_async_cluster([ServerInstance(*n) for n in NODES])
+    else:
+        threads = [threading.Thread(target=start_node, args=n) for n in NODES]
+        for t in threads:
+            t.start()
@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from concurrent.futures import ThreadPoolExecutor
 
+from analysis import summarize, add_running_percentiles
+from results_store import ResultSink, running_summary
+
 # ============================
 # --- CẤU HÌNH CHUNG ---
 # ============================
@@ -26,12 +29,28 @@ WORKLOADS = ['constant', 'burst', 'heavy_tail']
 
 TOTAL_REQUESTS_PER_ALGO = 200   # 200 request / thuật toán / workload
 CONCURRENCY = 10
-COOLDOWN_TIME = 5
 REQUEST_TIMEOUT = 5
 
 REPEATS = 4                     # Repeat 4 lần để tính std
 WARMUP_REQUESTS = 50
 
+# Lịch gửi: request i dự kiến bắt đầu tại t0 + i / TARGET_RPS.
+# response_time đo từ thời điểm dự kiến -> tính cả thời gian chờ thread rảnh
+# (sửa coordinated omission); latency vẫn là service time như trước.
+TARGET_RPS = 10
+SCHEDULE_LEAD = 0.05
+TAIL_PERCENTILES = (50, 95, 99, 99.9)
+
+# Kết quả thô: lưu dạng cột (results_store.py), mỗi ô (algorithm, workload, run)
+# được ghi xuống đĩa ngay khi chạy xong. RESUME = True: chạy tiếp từ ô cuối cùng
+# đã hoàn thành sau khi bị ngắt. EXPORT_CSV = True để xuất thêm benchmark_data.csv
+RESULTS_DIR = "benchmark_data"
+RESUME = False
+EXPORT_CSV = False
+
+# Thuật toán gửi kèm từng request (header) -> không đổi /config toàn cục, không cần chờ cooldown
+ALGORITHM_HEADER = "X-LB-Algorithm"
+
 RANDOM_SEED = 42
 random.seed(RANDOM_SEED)
 
@@ -39,24 +58,37 @@ random.seed(RANDOM_SEED)
 # --- HELPER FUNCTIONS ---
 # ============================
 
-def set_load_balancer_config(algo):
+def set_load_balancer_config():
+    # Tắt outlier ejection: Server_Slow chậm là cố ý, không được đẩy nó khỏi phép so sánh
     requests.post(CONFIG_URL, json={
-        "algorithm": algo,
-        "cache_probability": 0
+        "cache": False,
+        "outlier_detection": False
     })
-    print(f"\n🔄 Switched to algorithm: {algo.upper()}")
-    time.sleep(COOLDOWN_TIME)
 
 
-def warmup():
+def warmup(algo=None):
+    headers = {ALGORITHM_HEADER: algo} if algo else None
     for _ in range(WARMUP_REQUESTS):
         try:
-            requests.get(LB_URL, timeout=2)
+            requests.get(LB_URL, headers=headers, timeout=2)
         except:
             pass
 
 
-def send_single_request(workload):
+def make_schedule(total, rps=None):
+    rps = rps or TARGET_RPS
+    t0 = time.time() + SCHEDULE_LEAD
+    return [t0 + i / rps for i in range(total)]
+
+
+def send_single_request(workload, intended=None, algo=None):
+    # Không gửi sớm hơn lịch; gửi muộn hơn lịch = thời gian xếp hàng bị che giấu
+    if intended is None:
+        intended = time.time()
+    wait = intended - time.time()
+    if wait > 0:
+        time.sleep(wait)
+
     start_time = time.time()
     params = {}
 
@@ -70,8 +102,10 @@ def send_single_request(workload):
             params["duration"] = random.choice([2, 4, 6])
 
     try:
-        resp = requests.get(LB_URL, params=params, timeout=REQUEST_TIMEOUT)
-        latency = (time.time() - start_time) * 1000
+        headers = {ALGORITHM_HEADER: algo} if algo else None
+        resp = requests.get(LB_URL, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        end_time = time.time()
+        latency = (end_time - start_time) * 1000
 
         data = resp.json()
         server_name = data.get('server', 'Unknown')
@@ -82,6 +116,7 @@ def send_single_request(workload):
 
         return {
             "latency": latency,
+            "response_time": (end_time - intended) * 1000,
             "server": server_name,
             "status": status,
             "success": 1 if status == 200 else 0
@@ -90,6 +125,7 @@ def send_single_request(workload):
     except:
         return {
             "latency": REQUEST_TIMEOUT * 1000,
+            "response_time": (time.time() - intended) * 1000,
             "server": "TIMEOUT",
             "status": 504,
             "success": 0
@@ -100,31 +136,45 @@ def send_single_request(workload):
 # ============================
 
 def run_benchmark():
-    all_results = []
 
     print("🚀 BENCHMARK STARTED")
     print(f"Algorithms: {len(ALGORITHMS)} | Workloads: {WORKLOADS}")
-    print(f"Requests: {TOTAL_REQUESTS_PER_ALGO} | Concurrency: {CONCURRENCY}")
+    print(f"Requests: {TOTAL_REQUESTS_PER_ALGO} | Concurrency: {CONCURRENCY} | Schedule: {TARGET_RPS} req/s")
     print(f"Repeats: {REPEATS}")
 
     try:
-        requests.get(LB_URL)
+        stats = requests.get(f"{LB_URL}/stats").json()
+        print(f"LB engine: {stats.get('engine', 'flask')}")
     except:
         print("❌ Cannot connect to Load Balancer.")
         return None
 
+    sink = ResultSink(RESULTS_DIR, resume=RESUME)
+    set_load_balancer_config()
+    if sink.completed:
+        print(f"⏩ Resuming: {len(sink.completed)} cells already in {RESULTS_DIR}/")
+
     for algo in ALGORITHMS:
-        set_load_balancer_config(algo)
-        warmup()
+        cells = [(algo, w, r) for w in WORKLOADS for r in range(1, REPEATS + 1)]
+        if all(sink.is_done(*c) for c in cells):
+            continue
+
+        print(f"\n🔄 Algorithm: {algo.upper()}")
+        warmup(algo)
 
         for workload in WORKLOADS:
             for run in range(1, REPEATS + 1):
+                if sink.is_done(algo, workload, run):
+                    continue
                 print(f"▶ Algo={algo} | Workload={workload} | Run={run}")
+                # Seed theo từng ô: chạy tiếp sau khi ngắt vẫn ra cùng workload
+                random.seed(f"{RANDOM_SEED}:{algo}:{workload}:{run}")
 
+                schedule = make_schedule(TOTAL_REQUESTS_PER_ALGO)
                 with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
                     futures = [
-                        executor.submit(send_single_request, workload)
-                        for _ in range(TOTAL_REQUESTS_PER_ALGO)
+                        executor.submit(send_single_request, workload, t, algo)
+                        for t in schedule
                     ]
                     results = [f.result() for f in futures]
 
@@ -135,9 +185,24 @@ def run_benchmark():
                         "run": run
                     })
 
-                all_results.extend(results)
+                sink.write((algo, workload, run), results)
+
+                s = sink.running_row(algo, workload)
+                print(f"  running: n={s['count']} avg={s['avg_latency']:.1f}ms"
+                      f" p99={s['p99_latency']:.1f}ms success={s['success_rate']:.1f}%")
 
-    return pd.DataFrame(all_results)
+    return sink.read()
+
+# ============================
+# --- TAIL LATENCY ---
+# ============================
+
+def latency_report(df, running=None):
+    """Percentile của service time và response time đã sửa, theo thuật toán/workload"""
+    # Một lượt vector hoá cho mọi nhóm (analysis.py), kèm khoảng tin cậy bootstrap;
+    # thêm cột hdr_* = percentile từ histogram HDR của ResultSink (nếu có)
+    report = summarize(df, percentiles=TAIL_PERCENTILES)
+    return add_running_percentiles(report, running, percentiles=TAIL_PERCENTILES)
 
 # ============================
 # --- VISUALIZATION ---
@@ -211,5 +276,13 @@ if __name__ == "__main__":
     if df is not None:
         visualize_results(df)
 
-        df.to_csv("benchmark_data.csv", index=False)
-        print("✅ Saved: benchmark_data.csv")
+        report = latency_report(df, running_summary(RESULTS_DIR))
+        print("\n=== TAIL LATENCY: service (latency) vs corrected (response) ===")
+        print(report.round(1).to_string(index=False))
+        report.to_csv("latency_percentiles.csv", index=False)
+        print("✅ Saved: latency_percentiles.csv")
+
+        print(f"✅ Saved: {RESULTS_DIR}/ ({len(df)} rows)")
+        if EXPORT_CSV:
+            df.to_csv(f"{RESULTS_DIR}.csv", index=False)
+            print(f"✅ Saved: {RESULTS_DIR}.csv")
@@ -0,0 +1,150 @@
+import math
+
+# ============================
+# HDR-style latency histogram
+# ============================
+# Log-linear buckets in the HdrHistogram layout: every power-of-two range
+# is split into the same number of linear sub-buckets, so any recorded
+# value is kept with a bounded relative error (0.1% at 3 significant
+# digits) from microseconds up to an hour, in a fixed ~23k-slot array.
+# Percentiles come from the counts, not from a sample, so p99 / p99.9
+# stay exact up to that error however many values are recorded.
+
+class LatencyHistogram:
+    """Latencies in milliseconds, stored internally as integer microseconds"""
+
+    def __init__(self, significant_digits=3, max_ms=3_600_000):
+        sub_bucket_count = 2 ** math.ceil(math.log2(2 * 10 ** significant_digits))
+        self.sub_bucket_bits = sub_bucket_count.bit_length() - 1
+        self.sub_bucket_half = sub_bucket_count // 2
+        self.max_value = int(max_ms * 1000)
+        bucket_count = max(1, self.max_value.bit_length() - self.sub_bucket_bits + 1)
+        self.counts = [0] * ((bucket_count + 1) * self.sub_bucket_half)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    # ---- index math (value in µs) ----
+
+    def _index(self, value):
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        sub = value >> bucket
+        return (bucket + 1) * self.sub_bucket_half + sub - self.sub_bucket_half
+
+    def _highest_equivalent(self, index):
+        bucket = index // self.sub_bucket_half - 1
+        sub = index % self.sub_bucket_half + self.sub_bucket_half
+        if bucket < 0:
+            bucket = 0
+            sub -= self.sub_bucket_half
+        return (sub << bucket) + (1 << bucket) - 1
+
+    # ---- recording ----
+
+    def record(self, latency_ms, count=1):
+        value = min(self.max_value, max(0, int(round(latency_ms * 1000))))
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def record_many(self, latencies_ms):
+        """record() for a whole array at once: bucket indices and counts are
+        computed in NumPy, only the non-empty buckets are touched in Python"""
+        import numpy as np
+
+        values = np.rint(np.asarray(latencies_ms, dtype=np.float64) * 1000)
+        values = np.clip(values, 0, self.max_value).astype(np.int64)
+        if values.size == 0:
+            return
+        # frexp's exponent is int.bit_length() for integers below 2**53
+        bucket = np.maximum(0, np.frexp(values)[1] - self.sub_bucket_bits)
+        index = (bucket + 1) * self.sub_bucket_half + (values >> bucket) - self.sub_bucket_half
+        counts = np.bincount(index, minlength=len(self.counts))
+        for i in np.flatnonzero(counts).tolist():
+            self.counts[i] += int(counts[i])
+        self.total += int(values.size)
+        self.sum += int(values.sum())
+        low = int(values.min())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = max(self.max, int(values.max()))
+
+    def merge(self, other):
+        """Add another histogram with the same layout"""
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    # ---- queries (milliseconds) ----
+
+    def percentile(self, q):
+        if self.total == 0:
+            return 0.0
+        target = max(1, math.ceil(q / 100 * self.total))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self._highest_equivalent(i), self.max) / 1000
+        return self.max / 1000
+
+    def cumulative_counts(self, bounds_ms):
+        """Counts at or below each ascending bound (Prometheus `le` buckets)"""
+        out = []
+        seen = 0
+        i = 0
+        for bound in bounds_ms:
+            limit = bound * 1000
+            while i < len(self.counts) and self._highest_equivalent(i) <= limit:
+                seen += self.counts[i]
+                i += 1
+            out.append(seen)
+        return out
+
+    def mean(self):
+        return self.sum / self.total / 1000 if self.total else 0.0
+
+    def summary(self, percentiles=(50, 90, 99, 99.9)):
+        out = {"count": self.total, "mean": self.mean(), "max": self.max / 1000}
+        for q in percentiles:
+            out[f"p{q:g}".replace(".", "")] = self.percentile(q)
+        return out
+
+    def to_dict(self):
+        """Sparse, JSON-friendly state (only non-empty buckets)"""
+        return {
+            "counts": {str(i): c for i, c in enumerate(self.counts) if c},
+            "total": self.total, "sum": self.sum, "min": self.min, "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, state, **kwargs):
+        h = cls(**kwargs)
+        for i, c in state["counts"].items():
+            h.counts[int(i)] = c
+        h.total = state["total"]
+        h.sum = state["sum"]
+        h.min = state["min"]
+        h.max = state["max"]
+        return h
+
+    @classmethod
+    def from_values(cls, values_ms, **kwargs):
+        h = cls(**kwargs)
+        for v in values_ms:
+            h.record(v)
+        return h
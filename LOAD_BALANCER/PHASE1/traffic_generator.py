@@ -4,14 +4,16 @@ import random
 import math
 import sys
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 LB_URL = "http://127.0.0.1:8000"
 
-def send_request(request_id):
+def send_request(request_id, verbose=True):
+    """Gửi 1 request tới LB, trả về True nếu thành công"""
     try:
         start = time.time()
         # Timeout cực ngắn để không block luồng gửi nếu server chậm
-        resp = requests.get(LB_URL, timeout=3) 
+        resp = get_session().get(LB_URL, timeout=3) 
         elapsed = time.time() - start
         
         data = resp.json()
@@ -20,101 +22,199 @@ def send_request(request_id):
         
         # In kết quả gọn gàng
         # Cache hit thì in màu xanh lá, Miss thì in màu thường
-        if "served_from_cache" in data.get("status", ""):
+        if not verbose:
+            pass
+        elif "served_from_cache" in data.get("status", ""):
             print(f"\033[92m[Req #{request_id}] ✅ CACHE HIT ({elapsed:.3f}s)\033[0m")
         else:
             print(f"[Req #{request_id}] ➡️ {server_name} ({elapsed:.3f}s)")
+        return resp.status_code == 200
             
-    except requests.exceptions.RequestException:
-        print(f"\033[91m[Req #{request_id}] ❌ FAILED (Load Balancer Timeout/Down)\033[0m")
+    except (requests.exceptions.RequestException, ValueError):
+        if verbose:
+            print(f"\033[91m[Req #{request_id}] ❌ FAILED (Load Balancer Timeout/Down)\033[0m")
+        return False
 
-def run_steady_mode(rps):
-    print(f"\n--- CHẾ ĐỘ STEADY: {rps} Requests/Giây ---")
+# ==== ENGINE OPEN-LOOP (LỊCH GỬI THEO ĐỒNG HỒ MONOTONIC) ====
+# Thời điểm gửi được tính trước theo lịch, không phụ thuộc request trước đã xong chưa
+# -> tốc độ không bị trôi. Request được đẩy vào một pool thread cố định thay vì
+# tạo thread mới cho mỗi request (tạo thread là nút thắt khi vài trăm RPS trở lên).
+MAX_WORKERS = 200          # Số thread gửi request tối đa
+REPORT_INTERVAL = 1.0      # Chu kỳ in thống kê (giây)
+QUIET_ABOVE_RPS = 50       # Trên mức này không in từng request nữa
+IDLE_TICK = 0.05           # Bước kiểm tra lại khi tốc độ mục tiêu = 0
+
+_local = threading.local()
+
+def get_session():
+    """Mỗi thread một Session -> giữ kết nối keep-alive tới LB"""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+class OpenLoopGenerator:
+    def __init__(self, rate_fn, arrival="poisson", max_workers=MAX_WORKERS):
+        self.rate_fn = rate_fn        # thời gian đã chạy (s) -> RPS mục tiêu
+        self.arrival = arrival        # "poisson" | "constant"
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.totals = self.new_window()
+        self.window = self.new_window()
+
+    @staticmethod
+    def new_window():
+        return {
+            "rate_time": 0.0,     # tích phân RPS mục tiêu theo thời gian lịch
+            "sched_time": 0.0,    # tổng thời gian lịch đã trôi qua
+            "sent": 0, "done": 0, "failed": 0,
+            "sched_lag": 0.0, "max_sched_lag": 0.0,
+            "queue_lag": 0.0, "max_queue_lag": 0.0,
+        }
+
+    def next_gap(self, rps):
+        if self.arrival == "poisson":
+            return random.expovariate(rps)
+        return 1.0 / rps
+
+    def worker(self, request_id, intended, verbose):
+        # Trễ hàng đợi: request phải chờ thread rảnh trong pool
+        queue_lag = time.monotonic() - intended
+        ok = send_request(request_id, verbose=verbose)
+        with self.lock:
+            for w in (self.window, self.totals):
+                w["done"] += 1
+                w["failed"] += 0 if ok else 1
+                w["queue_lag"] += queue_lag
+                w["max_queue_lag"] = max(w["max_queue_lag"], queue_lag)
+
+    def dispatch(self, intended, now, rps):
+        # Trễ lập lịch: request được gửi muộn hơn thời điểm dự kiến
+        sched_lag = now - intended
+        self.counter += 1
+        with self.lock:
+            for w in (self.window, self.totals):
+                w["sent"] += 1
+                w["sched_lag"] += sched_lag
+                w["max_sched_lag"] = max(w["max_sched_lag"], sched_lag)
+        self.pool.submit(self.worker, self.counter, intended, rps <= QUIET_ABOVE_RPS)
+
+    def account(self, rps, step):
+        with self.lock:
+            for w in (self.window, self.totals):
+                w["rate_time"] += rps * step
+                w["sched_time"] += step
+
+    def report(self, w, elapsed, label="⏱"):
+        target = w["rate_time"] / w["sched_time"] if w["sched_time"] else 0
+        sent = max(1, w["sent"])
+        done = max(1, w["done"])
+        print(f"{label} target {target:7.1f} rps | achieved {w['sent'] / elapsed:7.1f} rps"
+              f" | done {w['done'] / elapsed:7.1f} rps | failed {w['failed']}"
+              f" | lag lịch avg {w['sched_lag'] / sent * 1000:6.1f}ms max {w['max_sched_lag'] * 1000:6.1f}ms"
+              f" | lag hàng đợi avg {w['queue_lag'] / done * 1000:6.1f}ms max {w['max_queue_lag'] * 1000:6.1f}ms"
+              f" | đang chờ {self.totals['sent'] - self.totals['done']}")
+
+    def run(self, duration=None):
+        start = time.monotonic()
+        window_start = start
+        next_t = start
+        try:
+            while duration is None or next_t - start < duration:
+                now = time.monotonic()
+                if next_t > now:
+                    time.sleep(next_t - now)
+                    now = time.monotonic()
+
+                if now - window_start >= REPORT_INTERVAL:
+                    with self.lock:
+                        window, self.window = self.window, self.new_window()
+                    self.report(window, now - window_start)
+                    window_start = now
+
+                rps = self.rate_fn(next_t - start)
+                if rps <= 0:
+                    self.account(0, IDLE_TICK)
+                    next_t += IDLE_TICK
+                    continue
+
+                self.dispatch(next_t, now, rps)
+                gap = self.next_gap(rps)
+                self.account(rps, gap)
+                next_t += gap
+        except KeyboardInterrupt:
+            print("\nĐã dừng test.")
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.report(self.totals, max(1e-9, time.monotonic() - start), label="\n📊 TỔNG KẾT:")
+
+# ==== CÁC CHẾ ĐỘ TRAFFIC ====
+
+def run_steady_mode(rps, arrival="poisson", duration=None):
+    print(f"\n--- CHẾ ĐỘ STEADY: {rps} Requests/Giây ({arrival}) ---")
     print("Nhấn Ctrl+C để dừng...")
-    counter = 0
-    delay = 1.0 / rps
-    try:
-        while True:
-            counter += 1
-            # Tạo luồng mới cho mỗi request để không bị block
-            threading.Thread(target=send_request, args=(counter,)).start()
-            time.sleep(delay)
-    except KeyboardInterrupt:
-        print("\nĐã dừng test.")
-
-def run_spike_mode():
+    OpenLoopGenerator(lambda t: rps, arrival).run(duration)
+
+def spike_rate(t):
+    """Chu kỳ 57s: 5s bình thường (2 req/s) -> 50s SPIKE (20 req/s) -> 2s hạ nhiệt"""
+    t %= 57
+    if t < 5: return 2     # Giai đoạn yên bình (Normal traffic)
+    if t < 55: return 20   # Giai đoạn Bùng nổ (Spike traffic)
+    return 0               # Hạ nhiệt
+
+def run_spike_mode(arrival="poisson", duration=None):
     print(f"\n--- CHẾ ĐỘ SPIKE (ĐỘT BIẾN) ---")
     print("Mô phỏng: Yên bình -> BÙM (Traffic tăng vọt) -> Yên bình")
     print("Nhấn Ctrl+C để dừng...")
-    counter = 0
-    try:
-        while True:
-            # 1. Giai đoạn yên bình (Normal traffic)
-            print("\n🔵 Giai đoạn bình thường (Normal)...")
-            for _ in range(10):
-                counter += 1
-                threading.Thread(target=send_request, args=(counter,)).start()
-                time.sleep(0.5) # 2 req/s
-
-            # 2. Giai đoạn Bùng nổ (Spike traffic)
-            print("\n🔴 PHÁT HIỆN TRAFFIC SPIKE!!! (DDoS mô phỏng)...")
-            for _ in range(1000): # Bắn 1000 req cực nhanh
-                counter += 1
-                threading.Thread(target=send_request, args=(counter,)).start()
-                time.sleep(0.05) # 20 req/s
-
-            print("\n🟢 Hạ nhiệt...")
-            time.sleep(2) # Nghỉ ngơi
-
-    except KeyboardInterrupt:
-        print("\nĐã dừng test.")
-
-def run_wave_mode():
+    OpenLoopGenerator(spike_rate, arrival).run(duration)
+
+def wave_rate(t):
+    # Công thức hình sin để tạo dao động traffic
+    # Traffic sẽ dao động từ 2 req/s đến 20 req/s
+    return int(11 + 9 * math.sin(1.1 * t))
+
+def run_wave_mode(arrival="poisson", duration=None):
     print(f"\n--- CHẾ ĐỘ SINE WAVE (HÌNH SIN) ---")
     print("Mô phỏng: Traffic tăng dần lên đỉnh rồi giảm dần xuống đáy...")
-    counter = 0
-    t = 0
-    try:
-        while True:
-            # Công thức hình sin để tạo dao động traffic
-            # Traffic sẽ dao động từ 2 req/s đến 20 req/s
-            traffic_intensity = 11 + 9 * math.sin(t) 
-            
-            # Delay tỷ lệ nghịch với độ mạnh traffic (càng mạnh delay càng thấp)
-            current_rps = int(traffic_intensity)
-            delay = 1.0 / max(1, current_rps)
-            
-            counter += 1
-            threading.Thread(target=send_request, args=(counter,)).start()
-            
-            # Hiển thị mức độ traffic hiện tại bằng thanh ngang
-            bar = "█" * current_rps
-            sys.stdout.write(f"\rTraffic Level: {bar} ({current_rps} req/s)   ")
-            sys.stdout.flush()
+    OpenLoopGenerator(wave_rate, arrival).run(duration)
 
-            time.sleep(delay)
-            t += 0.1 # Tăng biến thời gian
-            
-    except KeyboardInterrupt:
-        print("\nĐã dừng test.")
+MODES = ["steady", "spike", "wave"]
+MENU = {"1": "steady", "2": "spike", "3": "wave"}
+
+ARRIVALS = {"1": "poisson", "2": "constant"}
 
 if __name__ == "__main__":
-    print("==========================================")
-    print("   CÔNG CỤ GIẢ LẬP TRAFFIC (LOAD TEST)    ")
-    print("==========================================")
-    print("1. Ổn định (Steady Load)")
-    print("2. Đột biến (Spike/Burst Load)")
-    print("3. Hình Sin (Wave/Oscillating Load)")
-    print("==========================================")
-    
-    choice = input("Chọn chế độ (1/2/3): ")
-    
-    if choice == '1':
-        rps = float(input("Nhập số request/giây (VD: 5): "))
-        run_steady_mode(rps)
-    elif choice == '2':
-        run_spike_mode()
-    elif choice == '3':
-        run_wave_mode()
+    import argparse
+    parser = argparse.ArgumentParser(description="Traffic generator (không truyền --mode -> menu tương tác)")
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--rps", type=float, default=5, help="RPS cho chế độ steady")
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--duration", type=float, default=None, help="Số giây chạy (mặc định: tới khi Ctrl+C)")
+    args = parser.parse_args()
+
+    if args.mode:
+        mode, rps, arrival = args.mode, args.rps, args.arrival
     else:
-        print("Lựa chọn không hợp lệ!")
\ No newline at end of file
+        print("==========================================")
+        print("   CÔNG CỤ GIẢ LẬP TRAFFIC (LOAD TEST)    ")
+        print("==========================================")
+        print("1. Ổn định (Steady Load)")
+        print("2. Đột biến (Spike/Burst Load)")
+        print("3. Hình Sin (Wave/Oscillating Load)")
+        print("==========================================")
+
+        choice = input("Chọn chế độ (1/2/3): ")
+        mode = MENU.get(choice)
+        if mode is None:
+            print("Lựa chọn không hợp lệ!")
+            sys.exit(1)
+        rps = float(input("Nhập số request/giây (VD: 5): ")) if mode == "steady" else 0
+        arrival = ARRIVALS.get(input("Kiểu arrival (1 = Poisson, 2 = Đều) [1]: ").strip() or "1", "poisson")
+
+    if mode == "steady":
+        run_steady_mode(rps, arrival, args.duration)
+    elif mode == "spike":
+        run_spike_mode(arrival, args.duration)
+    elif mode == "wave":
+        run_wave_mode(arrival, args.duration)
\ No newline at end of file
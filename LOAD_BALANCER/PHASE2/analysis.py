@@ -0,0 +1,205 @@
+import sys
+import numpy as np
+import pandas as pd
+
+from results_store import load_results
+
+# ============================
+# Vectorised result analysis
+# ============================
+# All per-(algorithm, workload) statistics come from one stable sort of the
+# raw rows by (group, latency): means/std/success use np.bincount over the
+# integer group codes, percentiles index straight into the sorted array.
+# No Python callback runs per row or per group, so tens of millions of rows
+# cost a sort, not a groupby().agg(lambda ...).
+
+GROUP_COLUMNS = ["algorithm", "workload"]
+PERCENTILES = (50, 95, 99, 99.9)
+TIMEOUT_SERVERS = ("timeout", "TIMEOUT")
+
+# Bootstrap CI of the mean latency. Groups larger than BOOTSTRAP_MAX_N use an
+# m-out-of-n bootstrap (resample m rows, rescale by sqrt(m/n)) so the cost
+# stays bounded however many rows a cell has.
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_MAX_N = 10_000
+BOOTSTRAP_CHUNK = 100
+CI_LEVEL = 0.95
+RANDOM_SEED = 42
+
+# ============================
+# Building blocks
+# ============================
+
+def encode_groups(df, columns=GROUP_COLUMNS):
+    """Integer code per row + a DataFrame of the group keys (sorted)"""
+    codes, keys = pd.MultiIndex.from_frame(df[columns]).factorize(sort=True)
+    return codes, pd.DataFrame(list(keys), columns=columns)
+
+def sort_by_group(values, codes, n_groups):
+    """Values sorted by (group, value) plus each group's start offset and size"""
+    order = np.lexsort((values, codes))
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return values[order], starts, counts
+
+def segment_percentiles(sorted_values, starts, counts, q):
+    """Linear-interpolated percentile q of every group at once (pandas' default)"""
+    pos = starts + (q / 100.0) * np.maximum(counts - 1, 0)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, starts + np.maximum(counts - 1, 0))
+    lo = np.minimum(lo, len(sorted_values) - 1)
+    hi = np.minimum(hi, len(sorted_values) - 1)
+    out = sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+    return np.where(counts > 0, out, np.nan)
+
+def group_mean_std(values, codes, counts):
+    sums = np.bincount(codes, weights=values, minlength=len(counts))
+    mean = sums / np.maximum(counts, 1)
+    dev = values - mean[codes]
+    sq = np.bincount(codes, weights=dev * dev, minlength=len(counts))
+    std = np.sqrt(sq / np.maximum(counts - 1, 1))
+    return mean, np.where(counts > 1, std, np.nan)
+
+def bootstrap_mean_ci(sorted_values, starts, counts, n_boot=BOOTSTRAP_SAMPLES,
+                      level=CI_LEVEL, max_n=BOOTSTRAP_MAX_N, seed=RANDOM_SEED):
+    rng = np.random.default_rng(seed)
+    alpha = (1 - level) / 2
+    low = np.full(len(counts), np.nan)
+    high = np.full(len(counts), np.nan)
+
+    for g, (start, n) in enumerate(zip(starts, counts)):
+        if n < 2:
+            continue
+        seg = sorted_values[start:start + n]
+        m = min(n, max_n)
+        means = np.empty(n_boot)
+        for c in range(0, n_boot, BOOTSTRAP_CHUNK):
+            b = min(BOOTSTRAP_CHUNK, n_boot - c)
+            means[c:c + b] = seg[rng.integers(0, n, size=(b, m))].mean(axis=1)
+        center = seg.mean()
+        scale = np.sqrt(m / n)
+        q_lo, q_hi = np.quantile(means, [alpha, 1 - alpha])
+        low[g] = center + (q_lo - center) * scale
+        high[g] = center + (q_hi - center) * scale
+    return low, high
+
+# ============================
+# Tables
+# ============================
+
+def percentile_name(q):
+    return f"p{q:g}".replace(".", "")
+
+def summarize(df, percentiles=PERCENTILES, n_boot=BOOTSTRAP_SAMPLES, seed=RANDOM_SEED):
+    """One row per (algorithm, workload): latency stats, CI, success rate, server share"""
+    codes, summary = encode_groups(df)
+    n_groups = len(summary)
+
+    latency = df["latency"].to_numpy(dtype=np.float64)
+    sorted_lat, starts, counts = sort_by_group(latency, codes, n_groups)
+    mean, std = group_mean_std(latency, codes, counts)
+
+    summary["count"] = counts
+    summary["avg_latency"] = mean
+    summary["std_latency"] = std
+    for q in percentiles:
+        summary[f"{percentile_name(q)}_latency"] = segment_percentiles(sorted_lat, starts, counts, q)
+    if n_boot:
+        summary["ci_low"], summary["ci_high"] = bootstrap_mean_ci(
+            sorted_lat, starts, counts, n_boot=n_boot, seed=seed)
+
+    # Coordinated-omission-corrected response time, when recorded
+    if "response_time" in df:
+        response = df["response_time"].to_numpy(dtype=np.float64)
+        sorted_resp, _, _ = sort_by_group(response, codes, n_groups)
+        summary["avg_response"], _ = group_mean_std(response, codes, counts)
+        for q in percentiles:
+            summary[f"{percentile_name(q)}_response"] = segment_percentiles(sorted_resp, starts, counts, q)
+
+    success = df["success"].to_numpy(dtype=np.float64)
+    summary["success_rate"] = np.bincount(codes, weights=success, minlength=n_groups) / np.maximum(counts, 1) * 100
+
+    # Share of successful requests handled by each backend
+    load = load_distribution(df, codes=codes, keys=summary[GROUP_COLUMNS])
+    totals = load.to_numpy().sum(axis=1, keepdims=True)
+    shares = load.to_numpy() / np.maximum(totals, 1)
+    for j, server in enumerate(load.columns):
+        summary[f"share_{server}"] = shares[:, j]
+
+    return summary
+
+def add_running_percentiles(summary, running, percentiles=PERCENTILES):
+    """HDR percentiles of the streaming sink (results_store.RunningStats) next
+    to the exact ones, as hdr_<column>; groups the sink never saw get NaN"""
+    if running is None or running.empty:
+        return summary
+    columns = [
+        f"{percentile_name(q)}_{name}" for name in ("latency", "response") for q in percentiles
+        if f"{percentile_name(q)}_{name}" in running
+    ]
+    hdr = running.set_index(GROUP_COLUMNS)[columns]
+    keys = pd.MultiIndex.from_frame(summary[GROUP_COLUMNS].astype(str))
+    hdr = hdr.reindex(keys)
+    for name in columns:
+        summary[f"hdr_{name}"] = hdr[name].to_numpy()
+    return summary
+
+def load_distribution(df, codes=None, keys=None):
+    """Successful requests per backend, indexed by (algorithm, workload) like pd.crosstab"""
+    if codes is None:
+        codes, keys = encode_groups(df)
+    ok = df["status"].to_numpy() == 200
+    server_codes, servers = pd.factorize(df["server"].to_numpy()[ok], sort=True)
+    n_groups, n_servers = len(keys), len(servers)
+
+    flat = np.bincount(codes[ok] * n_servers + server_codes, minlength=n_groups * n_servers)
+    index = pd.MultiIndex.from_frame(keys)
+    return pd.DataFrame(flat.reshape(n_groups, n_servers), index=index,
+                        columns=pd.Index(servers, name="server"))
+
+def box_stats(df, exclude_servers=TIMEOUT_SERVERS):
+    """Per-group box-plot stats (Tukey whiskers) for matplotlib's Axes.bxp"""
+    df = df[~df["server"].isin(exclude_servers)]
+    codes, keys = encode_groups(df)
+    latency = df["latency"].to_numpy(dtype=np.float64)
+    sorted_lat, starts, counts = sort_by_group(latency, codes, len(keys))
+
+    q1 = segment_percentiles(sorted_lat, starts, counts, 25)
+    med = segment_percentiles(sorted_lat, starts, counts, 50)
+    q3 = segment_percentiles(sorted_lat, starts, counts, 75)
+    iqr = q3 - q1
+
+    stats = []
+    for g, (start, n) in enumerate(zip(starts, counts)):
+        seg = sorted_lat[start:start + n]
+        lo = seg[np.searchsorted(seg, q1[g] - 1.5 * iqr[g], side="left")]
+        hi = seg[np.searchsorted(seg, q3[g] + 1.5 * iqr[g], side="right") - 1]
+        stats.append({
+            "algorithm": keys.at[g, "algorithm"], "workload": keys.at[g, "workload"],
+            "med": med[g], "q1": q1[g], "q3": q3[g], "whislo": lo, "whishi": hi, "fliers": [],
+        })
+    return stats
+
+def build_tables(df, **kwargs):
+    """Everything the plot scripts need, from a single load of the raw results"""
+    return {
+        "summary": summarize(df, **kwargs),
+        "load": load_distribution(df),
+        "box": box_stats(df),
+    }
+
+# ============================
+# Main
+# ============================
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "raw_results"
+    tables = build_tables(load_results(path))
+
+    tables["summary"].to_csv("analysis_summary.csv", index=False)
+    tables["load"].to_csv("analysis_load_distribution.csv")
+
+    with pd.option_context("display.width", 200, "display.max_columns", 30):
+        print(tables["summary"].round(2))
+    print("\n✅ Saved: analysis_summary.csv")
+    print("✅ Saved: analysis_load_distribution.csv")
@@ -1,5 +1,26 @@
 from flask import Flask, jsonify, request
-import time, threading, random, math
+from werkzeug.serving import WSGIRequestHandler
+import time, threading, random, math, asyncio
+
+# HTTP/1.1 so the load balancer can keep upstream connections alive. Werkzeug
+# >= 2.1 still answers every request with "Connection: close", so against the
+# Flask front-end the LB reports 0 reused connections (see /stats);
+# `--mode async` keeps them open
+WSGIRequestHandler.protocol_version = "HTTP/1.1"
+
+# Long-lived requests: `?duration=<s>` holds the connection open that long.
+# Capped below the load balancer's upstream timeout (30s).
+MAX_HOLD_DURATION = 25.0
+
+def parse_duration(raw):
+    """`duration` query value -> hold time in seconds (0 = short request)"""
+    try:
+        duration = float(raw) if raw is not None else 0.0
+    except ValueError:
+        return 0.0
+    if duration != duration:  # NaN
+        return 0.0
+    return max(0.0, min(duration, MAX_HOLD_DURATION))
 
 class ServerInstance:
     def __init__(self, port, name, profile):
@@ -32,7 +53,12 @@ class ServerInstance:
         self.crash_start_time = 0
         self.CRASH_DURATION = 8
 
+        # Clock + logger (simulator.py swaps in a virtual clock and silences logs)
+        self.clock = time.time
+        self.log = print
+
         self.app.add_url_rule("/", "index", self.index)
+        self.app.add_url_rule("/health", "health", self.health)
 
     # ==== MODELS ====
 
@@ -47,67 +73,132 @@ class ServerInstance:
         jitter = random.uniform(-0.03, 0.03)
         return max(0.01, self.BASE_DELAY * cpu_factor + jitter)
 
-    # ==== ROUTE ====
+    # ==== REQUEST LIFECYCLE ====
+    # Shared by the threaded (Flask) and async (aiohttp) front-ends; only the
+    # way the delay is waited out differs between the two.
+
+    def check_crashed(self):
+        """Returns the 503 body while the node is down, None once it serves again"""
+        if self.is_crashed:
+            if self.clock() - self.crash_start_time < self.CRASH_DURATION:
+                return {"server": self.name, "status": "crashed"}
+            self.is_crashed = False
+            self.cpu_overload_count = 0
+            self.log(f"♻️ {self.name} RECOVERED")
+        return None
+
+    def plan_request(self, duration=0.0):
+        """CPU + delay for an admitted request -> (cpu, delay, note)
+
+        A long-lived request holds its slot for `duration` on top of the
+        processing delay, so it keeps counting in active_requests."""
+        cpu = self.model_cpu(self.active_requests)
+        delay = self.model_delay(cpu)
+
+        # ===== FAILURE INJECTION ENGINE =====
+        note = "normal"
+        r = random.random()
+
+        if r < self.spike_prob:
+            delay = self.SPIKE_DELAY
+            note = "spike"
+            self.log(f"⚡ {self.name} latency spike")
+
+        elif r < (self.spike_prob + self.micro_freeze_prob):
+            delay = self.MICRO_FREEZE_DELAY
+            note = "micro_freeze"
+
+        elif r < (self.spike_prob + self.micro_freeze_prob + self.jitter_prob):
+            delay += random.uniform(0.2, 0.5)
+            note = "jitter"
+
+        return cpu, delay + duration, note
+
+    def complete_request(self, cpu, delay, note, duration=0.0):
+        """Crash logic once the delay has elapsed -> (body, status)"""
+        if duration > 0:
+            # Load built up while the connection was held open
+            cpu = max(cpu, self.model_cpu(self.active_requests))
+
+        if cpu > 97:
+            self.cpu_overload_count += 1
+        else:
+            self.cpu_overload_count = 0
+
+        if self.cpu_overload_count >= 4:
+            self.is_crashed = True
+            self.crash_start_time = self.clock()
+            self.log(f"💥 {self.name} CRASHED")
+            return {"status": "crashed_now"}, 503
+
+        return {
+            "server": self.name,
+            "status": "handled",
+            "delay": round(delay, 3),
+            "cpu_usage": int(cpu),
+            "note": note,
+            "connection_type": "long-lived" if duration > 0 else "short",
+            "hold": duration
+        }, 200
+
+    # ==== ROUTE (threaded) ====
 
     def index(self):
         # Circuit breaker
-        if self.is_crashed:
-            if time.time() - self.crash_start_time < self.CRASH_DURATION:
-                return jsonify({"server": self.name, "status": "crashed"}), 503
-            else:
-                self.is_crashed = False
-                self.cpu_overload_count = 0
-                print(f"♻️ {self.name} RECOVERED")
+        crashed = self.check_crashed()
+        if crashed is not None:
+            return jsonify(crashed), 503
 
         with self.lock:
             self.active_requests += 1
 
         try:
-            cpu = self.model_cpu(self.active_requests)
-            delay = self.model_delay(cpu)
+            duration = parse_duration(request.args.get("duration"))
+            cpu, delay, note = self.plan_request(duration)
+            time.sleep(delay)
+            body, status = self.complete_request(cpu, delay, note, duration)
+            return jsonify(body), status
+
+        finally:
+            with self.lock:
+                self.active_requests -= 1
 
-            # ===== FAILURE INJECTION ENGINE =====
-            note = "normal"
-            r = random.random()
+    # ==== ROUTE (async) ====
 
-            if r < self.spike_prob:
-                delay = self.SPIKE_DELAY
-                note = "spike"
-                print(f"⚡ {self.name} latency spike")
+    def health_check(self):
+        """Liveness probe for the LB: no CPU model, no failure injection"""
+        crashed = self.check_crashed()
+        if crashed is not None:
+            return crashed, 503
+        return {"server": self.name, "status": "ok", "active_requests": self.active_requests}, 200
 
-            elif r < (self.spike_prob + self.micro_freeze_prob):
-                delay = self.MICRO_FREEZE_DELAY
-                note = "micro_freeze"
+    def health(self):
+        body, status = self.health_check()
+        return jsonify(body), status
 
-            elif r < (self.spike_prob + self.micro_freeze_prob + self.jitter_prob):
-                delay += random.uniform(0.2, 0.5)
-                note = "jitter"
+    async def async_health(self, request):
+        from aiohttp import web
 
-            time.sleep(delay)
+        body, status = self.health_check()
+        return web.json_response(body, status=status)
 
-            # Crash logic
-            if cpu > 97:
-                self.cpu_overload_count += 1
-            else:
-                self.cpu_overload_count = 0
-
-            if self.cpu_overload_count >= 4:
-                self.is_crashed = True
-                self.crash_start_time = time.time()
-                print(f"💥 {self.name} CRASHED")
-                return jsonify({"status": "crashed_now"}), 503
-
-            return jsonify({
-                "server": self.name,
-                "status": "handled",
-                "delay": round(delay, 3),
-                "cpu_usage": int(cpu),
-                "note": note
-            })
+    async def async_index(self, request):
+        from aiohttp import web
 
+        crashed = self.check_crashed()
+        if crashed is not None:
+            return web.json_response(crashed, status=503)
+
+        # Single event loop: no lock needed around the counter
+        self.active_requests += 1
+        try:
+            duration = parse_duration(request.query.get("duration"))
+            cpu, delay, note = self.plan_request(duration)
+            await asyncio.sleep(delay)
+            body, status = self.complete_request(cpu, delay, note, duration)
+            return web.json_response(body, status=status)
         finally:
-            with self.lock:
-                self.active_requests -= 1
+            self.active_requests -= 1
 
     def run(self):
         import logging
@@ -116,6 +207,39 @@ class ServerInstance:
         self.app.run(port=self.port, debug=False, threaded=True, use_reloader=False)
 
 
+# ==== CLUSTER PROFILES ====
+
+PROFILES = [
+    {
+        "name": "Server_A",
+        "port": 8001,
+        "jitter_prob": 0.15,
+        "spike_prob": 0.15,
+        "micro_freeze_prob": 0.05,
+        "spike_delay": 2.5,
+        "micro_freeze_delay": 1.2
+    },
+    {
+        "name": "Server_B",
+        "port": 8002,
+        "jitter_prob": 0.25,
+        "spike_prob": 0.05,
+        "micro_freeze_prob": 0.15,
+        "spike_delay": 2.0,
+        "micro_freeze_delay": 1.5
+    },
+    {
+        "name": "Server_C",
+        "port": 8003,
+        "jitter_prob": 0.10,
+        "spike_prob": 0.10,
+        "micro_freeze_prob": 0.20,
+        "spike_delay": 3.0,
+        "micro_freeze_delay": 1.0
+    }
+]
+
+
 # ==== START CLUSTER ====
 
 def start_node(port, name, profile):
@@ -123,44 +247,68 @@ def start_node(port, name, profile):
     node.run()
 
 
+def raise_fd_limit(target=65536):
+    """Every open connection is a file descriptor: lift the soft limit"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY:
+        target = min(target, hard)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def run_async_cluster(nodes):
+    """All nodes in ONE event loop: thousands of concurrent sleeps, no thread each"""
+    from aiohttp import web
+
+    raise_fd_limit()
+
+    async def serve():
+        runners = []
+        for node in nodes:
+            app = web.Application()
+            app.router.add_get("/", node.async_index)
+            app.router.add_get("/health", node.async_health)
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", node.port, backlog=4096).start()
+            runners.append(runner)
+            print(f"🚀 {node.name} started on :{node.port} (async)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
 if __name__ == "__main__":
-    print("\n--- BACKEND CLUSTER ---")
-
-    PROFILES = [
-        {
-            "name": "Server_A",
-            "port": 8001,
-            "jitter_prob": 0.15,
-            "spike_prob": 0.15,
-            "micro_freeze_prob": 0.05,
-            "spike_delay": 2.5,
-            "micro_freeze_delay": 1.2
-        },
-        {
-            "name": "Server_B",
-            "port": 8002,
-            "jitter_prob": 0.25,
-            "spike_prob": 0.05,
-            "micro_freeze_prob": 0.15,
-            "spike_delay": 2.0,
-            "micro_freeze_delay": 1.5
-        },
-        {
-            "name": "Server_C",
-            "port": 8003,
-            "jitter_prob": 0.10,
-            "spike_prob": 0.10,
-            "micro_freeze_prob": 0.20,
-            "spike_delay": 3.0,
-            "micro_freeze_delay": 1.0
-        }
-    ]
-
-    threads = []
-    for p in PROFILES:
-        t = threading.Thread(
-            target=start_node, 
-            args=(p["port"], p["name"], p)
-        )
-        t.start()
-        threads.append(t)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backend cluster")
+    parser.add_argument("--mode", choices=["threaded", "async"], default="threaded",
+                        help="threaded: Flask, one thread per request | async: aiohttp event loop")
+    parser.add_argument("--port-offset", type=int, default=0,
+                        help="added to every node's port (isolated stacks side by side)")
+    args = parser.parse_args()
+
+    print(f"\n--- BACKEND CLUSTER ({args.mode}) ---")
+
+    if args.mode == "async":
+        run_async_cluster([ServerInstance(p["port"] + args.port_offset, p["name"], p) for p in PROFILES])
+    else:
+        threads = []
+        for p in PROFILES:
+            t = threading.Thread(
+                target=start_node, 
+                args=(p["port"] + args.port_offset, p["name"], p)
+            )
+            t.start()
+            threads.append(t)
@@ -1,9 +1,11 @@
 import requests
 import time
 import random
-import statistics
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import analysis
+from results_store import ResultSink, running_summary
 
 
 LB_URL = "http://127.0.0.1:8000"
@@ -20,12 +22,34 @@ ALGORITHMS = [
 
 REQUEST_TIMEOUT = 5
 CONCURRENCY = 10
+WORKERS = 1                  # load-generator processes (>1: coordinator mode)
+
+# Arrival schedule: request i is intended to start at t0 + i / TARGET_RPS.
+# Response time is measured from that intended start, so time spent queued
+# behind busy client threads is counted (coordinated-omission correction).
+TARGET_RPS = 10
+SCHEDULE_LEAD = 0.05         # s between building the schedule and t0
 
 # Benchmark rigor
 TOTAL_REQUESTS = 200
 REPEATS = 5
 WARMUP_REQUESTS = 50
-COOLDOWN = 5
+
+# The algorithm travels with every request (X-LB-Algorithm header), so no
+# global /config switch and no cooldown between cells. An "interleaved"
+# cell routes request i with ALGORITHMS[i % len(ALGORITHMS)]: all policies
+# share the same backends at the same time (A/B), TOTAL_REQUESTS each.
+ALGORITHM_HEADER = "X-LB-Algorithm"
+INTERLEAVED = "interleaved"
+
+# LB hedged requests (duplicate to a second backend after its recent p75)
+HEDGING = False
+# LB outlier ejection: off, so every algorithm picks from all backends
+OUTLIER_DETECTION = False
+
+# Raw per-request results: columnar store, each (algorithm, workload, run)
+# cell committed as soon as it finishes, so --resume skips completed cells
+RESULTS_DIR = "raw_results"
 
 # Reproducibility
 RANDOM_SEED = 42
@@ -38,110 +62,269 @@ WORKLOADS = ["constant", "burst", "heavy_tail"]
 # Helper functions
 # ============================
 
-def set_algorithm(algo):
-    requests.post(CONFIG_URL, json={"algorithm": algo, "cache_probability": 0})
-    time.sleep(COOLDOWN)
+def configure_lb():
+    """Cache and outlier ejection off for the whole run (the algorithm is chosen per request)"""
+    requests.post(CONFIG_URL, json={"cache": False, "hedging": HEDGING,
+                                    "outlier_detection": OUTLIER_DETECTION})
 
-def send_request(req_id, workload):
-    start = time.time()
+def cell_algorithms(algo):
+    """Policies routed in one cell: a single algorithm, or all of them interleaved"""
+    return list(ALGORITHMS) if algo == INTERLEAVED else [algo]
 
-    # Workload shaping
+def grid_cells(interleave=False, repeats=None):
+    """(algorithm, workload, run) cells of the benchmark grid, in run order"""
+    algos = [INTERLEAVED] if interleave else ALGORITHMS
+    return [
+        (algo, workload, run)
+        for algo in algos
+        for workload in WORKLOADS
+        for run in range(1, (repeats or REPEATS) + 1)
+    ]
+
+def get_lb_engine():
+    try:
+        return requests.get(f"{LB_URL}/stats", timeout=2).json().get("engine", "flask")
+    except:
+        return "unknown"
+
+def workload_params(workload):
+    """Workload shaping: query params for one request (shared with simulator.py)"""
     params = {}
     if workload == "burst" and random.random() < 0.3:
         params["duration"] = random.choice([1, 2, 3])
     elif workload == "heavy_tail":
         if random.random() < 0.2:
             params["duration"] = random.choice([2, 4, 6])
+    return params
+
+def make_schedule(total, rps=None):
+    """Intended start times (epoch seconds) for one experiment"""
+    rps = rps or TARGET_RPS
+    t0 = time.time() + SCHEDULE_LEAD
+    return [t0 + i / rps for i in range(total)]
+
+def send_request(req_id, workload, params=None, intended=None, algo=None):
+    if params is None:
+        params = workload_params(workload)
+
+    # Never start before the schedule; starting after it is the queueing
+    # delay that closed-loop timing would hide
+    if intended is None:
+        intended = time.time()
+    wait = intended - time.time()
+    if wait > 0:
+        time.sleep(wait)
+    start = time.time()
 
     try:
-        r = requests.get(LB_URL, params=params, timeout=REQUEST_TIMEOUT)
-        latency = (time.time() - start) * 1000
+        headers = {ALGORITHM_HEADER: algo} if algo else None
+        r = requests.get(LB_URL, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        end = time.time()
         data = r.json()
         return {
-            "latency": latency,
+            "latency": (end - start) * 1000,            # service time
+            "response_time": (end - intended) * 1000,   # corrected
             "status": r.status_code,
             "server": data.get("server", "unknown"),
-            "success": 1 if r.status_code == 200 else 0
+            "success": 1 if r.status_code == 200 else 0,
+            "algorithm": algo
         }
     except:
         return {
             "latency": REQUEST_TIMEOUT * 1000,
+            "response_time": (time.time() - intended) * 1000,
             "status": 504,
             "server": "timeout",
-            "success": 0
+            "success": 0,
+            "algorithm": algo
         }
 
 
-def warmup():
-    for _ in range(WARMUP_REQUESTS):
+def warmup(algos=(None,)):
+    for i in range(WARMUP_REQUESTS):
+        algo = algos[i % len(algos)]
         try:
-            requests.get(LB_URL, timeout=2)
+            requests.get(LB_URL, headers={ALGORITHM_HEADER: algo} if algo else None, timeout=2)
         except:
             pass
 
-def run_single_experiment(algo, workload, run_id):
-    set_algorithm(algo)
-    warmup()
+def seed_cell(algo, workload, run_id):
+    """Per-cell seed: a resumed or parallel sweep draws the same workload
+    shaping as a sequential one"""
+    random.seed(f"{RANDOM_SEED}:{algo}:{workload}:{run_id}")
+
+def run_single_experiment(algo, workload, run_id, workers=None):
+    algos = cell_algorithms(algo)
+    warmup(algos)
 
-    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
-        futures = [
-            executor.submit(send_request, i, workload)
-            for i in range(TOTAL_REQUESTS)
-        ]
+    # Same arrival rate as a single-algorithm cell; policies alternate per slot
+    schedule = make_schedule(TOTAL_REQUESTS * len(algos))
+    policies = [algos[i % len(algos)] for i in range(len(schedule))]
+    # Whole cell drawn here from the seed_cell stream: thread scheduling, the
+    # number of workers and earlier cells cannot change a request's params
+    params = [workload_params(workload) for _ in schedule]
+    if workers is not None:
+        results = workers.run(workload, schedule, CONCURRENCY, policies, params)
+    else:
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            futures = [
+                executor.submit(send_request, i, workload, p, t, a)
+                for i, (p, t, a) in enumerate(zip(params, schedule, policies))
+            ]
 
-        results = [f.result() for f in futures]
+            results = [f.result() for f in futures]
 
     for r in results:
-        r["algorithm"] = algo
         r["workload"] = workload
         r["run_id"] = run_id
 
     return results
 
-def run_benchmark():
-    all_results = []
+def print_running(sink, algo, workload):
+    for a in cell_algorithms(algo):
+        s = sink.running_row(a, workload)
+        print(f"  running {a}: n={s['count']} avg={s['avg_latency']:.1f}ms"
+              f" p99={s['p99_latency']:.1f}ms success={s['success_rate']:.1f}%")
 
-    for algo in ALGORITHMS:
-        for workload in WORKLOADS:
-            for run in range(1, REPEATS + 1):
-                print(f"▶ Algo={algo} | Workload={workload} | Run={run}")
-                batch = run_single_experiment(algo, workload, run)
-                all_results.extend(batch)
+def run_benchmark(n_workers=WORKERS, results_dir=RESULTS_DIR, resume=False, interleave=False):
+    sink = ResultSink(results_dir, resume=resume)
+    if sink.completed:
+        print(f"⏩ Resuming: {len(sink.completed)} cells already in {results_dir}/")
+    configure_lb()
+    workers = LoadWorkers(n_workers) if n_workers > 1 else None
 
-    return pd.DataFrame(all_results)
+    try:
+        for algo, workload, run in grid_cells(interleave):
+            if sink.is_done(algo, workload, run):
+                continue
+            print(f"▶ Algo={algo} | Workload={workload} | Run={run}")
+            seed_cell(algo, workload, run)
+            batch = run_single_experiment(algo, workload, run, workers)
+            sink.write((algo, workload, run), batch)
+            print_running(sink, algo, workload)
+    finally:
+        if workers is not None:
+            workers.close()
+
+    return sink.read()
+
+# ============================
+# Distributed load generation
+# ============================
+# One Python process (and its GIL) tops out well below what the LB can
+# take. In coordinator mode the main process only warms up; N worker processes each drive a share of every experiment
+# with their own thread pool and stream per-request records back.
+
+def split_evenly(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+def worker_main(worker_id, tasks, records):
+    # Params come with the task (drawn per cell by the coordinator), so a
+    # worker's RNG never shapes the workload
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        workload, schedule, concurrency, policies, params = task
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(send_request, i, workload, p, t, a): i
+                for i, (p, t, a) in enumerate(zip(params, schedule, policies))
+            }
+            for f in as_completed(futures):
+                records.put((worker_id, futures[f], f.result()))
+
+        records.put((worker_id, None, None))   # share finished
+
+class LoadWorkers:
+    def __init__(self, n):
+        self.records = mp.Queue()
+        self.tasks = []
+        self.procs = []
+        for worker_id in range(n):
+            q = mp.Queue()
+            p = mp.Process(target=worker_main, args=(worker_id, q, self.records), daemon=True)
+            p.start()
+            self.tasks.append(q)
+            self.procs.append(p)
+
+    def run(self, workload, schedule, concurrency, policies, params):
+        """Split one experiment across the workers and merge their records"""
+        n = len(self.procs)
+        threads = [max(1, c) for c in split_evenly(concurrency, n)]
+        busy = 0
+        for k, (q, conc) in enumerate(zip(self.tasks, threads)):
+            # Interleaved slots keep every worker's share spread over the run
+            share = schedule[k::n]
+            if share:
+                q.put((workload, share, conc, policies[k::n], params[k::n]))
+                busy += 1
+
+        # Records stream back in completion order; slot j of worker k is
+        # request k + j * n, so the merged list is in schedule order again
+        results = [None] * len(schedule)
+        while busy:
+            worker_id, j, record = self.records.get()
+            if record is None:
+                busy -= 1
+            else:
+                results[worker_id + j * n] = record
+        return results
+
+    def close(self):
+        for q in self.tasks:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout=5)
 
 # ============================
 # Statistical analysis
 # ============================
 
-def analyze(df):
-    summary = (
-        df.groupby(["algorithm", "workload"])
-        .agg(
-            avg_latency=("latency", "mean"),
-            std_latency=("latency", "std"),
-            p95_latency=("latency", lambda x: x.quantile(0.95)),
-            success_rate=("success", "mean")
-        )
-        .reset_index()
-    )
-
-    summary["success_rate"] *= 100
-    return summary
+def analyze(df, running=None):
+    # Older raw files have no schedule: response time == service time
+    if "response_time" not in df:
+        df = df.assign(response_time=df["latency"])
+
+    # Exact percentiles, bootstrap CI and server shares in one vectorised pass,
+    # plus the sink's HDR percentiles (hdr_*) when its running summary is given
+    return analysis.add_running_percentiles(analysis.summarize(df), running)
 
 # ============================
 # Main
 # ============================
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="LB benchmark")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="load-generator processes (requests and concurrency are split across them)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help="total in-flight requests across all workers")
+    parser.add_argument("--interleave", action="store_true",
+                        help="run all algorithms interleaved in every cell (A/B on the same backends)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="enable the LB's hedged requests for the run")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"continue an interrupted run from the cells already in {RESULTS_DIR}/")
+    parser.add_argument("--csv", action="store_true",
+                        help=f"also export the raw results to {RESULTS_DIR}.csv")
+    args = parser.parse_args()
+    CONCURRENCY = args.concurrency
+    HEDGING = args.hedge
+
     print("=== JOURNAL-GRADE BENCHMARK STARTED ===")
-    df = run_benchmark()
-    summary = analyze(df)
+    print(f"LB engine: {get_lb_engine()} | workers: {args.workers} | concurrency: {CONCURRENCY}"
+          f" | schedule: {TARGET_RPS} req/s | hedging: {'on' if HEDGING else 'off'}")
+    df = run_benchmark(args.workers, resume=args.resume, interleave=args.interleave)
+    summary = analyze(df, running_summary(RESULTS_DIR))
 
-    df.to_csv("raw_results.csv", index=False)
+    if args.csv:
+        df.to_csv(f"{RESULTS_DIR}.csv", index=False)
     summary.to_csv("summary_results.csv", index=False)
 
     print("\n=== SUMMARY (Mean ± Std) ===")
     print(summary)
-    print("\n✅ Saved: raw_results.csv")
+    print(f"\n✅ Saved: {RESULTS_DIR}/ ({len(df)} rows)" + (f" + {RESULTS_DIR}.csv" if args.csv else ""))
     print("✅ Saved: summary_results.csv")
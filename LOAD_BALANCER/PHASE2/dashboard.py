@@ -23,7 +23,9 @@ algo_option = st.sidebar.selectbox(
         'weighted_response_time',
         'peak_ewma',   # Mới: Tối ưu độ trễ (Linkerd/AWS)
         'p2c',         # Mới: Power of 2 Choices (Nginx)
-        'adaptive'     # Mới: Dựa trên CPU thực tế
+        'adaptive',    # Mới: Dựa trên CPU thực tế
+        'consistent_hash',    # Mới: Cùng khoá -> cùng backend (cache affinity)
+        'bounded_load_hash'   # Mới: Consistent hashing có giới hạn tải (Google/Vimeo)
     )
 )
 
@@ -35,11 +37,11 @@ if st.sidebar.button("Áp dụng thuật toán"):
 
 st.sidebar.markdown("---")
 st.sidebar.header("Optimization (Caching)")
-cache_prob = st.sidebar.slider("🎯 Tỷ lệ Cache Hit giả lập (%)", 0, 100, 10)
-if st.sidebar.button("Cập nhật tỷ lệ Cache"):
+cache_on = st.sidebar.checkbox("🎯 Bật response cache (LRU + TTL)", value=False)
+if st.sidebar.button("Cập nhật Cache"):
     try:
-        requests.post(f"{LB_URL}/config", json={"cache_probability": cache_prob})
-        st.sidebar.success(f"Đã đặt tỷ lệ Cache: {cache_prob}%")
+        requests.post(f"{LB_URL}/config", json={"cache": cache_on})
+        st.sidebar.success(f"Cache: {'BẬT' if cache_on else 'TẮT'}")
     except: st.sidebar.error("Lỗi kết nối!")
 
 st.sidebar.markdown("---")
@@ -68,11 +70,13 @@ def update_dashboard():
         kpi1.metric("Thuật toán", data['algorithm'].upper())
         kpi2.metric("Tổng Request", data['total_requests'])
         
-        prob_setting = data.get('cache_probability', 0) * 100
-        real_cache_rate = 0
-        if data['total_requests'] > 0:
-            real_cache_rate = (data['cache_hits'] / data['total_requests']) * 100
-        kpi4.metric("Cache (Set/Real)", f"{prob_setting:.0f}% / {real_cache_rate:.1f}%")
+        cache_setting = "ON" if data.get('cache_enabled') else "OFF"
+        # Tỷ lệ trúng thật của cache (hits / số lần tra cache)
+        cache_stats = data.get('cache', {})
+        real_cache_rate = cache_stats.get('hit_ratio', 0) * 100
+        kpi4.metric("Cache (On/Hit)", f"{cache_setting} / {real_cache_rate:.1f}%",
+                    help=f"{cache_stats.get('entries', 0)} entries | {cache_stats.get('bytes', 0)} bytes | "
+                         f"evictions: {cache_stats.get('evictions', 0)}")
 
         # Tìm server tốt nhất (chỉ tính những server khỏe mạnh)
         active_healthy_servers = [s for s in servers if s.get('total_handled', 0) > 0 and s.get('health_status') == 'healthy']
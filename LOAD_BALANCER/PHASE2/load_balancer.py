@@ -3,104 +3,1160 @@ import time
 import random 
 import threading 
 import math
-from flask import Flask, jsonify, request
+import itertools
+import heapq
+import bisect
+import hashlib
+import json
+import statistics
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from flask import Flask, Response, jsonify, request
+from requests.adapters import HTTPAdapter
+from histogram import LatencyHistogram
 
 app = Flask(__name__)
 
 # --- CẤU HÌNH ---
 CURRENT_ALGORITHM = 'peak_ewma' 
-CACHE_PROBABILITY = 0.1 
-TOTAL_REQUESTS = 0
-RESPONSE_CACHE = {} 
-CACHE_HITS = 0      
+CACHE_ENABLED = False       # Response cache (mọi request cacheable đều tra cache); tắt mặc định:
+                            # GET / không tham số trùng khoá -> cache trả thay backend, LB hết cân bằng.
+                            # Bật: POST /config {"cache": true}
+CACHE_TTL = 5.0             # Thời gian sống của mỗi entry (giây)
+CACHE_MAX_BYTES = 1_000_000 # Giới hạn dung lượng cache (byte), vượt thì loại LRU
 
 # Định giá server ($/giờ)
 SERVER_PRICES = {"Fast (8001)": 10, "Medium (8002)": 5, "Slow (8003)": 2}
 
-SERVERS = [
-    {"name": "Fast (8001)", "url": "http://127.0.0.1:8001", "weight": 5, "active_conns": 0, "avg_response_time": 0.1, "ewma_response_time": 0.1, "total_handled": 0, "active": True, "cpu_usage": 0, "health_status": "healthy", "last_crash_time": 0},
-    {"name": "Medium (8002)", "url": "http://127.0.0.1:8002", "weight": 3, "active_conns": 0, "avg_response_time": 0.5, "ewma_response_time": 0.5, "total_handled": 0, "active": True, "cpu_usage": 0, "health_status": "healthy", "last_crash_time": 0},
-    {"name": "Slow (8003)", "url": "http://127.0.0.1:8003", "weight": 1, "active_conns": 0, "avg_response_time": 1.0, "ewma_response_time": 1.0, "total_handled": 0, "active": True, "cpu_usage": 0, "health_status": "healthy", "last_crash_time": 0},
-]
-current_index = 0
 BACKEND_RECOVERY_TIME = 10  # Thời gian chờ hồi phục sau crash
 EWMA_DECAY = 0.3            # Hệ số làm mượt cho thuật toán EWMA
+DEFAULT_POOL_SIZE = 20      # Số kết nối keep-alive tối đa giữ lại cho mỗi backend
+
+# --- TRẠNG THÁI SERVER (THREAD-SAFE) ---
+class AtomicCounter:
+    """
+    Bộ đếm dùng chung giữa nhiều thread (thay cho `+=` không đồng bộ).
+    Ghi trong khóa (khóa chỉ giữ cho một phép cộng); đọc một int là nguyên tử nên không cần khóa.
+    """
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def incr(self):
+        with self._lock:
+            self._value += 1
+
+    @property
+    def value(self):
+        return self._value
+
+# --- CIRCUIT BREAKER (CLOSED / OPEN / HALF-OPEN) ---
+CB_WINDOW = 20              # Số kết quả gần nhất dùng để tính tỉ lệ lỗi
+CB_MIN_CALLS = 10           # Cần ít nhất chừng này kết quả mới xét tỉ lệ lỗi
+CB_FAILURE_RATE = 0.5       # Tỉ lệ lỗi trong cửa sổ >= ngưỡng -> open
+CB_HALF_OPEN_CALLS = 3      # Half-open: tối đa chừng này request thử đang bay; đủ chừng này thành công -> closed
+CB_PROBE_FAILURES = 2       # Số probe lỗi liên tiếp -> open (không tốn request thật)
+CB_EVENTS_KEPT = 100        # Số lần chuyển trạng thái gần nhất trả về trong /stats
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker:
+    """
+    Máy trạng thái của một backend. Không tự khóa: mọi lời gọi nằm dưới BackendState.lock.
+    Các hàm on_* trả về (trạng thái cũ, trạng thái mới, lý do, mã lượt) khi chuyển trạng thái, ngược lại None.
+    Muốn đổi chính sách -> gán CIRCUIT_BREAKER một lớp khác cùng giao diện.
+    """
+    __slots__ = ("state", "outcomes", "failures", "trials", "trial_successes",
+                 "probe_failures", "opened_at", "transitions")
+
+    def __init__(self):
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=CB_WINDOW)   # True = lỗi
+        self.failures = 0
+        self.trials = 0
+        self.trial_successes = 0
+        self.probe_failures = 0
+        self.opened_at = 0.0
+        self.transitions = 0
+
+    def allows_traffic(self):
+        return self.state == CLOSED or (self.state == HALF_OPEN and self.trials < CB_HALF_OPEN_CALLS)
+
+    def failure_rate(self):
+        return self.failures / len(self.outcomes) if self.outcomes else 0.0
+
+    def _move(self, state, reason):
+        old = self.state
+        self.state = state
+        self.transitions += 1
+        self.outcomes.clear()
+        self.failures = self.trials = self.trial_successes = self.probe_failures = 0
+        if state == OPEN: self.opened_at = time.time()
+        return old, state, reason, self.transitions
+
+    def _record(self, failed):
+        if len(self.outcomes) == CB_WINDOW and self.outcomes[0]: self.failures -= 1
+        self.outcomes.append(failed)
+        self.failures += failed
+
+    def on_admit(self):
+        """Request thật được chọn tới backend này (half-open: chiếm một lượt thử)"""
+        if self.state == HALF_OPEN: self.trials += 1
+
+    def on_release(self):
+        """
+        Request kết thúc theo bất kỳ cách nào (kể cả bị huỷ: hedge thua, client ngắt) -> trả lượt thử.
+        Trả về True khi half-open vừa có lại chỗ (backend quay lại rotation).
+        """
+        if self.state != HALF_OPEN or self.trials == 0: return False
+        self.trials -= 1
+        return self.trials == CB_HALF_OPEN_CALLS - 1
+
+    def on_success(self):
+        if self.state == CLOSED:
+            self._record(False)
+        elif self.state == HALF_OPEN:
+            self.trial_successes += 1
+            if self.trial_successes >= CB_HALF_OPEN_CALLS:
+                return self._move(CLOSED, "trial requests succeeded")
+        return None
+
+    def on_failure(self, hard=False):
+        """hard=True: backend báo crash / từ chối kết nối -> open ngay, không chờ đủ cửa sổ"""
+        if self.state == OPEN: return None
+        if self.state == HALF_OPEN: return self._move(OPEN, "trial request failed")
+        if hard: return self._move(OPEN, "backend crashed")
+        self._record(True)
+        rate = self.failure_rate()
+        if len(self.outcomes) >= CB_MIN_CALLS and rate >= CB_FAILURE_RATE:
+            return self._move(OPEN, f"failure rate {rate:.0%} over last {len(self.outcomes)} calls")
+        return None
+
+    def on_probe(self, ok, open_for):
+        """Kết quả health probe chủ động; open chỉ sang half-open khi probe thành công"""
+        if ok:
+            self.probe_failures = 0
+            if self.state == OPEN and time.time() - self.opened_at >= open_for:
+                return self._move(HALF_OPEN, "health probe succeeded")
+            return None
+        self.probe_failures += 1
+        if self.state == HALF_OPEN: return self._move(OPEN, "health probe failed")
+        if self.state == CLOSED and self.probe_failures >= CB_PROBE_FAILURES:
+            return self._move(OPEN, f"{self.probe_failures} health probes failed")
+        return None
+
+    def on_open_timeout(self, token):
+        """Không có probe chủ động: hết thời gian open -> half-open (lượt open cũ thì bỏ qua)"""
+        if self.state == OPEN and self.transitions == token:
+            return self._move(HALF_OPEN, "open timeout elapsed")
+        return None
+
+CIRCUIT_BREAKER = CircuitBreaker
+
+# --- OUTLIER DETECTION (SỐ LIỆU THEO KHOẢNG) ---
+# Tắt mặc định: PHASE1 cố ý chạy backend nhanh/vừa/chậm (0.10s / 0.35s / 0.90s) -> Slow luôn có
+# p99 gấp vài lần các backend còn lại và bị đẩy ra, mọi thuật toán chỉ còn chọn giữa 2 backend.
+# Bật: --outlier-detection hoặc POST /config {"outlier_detection": true}
+OUTLIER_DETECTION_ENABLED = False
+OUTLIER_INTERVAL = 10.0     # Giây giữa hai lần so sánh các backend
+OUTLIER_MIN_REQUESTS = 20   # Backend cần ít nhất chừng này request trong khoảng mới được xét
+OUTLIER_LATENCY_PERCENTILE = 99
+OUTLIER_DIGITS = 2          # Sai số tương đối ≤ 1% là đủ để so sánh p99
+OUTLIER_LATENCY_FACTOR = 2.0    # p99 > 2 × trung vị p99 của các backend còn lại -> outlier...
+OUTLIER_MEAN_FACTOR = 1.5       # Trung bình > 1.5 × trung vị của các backend còn lại -> outlier
+                                # (spike dày đặc: p99 vẫn bằng mức spike như mọi backend, chỉ mean lộ ra)
+OUTLIER_LATENCY_MIN_GAP = 0.2   # Cả hai điều kiện độ trễ phải cách xa ít nhất 200ms (2ms so với 1ms không phải outlier)
+OUTLIER_ERROR_MARGIN = 0.2      # Tỉ lệ lỗi cao hơn trung vị các backend còn lại ≥ 20 điểm % -> outlier
+OUTLIER_BASE_EJECTION = 10.0    # Lần đầu bị đẩy ra 10s, mỗi lần tái phạm liên tiếp nhân đôi
+OUTLIER_MAX_EJECTION = 300.0
+OUTLIER_MAX_EJECTION_PERCENT = 34   # Không bao giờ đẩy ra quá 34% số backend (3 server -> tối đa 1)
+OUTLIER_EVENTS_KEPT = 100
+
+# --- ADMISSION CONTROL (GIỚI HẠN ĐỒNG THỜI THÍCH ỨNG) ---
+# Tắt mặc định (bật: --admission-control hoặc POST /config {"admission": true}).
+# Request dài hạn (?duration=) vẫn chiếm một chỗ trong limit: backend tính CPU theo số request
+# đang xử lý, kể cả request đang hold -> chính tải heavy_tail này đẩy backend vào vòng crash.
+# (Độ trễ đưa vào limiter thì đã trừ hold: thời gian hold do client chọn, không phải dấu hiệu quá tải.)
+ADMISSION_ENABLED = False
+ADMISSION_INITIAL_LIMIT = 10    # Request đồng thời tối đa mỗi backend lúc khởi động
+ADMISSION_MIN_LIMIT = 2
+ADMISSION_MAX_LIMIT = 40
+ADMISSION_BATCH = 10            # Số mẫu độ trễ mỗi lần cập nhật limit
+ADMISSION_SMOOTHING = 0.2       # Tỉ trọng của limit mới khi làm mượt
+ADMISSION_BASELINE_DRIFT = 0.05 # Baseline trôi lên 5% khoảng cách mỗi lô (tải nền đổi thì baseline theo kịp)
+ADMISSION_BACKOFF = 0.9         # Dấu hiệu quá tải (503 / timeout / CPU cao): limit × 0.9 ngay
+ADMISSION_CPU_HIGH = 95         # cpu_usage ≥ mức này = một lần "quá tải" (backend crash sau 3-4 lần liên tiếp >95/97%)
+ADMISSION_QUEUE_SIZE = 100      # Số request được chờ chỗ trống, vượt -> 429 ngay
+ADMISSION_QUEUE_TIMEOUT = 1.0   # Chờ quá chừng này giây mà chưa có chỗ -> 503
+
+class ConcurrencyLimiter:
+    """
+    Giới hạn đồng thời thích ứng của một backend (kiểu gradient của Netflix concurrency-limits).
+    Mỗi ADMISSION_BATCH mẫu: trung vị độ trễ của lô (trung vị -> spike/freeze ngẫu nhiên không
+    kéo limit xuống) so với baseline (trung vị thấp nhất từng thấy, trôi lên chậm):
+        gradient = clamp(baseline / hiện tại, 0.5, 1);  limit mới = limit × gradient + √limit
+    Backend bắt đầu quá tải -> độ trễ xử lý tăng theo CPU -> gradient < 1 -> limit giảm;
+    √limit là khoảng dư để limit còn tăng được khi độ trễ đứng yên.
+    Độ trễ chỉ tăng ~2 lần từ rảnh tới bão hoà nên gradient phản ứng chậm: 503 / timeout và
+    phản hồi báo CPU ≥ ADMISSION_CPU_HIGH giảm nhân ngay (AIMD), trước khi backend chạm ngưỡng crash.
+    """
+    __slots__ = ("limit", "baseline", "samples", "lock")
+
+    def __init__(self, limit=ADMISSION_INITIAL_LIMIT):
+        self.limit = float(limit)
+        self.baseline = None
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def on_sample(self, latency):
+        with self.lock:
+            self.samples.append(latency)
+            if len(self.samples) < ADMISSION_BATCH: return
+            current = statistics.median(self.samples)
+            self.samples = []
+            if self.baseline is None or current < self.baseline:
+                self.baseline = current
+            else:
+                self.baseline += (current - self.baseline) * ADMISSION_BASELINE_DRIFT
+            gradient = max(0.5, min(1.0, self.baseline / current)) if current > 0 else 1.0
+            target = self.limit * gradient + math.sqrt(self.limit)
+            limit = self.limit * (1 - ADMISSION_SMOOTHING) + target * ADMISSION_SMOOTHING
+            self.limit = max(ADMISSION_MIN_LIMIT, min(ADMISSION_MAX_LIMIT, limit))
+
+    def on_overload(self):
+        with self.lock:
+            self.limit = max(ADMISSION_MIN_LIMIT, self.limit * ADMISSION_BACKOFF)
+
+class OutlierWindow:
+    """
+    Số liệu của một backend trong khoảng phát hiện hiện tại + trạng thái ejection.
+    Khoá riêng (không dùng BackendState.lock) -> ghi số liệu không tranh chấp với chọn server.
+    """
+    __slots__ = ("latency", "requests", "errors", "ejected_until", "ejections", "multiplier", "last", "lock")
+
+    def __init__(self):
+        self.latency = LatencyHistogram(significant_digits=OUTLIER_DIGITS)
+        self.requests = 0
+        self.errors = 0
+        self.ejected_until = 0.0
+        self.ejections = 0          # Tổng số lần bị đẩy ra
+        self.multiplier = 0         # Số lần bị đẩy ra liên tiếp gần đây (back-off luỹ thừa)
+        self.last = None            # Số liệu của khoảng vừa xét (cho /stats)
+        self.lock = threading.Lock()
+
+    def record_latency(self, latency):
+        with self.lock:
+            self.latency.record(latency * 1000)
+            self.requests += 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def collect(self):
+        """Chốt khoảng vừa qua và bắt đầu khoảng mới -> {requests, error_rate, p99, mean (giây)}"""
+        with self.lock:
+            hist, requests, errors = self.latency, self.requests, self.errors
+            self.latency = LatencyHistogram(significant_digits=OUTLIER_DIGITS)
+            self.requests = self.errors = 0
+        self.last = {
+            "requests": requests,
+            "error_rate": min(1.0, errors / requests) if requests else 0.0,
+            "p99": hist.percentile(OUTLIER_LATENCY_PERCENTILE) / 1000,
+            "mean": hist.mean() / 1000,
+        }
+        return self.last
+
+class BackendState:
+    """
+    Trạng thái của một backend.
+    Mỗi server có khóa riêng -> request tới các server khác nhau không chặn nhau.
+    Thuật toán đọc trực tiếp thuộc tính (đọc một int/float là nguyên tử),
+    mọi thay đổi đi qua các hàm bên dưới.
+    """
+    __slots__ = (
+        "name", "url", "weight", "pool_size",
+        "active", "health_status", "last_crash_time",
+        "active_conns", "total_handled", "cpu_usage",
+        "avg_response_time", "ewma_response_time",
+        "circuit", "outlier", "ejected", "limiter", "held", "in_rotation", "position", "lock",
+    )
+
+    def __init__(self, name, url, weight, avg_response_time, pool_size=DEFAULT_POOL_SIZE):
+        self.name = name
+        self.url = url
+        self.weight = weight
+        self.pool_size = pool_size
+        self.active = True
+        self.health_status = "healthy"
+        self.last_crash_time = 0
+        self.active_conns = 0
+        self.total_handled = 0
+        self.cpu_usage = 0
+        self.avg_response_time = avg_response_time
+        self.ewma_response_time = avg_response_time
+        self.circuit = CIRCUIT_BREAKER()  # closed/open/half-open, quyết định có nhận traffic không
+        self.outlier = OutlierWindow()  # Số liệu cho outlier detection
+        self.ejected = False        # Đang bị đẩy ra vì chậm / lỗi hơn hẳn các backend khác
+        self.limiter = ConcurrencyLimiter()  # Số request đồng thời tối đa (admission control)
+        self.held = 0               # Request dài hạn (hold > 0) đang bay (đã gồm trong active_conns)
+        self.in_rotation = True     # Có nằm trong tập ứng viên / chỉ mục chọn server không
+        self.position = 0           # Thứ tự trong SERVERS (để hoà điểm giống min/max)
+        self.lock = threading.Lock()
+
+    def acquire(self, hold=0.0):
+        with self.lock:
+            self.active_conns += 1
+            if hold > 0: self.held += 1
+            self.circuit.on_admit()
+            trials_used_up = not self.circuit.allows_traffic()
+        IN_FLIGHT_ACQUIRED.incr()
+        if trials_used_up:
+            update_rotation(self)   # Half-open hết lượt thử: chờ kết quả rồi mới nhận tiếp
+        else:
+            reindex(self)
+
+    def release(self, latency, hold=0.0):
+        """Trả kết nối và cập nhật độ trễ (chỉ khi server khỏe)"""
+        with self.lock:
+            self.active_conns -= 1
+            if hold > 0: self.held -= 1
+            trial_freed = self.circuit.on_release()
+            if self.health_status == 'healthy':
+                # Cập nhật Moving Average (cho Weighted RT)
+                self.avg_response_time = (self.avg_response_time * 0.9) + (latency * 0.1)
+                # Cập nhật Peak EWMA (cho thuật toán mới)
+                if latency > self.ewma_response_time:
+                    self.ewma_response_time = latency
+                else:
+                    self.ewma_response_time = (self.ewma_response_time * (1 - EWMA_DECAY)) + (latency * EWMA_DECAY)
+        IN_FLIGHT_RELEASED.incr()
+        if trial_freed:
+            update_rotation(self)   # Half-open có lại lượt thử
+        else:
+            reindex(self)
+
+    def mark_handled(self, cpu_usage=None):
+        with self.lock:
+            self.total_handled += 1
+            self.health_status = "healthy" # Đánh dấu sống lại
+            if cpu_usage is not None: self.cpu_usage = cpu_usage
+            transition = self.circuit.on_success()
+        reindex(self)
+        on_circuit_transition(self, transition)
+
+    def mark_crashed(self, cpu_usage):
+        with self.lock:
+            self.health_status = "crashed"
+            self.last_crash_time = time.time()
+            self.cpu_usage = cpu_usage
+            transition = self.circuit.on_failure(hard=True)
+        reindex(self)
+        on_circuit_transition(self, transition)
+
+    def mark_failed(self):
+        """Lỗi mềm (timeout, 5xx khác 503): chỉ tính vào tỉ lệ lỗi của circuit breaker"""
+        with self.lock:
+            transition = self.circuit.on_failure()
+        on_circuit_transition(self, transition)
+
+    def record_probe(self, ok):
+        with self.lock:
+            transition = self.circuit.on_probe(ok, BACKEND_RECOVERY_TIME)
+        on_circuit_transition(self, transition)
+
+    def decay_cpu(self, amount):
+        with self.lock:
+            if self.health_status == 'crashed': return
+            self.cpu_usage = max(0, self.cpu_usage - amount)
+        reindex(self)
+
+    def set_active(self, active):
+        # Không reset active_conns: các request đang chạy sẽ tự trả kết nối khi xong
+        with self.lock:
+            self.active = active
+            if not active:
+                self.cpu_usage = 0
+                self.health_status = 'healthy'
+                self.circuit = CIRCUIT_BREAKER()   # Bật lại -> bắt đầu từ closed
+                self.outlier = OutlierWindow()
+                self.ejected = False
+        update_rotation(self)
+
+    def snapshot(self):
+        """Bản sao nhất quán (đọc dưới khóa) để trả về trong /stats"""
+        with self.lock:
+            return {
+                "name": self.name,
+                "url": self.url,
+                "weight": self.weight,
+                "active_conns": self.active_conns,
+                "avg_response_time": self.avg_response_time,
+                "ewma_response_time": self.ewma_response_time,
+                "total_handled": self.total_handled,
+                "active": self.active,
+                "cpu_usage": self.cpu_usage,
+                "health_status": self.health_status,
+                "last_crash_time": self.last_crash_time,
+                "in_rotation": self.in_rotation,
+                "pool_size": self.pool_size,
+                "circuit_state": self.circuit.state,
+                "failure_rate": self.circuit.failure_rate(),
+                "ejected": self.ejected,
+                "concurrency_limit": round(self.limiter.limit, 2),
+            }
+
+SERVERS = [
+    BackendState("Fast (8001)", "http://127.0.0.1:8001", weight=5, avg_response_time=0.1, pool_size=20),
+    BackendState("Medium (8002)", "http://127.0.0.1:8002", weight=3, avg_response_time=0.5, pool_size=20),
+    BackendState("Slow (8003)", "http://127.0.0.1:8003", weight=1, avg_response_time=1.0, pool_size=20),
+]
+TOTAL_REQUESTS = AtomicCounter()
+RR_COUNTER = itertools.count()   # next() trên itertools.count là nguyên tử (GIL)
 
 # --- HÀM HỖ TRỢ CHẠY NGẦM ---
+CPU_DECAY_INTERVAL = 1
+
+def decay_cpu_tick():
+    """Một nhịp giảm CPU ảo (dùng chung cho luồng nền và bộ mô phỏng theo đồng hồ ảo)"""
+    for server in SERVERS:
+        if server.cpu_usage > 0:
+            server.decay_cpu(random.randint(10, 20))
+
 def cpu_decay_loop():
     """Giảm CPU ảo khi server rảnh rỗi (để biểu đồ đẹp hơn)"""
     while True:
-        time.sleep(1)
-        for server in SERVERS:
-            if server.get('health_status') == 'crashed': continue
-            if server['cpu_usage'] > 0:
-                decay_amount = random.randint(10, 20)
-                server['cpu_usage'] = max(0, server['cpu_usage'] - decay_amount)
+        time.sleep(CPU_DECAY_INTERVAL)
+        decay_cpu_tick()
+
+# --- CONNECTION POOL (KEEP-ALIVE) ---
+# Mỗi backend có một Session riêng -> tái sử dụng kết nối TCP thay vì mở mới mỗi request
+BACKEND_SESSIONS = {}
+ASYNC_POOL_STATS = {}   # Bộ đếm pool của engine asyncio (aiohttp tự quản lý kết nối)
+BACKEND_CLOSES = {}     # Số response backend trả kèm "Connection: close" (kết nối không quay lại pool)
+sessions_lock = threading.Lock()
+
+def get_backend_session(server):
+    """Lấy (hoặc tạo) Session có pool kết nối keep-alive cho backend"""
+    session = BACKEND_SESSIONS.get(server.name)
+    if session is not None:
+        return session
+    with sessions_lock:
+        session = BACKEND_SESSIONS.get(server.name)
+        if session is None:
+            pool_size = server.pool_size
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            BACKEND_SESSIONS[server.name] = session
+    return session
+
+def close_backend_session(server):
+    """Đóng pool của backend (khi tắt server hoặc kết nối bị lỗi)"""
+    with sessions_lock:
+        session = BACKEND_SESSIONS.pop(server.name, None)
+    if session is not None:
+        session.close()
+
+def closes_connection(headers):
+    """Backend đóng kết nối sau response này (vd. dev server của Werkzeug luôn gửi Connection: close)"""
+    return headers.get("Connection", "").lower() == "close"
+
+def count_backend_close(server):
+    counter = BACKEND_CLOSES.get(server.name)
+    if counter is None:
+        counter = BACKEND_CLOSES.setdefault(server.name, AtomicCounter())
+    counter.incr()
+
+def get_pool_stats(server):
+    """Thống kê sử dụng pool: số request, số kết nối mở mới, số lần tái sử dụng"""
+    if server.name in ASYNC_POOL_STATS:
+        return dict(ASYNC_POOL_STATS[server.name])
+    stats = {
+        "pool_size": server.pool_size,
+        "requests": 0,
+        "connections_opened": 0,
+        "connections_reused": 0,
+        "connections_closed_by_backend": 0,
+        "idle_connections": 0,
+    }
+    session = BACKEND_SESSIONS.get(server.name)
+    if session is None:
+        return stats
+    try:
+        # Đọc thuộc tính nội bộ của urllib3 (không phải API công khai, có thể đổi giữa các phiên bản)
+        pools = session.get_adapter(server.url).poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None: continue
+            stats["requests"] += pool.num_requests
+            stats["connections_opened"] += pool.num_connections
+            stats["idle_connections"] += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+    except (AttributeError, TypeError):
+        stats["unavailable"] = True   # urllib3 không còn các thuộc tính này -> chỉ báo cấu hình pool
+        return stats
+    # num_connections chỉ đếm đối tượng kết nối urllib3 tạo mới; kết nối bị backend đóng được
+    # mở lại (TCP mới) trên chính đối tượng đó -> mỗi lần đóng là một lần không tái sử dụng
+    closes = BACKEND_CLOSES[server.name].value if server.name in BACKEND_CLOSES else 0
+    stats["connections_closed_by_backend"] = closes
+    stats["connections_reused"] = max(0, stats["requests"] - stats["connections_opened"] - closes)
+    stats["connections_opened"] = stats["requests"] - stats["connections_reused"]
+    return stats
+
+# --- RESPONSE CACHE (LRU + TTL) ---
+class ResponseCache:
+    """Cache phản hồi theo khoá (path + query), TTL từng entry, giới hạn theo byte, loại bỏ LRU"""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()   # key -> (data, size, expires_at), cuối = dùng gần nhất
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                # Hết hạn -> bỏ entry, tính là miss
+                del self.entries[key]
+                self.bytes -= entry[1]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, data, ttl=None):
+        size = len(key) + len(json.dumps(data))
+        if size > self.max_bytes: return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None: self.bytes -= old[1]
+            self.entries[key] = (data, size, expires_at)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, old_size, _) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.bytes > self.max_bytes and self.entries:
+                _, (_, old_size, _) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+RESPONSE_CACHE = ResponseCache(CACHE_MAX_BYTES, CACHE_TTL)
+
+# Request dài hạn (giữ kết nối) không được cache/gộp: mỗi request phải thực sự chiếm backend
+UNCACHEABLE_PARAMS = {"duration"}
+
+def make_cache_key(path, params):
+    """Khoá cache: path + query đã chuẩn hoá (bỏ khoảng trắng, bỏ giá trị rỗng, sắp xếp)"""
+    items = sorted((k.strip(), v.strip()) for k, v in params if v.strip())
+    return path + "?" + "&".join(f"{k}={v}" for k, v in items)
+
+# --- REQUEST COALESCING (SINGLE-FLIGHT) ---
+class InFlightCall:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Gộp các request giống hệt nhau đang chờ backend:
+    request đầu tiên (leader) gọi backend, các request sau chờ và nhận chung kết quả.
+    """
+
+    def __init__(self):
+        self.calls = {}         # key -> InFlightCall (engine Flask)
+        self.tasks = {}         # key -> asyncio.Task (engine asyncio)
+        self.lock = threading.Lock()
+        self.leaders = AtomicCounter()
+        self.coalesced = AtomicCounter()
 
-threading.Thread(target=cpu_decay_loop, daemon=True).start()
+    def do(self, key, fn):
+        """Trả về (kết quả, có phải kết quả dùng chung không)"""
+        with self.lock:
+            call = self.calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = InFlightCall()
+                self.calls[key] = call
+
+        if not is_leader:
+            self.coalesced.incr()
+            call.event.wait()
+            if call.error is not None: raise call.error
+            return call.result, True
+
+        self.leaders.incr()
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result, False
+
+    async def do_async(self, key, coro_fn):
+        """Bản asyncio: lời gọi backend chạy trong Task riêng, client huỷ không làm huỷ lời gọi chung"""
+        import asyncio
+        task = self.tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced.incr()
+        else:
+            self.leaders.incr()
+            task = asyncio.ensure_future(coro_fn())
+            self.tasks[key] = task
+            task.add_done_callback(lambda t: self.tasks.pop(key, None))
+        return await asyncio.shield(task), shared
+
+    def stats(self):
+        return {
+            "leaders": self.leaders.value,
+            "coalesced": self.coalesced.value,
+            "in_flight": len(self.calls) + len(self.tasks),
+        }
+
+SINGLE_FLIGHT = SingleFlight()
+
+# --- HISTOGRAM ĐỘ TRỄ (CỬA SỔ TRƯỢT) ---
+# avg/EWMA không trả lời được "p99 lúc này là bao nhiêu". Mỗi backend + toàn LB có một
+# histogram log-bucket (bộ nhớ cố định, ghi O(1)). Cửa sổ LATENCY_WINDOW giây chia thành
+# LATENCY_SLOTS ô; khi quay vòng, ô cũ nhất bị xoá và dùng lại -> không có list nào phình ra.
+LATENCY_WINDOW = 60
+LATENCY_SLOTS = 6
+LATENCY_DIGITS = 2          # 2 chữ số có nghĩa -> sai số tương đối ≤ 1%
+
+class WindowedHistogram:
+    def __init__(self, window=LATENCY_WINDOW, slots=LATENCY_SLOTS):
+        self.slot_seconds = window / slots
+        self.slots = [LatencyHistogram(significant_digits=LATENCY_DIGITS) for _ in range(slots)]
+        self.epochs = [None] * slots    # Ô i đang giữ dữ liệu của khoảng thời gian nào
+        self.lifetime = LatencyHistogram(significant_digits=LATENCY_DIGITS)  # Tích luỹ (cho /metrics)
+        self.lock = threading.Lock()
+
+    def _current(self, now):
+        epoch = int(now // self.slot_seconds)
+        i = epoch % len(self.slots)
+        if self.epochs[i] != epoch:
+            self.slots[i].reset()
+            self.epochs[i] = epoch
+        return self.slots[i]
+
+    def record(self, latency):
+        """latency tính bằng giây"""
+        with self.lock:
+            self._current(CLOCK()).record(latency * 1000)
+            self.lifetime.record(latency * 1000)
+
+    def merged(self):
+        """Gộp các ô còn nằm trong cửa sổ (chỉ chạy khi đọc /stats/latency)"""
+        epoch = int(CLOCK() // self.slot_seconds)
+        total = LatencyHistogram(significant_digits=LATENCY_DIGITS)
+        with self.lock:
+            for h, e in zip(self.slots, self.epochs):
+                if e is not None and epoch - e < len(self.slots):
+                    total.merge(h)
+        return total
+
+    def summary(self):
+        return self.merged().summary(percentiles=(50, 90, 99, 99.9))
+
+    def prometheus_buckets(self, bounds):
+        """(số đếm tích luỹ theo từng `le` giây, tổng giây, tổng số) từ histogram tích luỹ"""
+        with self.lock:
+            counts = self.lifetime.cumulative_counts([b * 1000 for b in bounds])
+            return counts, self.lifetime.sum / 1e6, self.lifetime.total
+
+LATENCY_ALL = WindowedHistogram()      # Độ trễ end-to-end của LB (kể cả cache hit)
+SERVER_LATENCY = {}                    # server name -> WindowedHistogram (tạo khi cần)
+latency_lock = threading.Lock()
+
+def get_server_histogram(server):
+    hist = SERVER_LATENCY.get(server.name)
+    if hist is None:
+        with latency_lock:
+            hist = SERVER_LATENCY.setdefault(server.name, WindowedHistogram())
+    return hist
+
+# Bộ đếm request theo backend + nhóm mã trạng thái (tạo sẵn -> mỗi request chỉ next())
+STATUS_CLASSES = ("2xx", "3xx", "4xx", "5xx", "error")
+BACKEND_COUNTERS = {}                  # server name -> {nhóm mã: AtomicCounter}
+NO_SERVER_TOTAL = AtomicCounter()      # Request bị từ chối vì không còn backend nào
+
+def get_backend_counters(server):
+    counters = BACKEND_COUNTERS.get(server.name)
+    if counters is None:
+        with latency_lock:
+            counters = BACKEND_COUNTERS.setdefault(
+                server.name, {c: AtomicCounter() for c in STATUS_CLASSES})
+    return counters
+
+def count_backend_status(server, status_code=None):
+    """status_code=None -> lỗi kết nối"""
+    counters = get_backend_counters(server)
+    key = "error" if status_code is None else f"{status_code // 100}xx"
+    counters.get(key, counters["error"]).incr()
+    if status_code is None or status_code >= 500: server.outlier.record_error()
+
+# Thống kê theo thuật toán: nhiều policy chạy xen kẽ trên cùng backend (A/B) vẫn tách được số liệu
+POLICY_LATENCY = {}                    # algorithm -> WindowedHistogram (end-to-end)
+POLICY_COUNTERS = {}                   # algorithm -> {nhóm mã: AtomicCounter}
+
+def get_policy_stats(algorithm):
+    hist = POLICY_LATENCY.get(algorithm)
+    if hist is None:
+        with latency_lock:
+            hist = POLICY_LATENCY.setdefault(algorithm, WindowedHistogram())
+            POLICY_COUNTERS.setdefault(algorithm, {c: AtomicCounter() for c in STATUS_CLASSES})
+    return hist, POLICY_COUNTERS[algorithm]
+
+def record_policy(algorithm, status_code, latency):
+    if algorithm not in STRATEGIES: return   # Tên lạ (bị từ chối 400) không tạo series mới
+    hist, counters = get_policy_stats(algorithm)
+    hist.record(latency)
+    counters.get(f"{status_code // 100}xx", counters["error"]).incr()
+
+def build_latency_stats():
+    return {
+        "unit": "ms",
+        "window_seconds": LATENCY_WINDOW,
+        "global": LATENCY_ALL.summary(),
+        "servers": {s.name: get_server_histogram(s).summary() for s in SERVERS},
+        "policies": {a: h.summary() for a, h in list(POLICY_LATENCY.items())},
+    }
 
 # --- HÀM LỌC SERVER (CIRCUIT BREAKER) ---
+# Tập ứng viên chỉ đổi khi: circuit breaker chuyển trạng thái / hết lượt thử, hoặc /toggle_server.
+# -> Chỉ tính lại tại các sự kiện đó, không quét SERVERS trên mỗi request.
+CANDIDATES = ()
+candidates_lock = threading.Lock()
+
+def timer_scheduler(delay, callback):
+    timer = threading.Timer(delay, callback)
+    timer.daemon = True
+    timer.start()
+
+RECOVERY_SCHEDULER = timer_scheduler  # Hàm lập lịch hồi phục: (delay, callback)
+CLOCK = time.monotonic                # Đồng hồ cho cửa sổ histogram / deadline hedge / hạn ejection (mô phỏng thay bằng giờ ảo)
+
+# Lịch sử chuyển trạng thái circuit breaker (trả về trong /stats)
+CIRCUIT_EVENTS = deque(maxlen=CB_EVENTS_KEPT)
+CIRCUIT_TRANSITIONS_TOTAL = AtomicCounter()
+
 def get_available_servers():
     """
     Trả về danh sách server:
     1. Đang bật (active=True)
     2. KHÔNG bị crash (hoặc đã hết thời gian phạt)
     """
-    candidates = []
-    current_time = time.time()
-    for s in SERVERS:
-        if not s['active']: continue 
-        
-        # Logic Circuit Breaker: Kiểm tra server chết
-        if s.get('health_status') == 'crashed':
-            time_since_crash = current_time - s.get('last_crash_time', 0)
-            if time_since_crash < BACKEND_RECOVERY_TIME: 
-                continue # Vẫn đang trong thời gian cách ly -> Bỏ qua
-        
-        candidates.append(s)
-    return candidates
+    return CANDIDATES
+
+def is_routable(server):
+    return server.active and not server.ejected and server.circuit.allows_traffic()
+
+def rebuild_candidates():
+    global CANDIDATES
+    with candidates_lock:
+        CANDIDATES = tuple(s for s in SERVERS if s.in_rotation)
+
+def update_rotation(server):
+    """Đưa server vào/ra rotation khi bật/tắt, crash hoặc hết cách ly"""
+    in_rotation = is_routable(server)
+    changed = in_rotation != server.in_rotation
+    server.in_rotation = in_rotation
+    reindex(server)
+    if changed:
+        rebuild_candidates()
+
+def on_circuit_transition(server, transition):
+    """Ghi lại lần chuyển trạng thái, cập nhật rotation, hẹn giờ half-open nếu không có probe"""
+    if transition is None: return
+    old, new, reason, token = transition
+    CIRCUIT_EVENTS.append({"time": time.time(), "server": server.name, "from": old, "to": new, "reason": reason})
+    CIRCUIT_TRANSITIONS_TOTAL.incr()
+    update_rotation(server)
+    if new == OPEN and not HEALTH_CHECKS_RUNNING:
+        RECOVERY_SCHEDULER(BACKEND_RECOVERY_TIME, lambda: end_open(server, token))
+
+def end_open(server, token):
+    """Timer hết BACKEND_RECOVERY_TIME -> half-open, cho vài request thử quay lại"""
+    with server.lock:
+        # Server đã chuyển trạng thái sau đó -> timer mới hơn (hoặc probe) sẽ xử lý
+        transition = server.circuit.on_open_timeout(token)
+    on_circuit_transition(server, transition)
+
+# --- HEALTH CHECK CHỦ ĐỘNG ---
+# Một pool probe riêng (session + thread riêng, không dùng chung pool kết nối của request thật)
+# gọi /health của từng backend theo chu kỳ: server chết bị phát hiện mà không tốn request của
+# người dùng, và server đang open chỉ được thử lại (half-open) khi probe đã thành công.
+HEALTH_CHECK_PATH = "/health"
+HEALTH_CHECK_INTERVAL = 2.0 # Giây giữa hai vòng probe
+HEALTH_CHECK_TIMEOUT = 1.0  # Probe chậm hơn mức này = lỗi
+HEALTH_CHECK_WORKERS = 4    # Số thread probe song song
+HEALTH_CHECKS_RUNNING = False
+
+def probe_server(session, server):
+    try:
+        resp = session.get(server.url + HEALTH_CHECK_PATH, timeout=HEALTH_CHECK_TIMEOUT)
+        ok = resp.status_code == 200
+    except Exception:
+        ok = False
+    server.record_probe(ok)
+
+def health_check_loop():
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=HEALTH_CHECK_WORKERS, pool_maxsize=HEALTH_CHECK_WORKERS))
+    with ThreadPoolExecutor(max_workers=HEALTH_CHECK_WORKERS, thread_name_prefix="probe") as pool:
+        while True:
+            started = time.time()
+            list(pool.map(lambda s: probe_server(session, s), [s for s in SERVERS if s.active]))
+            time.sleep(max(0.0, HEALTH_CHECK_INTERVAL - (time.time() - started)))
+
+def start_health_checks():
+    global HEALTH_CHECKS_RUNNING
+    HEALTH_CHECKS_RUNNING = True
+    threading.Thread(target=health_check_loop, daemon=True).start()
+
+# --- OUTLIER EJECTION ---
+# Circuit breaker chỉ phản ứng với lỗi cứng; backend "còn sống nhưng chậm bất thường"
+# (micro-freeze / spike dồn dập) vẫn nhận traffic. Mỗi OUTLIER_INTERVAL giây so sánh p99 và
+# tỉ lệ lỗi của từng backend với trung vị của các backend còn lại trong cùng khoảng:
+# backend lệch hẳn bị đẩy ra khỏi rotation một thời gian (back-off luỹ thừa nếu tái phạm),
+# nhưng không bao giờ quá OUTLIER_MAX_EJECTION_PERCENT số backend cùng lúc.
+OUTLIER_EVENTS = deque(maxlen=OUTLIER_EVENTS_KEPT)
+OUTLIER_EJECTIONS_TOTAL = AtomicCounter()
+OUTLIER_SKIPPED_TOTAL = AtomicCounter()   # Outlier không bị đẩy ra vì đã chạm trần %
+
+def outlier_event(server, action, reason, duration=None):
+    event = {"time": time.time(), "server": server.name, "action": action, "reason": reason}
+    if duration is not None: event["duration"] = duration
+    OUTLIER_EVENTS.append(event)
+
+def outlier_reason(stats, peers):
+    """Lý do backend là outlier so với các backend còn lại (None = bình thường)"""
+    error_rate = stats["error_rate"]
+    peer_errors = statistics.median(p["error_rate"] for p in peers)
+    if error_rate - peer_errors >= OUTLIER_ERROR_MARGIN:
+        return f"error rate {error_rate:.0%} vs peers {peer_errors:.0%}"
+    p99 = stats["p99"]
+    peer_p99 = statistics.median(p["p99"] for p in peers)
+    if p99 > peer_p99 * OUTLIER_LATENCY_FACTOR and p99 - peer_p99 >= OUTLIER_LATENCY_MIN_GAP:
+        return f"p{OUTLIER_LATENCY_PERCENTILE} {p99 * 1000:.0f}ms vs peers {peer_p99 * 1000:.0f}ms"
+    mean = stats["mean"]
+    peer_mean = statistics.median(p["mean"] for p in peers)
+    if mean > peer_mean * OUTLIER_MEAN_FACTOR and mean - peer_mean >= OUTLIER_LATENCY_MIN_GAP:
+        return f"mean {mean * 1000:.0f}ms vs peers {peer_mean * 1000:.0f}ms"
+    return None
+
+def eject_server(server, now, reason):
+    window = server.outlier
+    duration = min(OUTLIER_MAX_EJECTION, OUTLIER_BASE_EJECTION * 2 ** window.multiplier)
+    window.ejected_until = now + duration
+    window.multiplier += 1
+    window.ejections += 1
+    server.ejected = True
+    OUTLIER_EJECTIONS_TOTAL.incr()
+    outlier_event(server, "eject", reason, duration)
+    update_rotation(server)
+
+def uneject_server(server):
+    server.ejected = False
+    outlier_event(server, "return", "ejection time elapsed")
+    update_rotation(server)
+
+def detect_outliers():
+    """Một lượt quét (luồng nền gọi mỗi OUTLIER_INTERVAL giây, bộ mô phỏng gọi theo giờ ảo)"""
+    now = CLOCK()
+    servers = list(SERVERS)
+
+    # 1. Hết hạn -> quay lại rotation; khoảng không bị đẩy ra -> giảm dần hệ số back-off
+    for s in servers:
+        if s.ejected:
+            if now >= s.outlier.ejected_until: uneject_server(s)
+        elif s.outlier.multiplier > 0:
+            s.outlier.multiplier -= 1
+
+    # 2. Chốt số liệu của khoảng vừa qua (luôn chốt, kể cả khi tắt, để khoảng sau bắt đầu sạch)
+    stats = {s: s.outlier.collect() for s in servers}
+    if not OUTLIER_DETECTION_ENABLED: return
+    eligible = [s for s in servers
+                if s.active and not s.ejected and stats[s]["requests"] >= OUTLIER_MIN_REQUESTS]
+    if len(eligible) < 2: return
+
+    # 3. So với trung vị các backend còn lại; tệ nhất bị xét trước khi chạm trần
+    max_ejected = max(1, int(len(servers) * OUTLIER_MAX_EJECTION_PERCENT / 100))
+    ejected = sum(1 for s in servers if s.ejected)
+    for s in sorted(eligible, key=lambda s: (stats[s]["error_rate"], stats[s]["mean"]), reverse=True):
+        reason = outlier_reason(stats[s], [stats[p] for p in eligible if p is not s])
+        if reason is None: continue
+        if ejected >= max_ejected:
+            OUTLIER_SKIPPED_TOTAL.incr()
+            outlier_event(s, "skip", f"{reason} (max ejection {OUTLIER_MAX_EJECTION_PERCENT}% reached)")
+            continue
+        eject_server(s, now, reason)
+        ejected += 1
+
+def outlier_detection_loop():
+    while True:
+        time.sleep(OUTLIER_INTERVAL)
+        detect_outliers()
+
+def build_outlier_stats():
+    now = CLOCK()
+    return {
+        "enabled": OUTLIER_DETECTION_ENABLED,
+        "interval": OUTLIER_INTERVAL,
+        "max_ejection_percent": OUTLIER_MAX_EJECTION_PERCENT,
+        "ejections_total": OUTLIER_EJECTIONS_TOTAL.value,
+        "skipped_total": OUTLIER_SKIPPED_TOTAL.value,
+        "servers": {
+            s.name: {
+                "ejected": s.ejected,
+                "ejected_for": round(max(0.0, s.outlier.ejected_until - now), 1) if s.ejected else 0.0,
+                "ejections": s.outlier.ejections,
+                "backoff_multiplier": s.outlier.multiplier,
+                "last_interval": s.outlier.last,
+            }
+            for s in SERVERS
+        },
+        "events": list(OUTLIER_EVENTS),
+    }
 
 def calculate_current_cost():
-    return sum(SERVER_PRICES[s['name']] for s in SERVERS if s['active'])
+    return sum(SERVER_PRICES.get(s.name, 0) for s in SERVERS if s.active)
+
+# ============================================================
+# --- VÒNG BĂM NHẤT QUÁN (CONSISTENT HASHING, O(log n)) ---
+# ============================================================
+# Mỗi backend đặt HASH_VNODES điểm ảo trên vòng băm 64-bit; request có khoá K đi tới điểm
+# đầu tiên theo chiều kim đồng hồ từ hash(K) (bisect). Vòng chứa MỌI server trong SERVERS:
+# server ra khỏi rotation (crash, /toggle_server, ejected) không bị xoá khỏi vòng mà bị
+# bỏ qua khi tra (giống lazy deletion của ScoreIndex) -> chỉ khoá của server đó chuyển sang
+# server kế tiếp, các khoá khác giữ nguyên backend (cache của backend vẫn trúng).
+HASH_VNODES = 100           # Số điểm ảo mỗi backend (nhiều hơn -> chia khoá đều hơn)
+HASH_LOAD_FACTOR = 1.25     # Bounded load: mỗi backend nhận tối đa ceil(1.25 * trung bình) request đồng thời
+HASH_KEY_HEADER = "X-LB-Hash-Key"   # Khoá băm do client chỉ định (mặc định: path + query đã chuẩn hoá)
+
+def hash_point(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Vòng băm các điểm ảo (điểm, server); tra cứu bằng bisect trên danh sách đã sắp xếp"""
+
+    def __init__(self, vnodes=HASH_VNODES):
+        self.vnodes = vnodes
+        self.ring = ((), ())   # (điểm đã sắp xếp, server sở hữu) - thay cả cặp khi rebuild
+
+    def rebuild(self, servers):
+        entries = sorted((hash_point(f"{s.name}#{i}"), s.position, s) for s in servers for i in range(self.vnodes))
+        self.ring = (tuple(p for p, _, _ in entries), tuple(s for _, _, s in entries))
+
+    def walk(self, key):
+        """Các server theo chiều kim đồng hồ kể từ hash(key) (mỗi server có thể lặp lại)"""
+        points, owners = self.ring
+        if not points: return
+        start = bisect.bisect(points, hash_point(key))
+        n = len(owners)
+        for i in range(n):
+            yield owners[(start + i) % n]
+
+    def lookup(self, key):
+        """Server đầu tiên còn trong rotation"""
+        for server in self.walk(key):
+            if server.in_rotation:
+                return server
+        return None
+
+HASH_RING = HashRing()
+HASH_SPILLS = AtomicCounter()   # Request bounded-load phải chuyển sang backend sau vì backend đầu đầy
+# Tổng request đang bay = acquired - released (hai bộ đếm không khóa, đọc khi chọn server)
+IN_FLIGHT_ACQUIRED = AtomicCounter()
+IN_FLIGHT_RELEASED = AtomicCounter()
+
+def random_hash_key():
+    # Request không có khoá (chọn backend cho hedge/retry, selection_benchmark) -> điểm ngẫu nhiên
+    return str(random.getrandbits(64))
+
+def hash_load_cap():
+    """Số request đồng thời tối đa mỗi backend: ceil(c * (đang bay + 1) / số ứng viên)"""
+    candidates = get_available_servers()
+    if not candidates: return 0
+    in_flight = max(0, IN_FLIGHT_ACQUIRED.value - IN_FLIGHT_RELEASED.value)
+    return math.ceil(HASH_LOAD_FACTOR * (in_flight + 1) / len(candidates))
+
+def build_hashing_stats():
+    return {
+        "vnodes": HASH_RING.vnodes,
+        "ring_points": len(HASH_RING.ring[0]),
+        "load_factor": HASH_LOAD_FACTOR,
+        "load_cap": hash_load_cap(),
+        "key_header": HASH_KEY_HEADER,
+        "spills": HASH_SPILLS.value,
+    }
+
+# ============================================================
+# --- CHỈ MỤC ƯU TIÊN CHO THUẬT TOÁN DỰA TRÊN ĐIỂM (O(log n)) ---
+# ============================================================
+# Thay vì quét min/max toàn bộ danh sách mỗi request, mỗi thuật toán giữ một heap
+# được cập nhật khi active_conns / EWMA / CPU thay đổi hoặc khi server sống/chết.
+# Entry cũ không bị xoá ngay (lazy deletion) mà bị bỏ qua khi lên đỉnh heap.
+
+# Công thức điểm của từng thuật toán
+def least_connection_score(s):
+    return s.active_conns
+
+def weighted_rt_score(s):
+    if s.avg_response_time == 0: return 9999
+    return s.weight / s.avg_response_time
+
+def ewma_score(s):
+    # Score = (Kết nối đang xử lý + 1) * Độ trễ EWMA
+    val = s.ewma_response_time
+    if val == 0: val = 0.1
+    return (s.active_conns + 1) * val
+
+def resource_score(s):
+    # Công thức: (CPU * 0.7) + (Connections * 0.3)
+    cpu_score = s.cpu_usage 
+    conn_score = s.active_conns * 5 # Quy đổi 1 conn ~ 5 điểm
+    return (cpu_score * 0.7) + (conn_score * 0.3)
+
+class ScoreIndex:
+    """Heap (điểm, vị trí) của các server đang trong rotation"""
+
+    def __init__(self, score_fn, maximize=False):
+        self.score_fn = score_fn
+        self.sign = -1 if maximize else 1
+        self.heap = []
+        self.versions = {}   # server -> version của entry hợp lệ
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+
+    def update(self, server):
+        with self.lock:
+            if not server.in_rotation:
+                self.versions.pop(server, None)
+                return
+            # Tính điểm trong khóa -> entry mới nhất luôn phản ánh trạng thái mới nhất
+            version = next(self.seq)
+            self.versions[server] = version
+            heapq.heappush(self.heap, (self.sign * self.score_fn(server), server.position, version, server))
+            if len(self.heap) > 4 * len(self.versions) + 64:
+                self._compact()
+
+    def best(self):
+        with self.lock:
+            heap = self.heap
+            while heap:
+                _, _, version, server = heap[0]
+                if self.versions.get(server) == version:
+                    return server
+                heapq.heappop(heap)
+            return None
+
+    def _compact(self):
+        self.heap = [entry for entry in self.heap if self.versions.get(entry[3]) == entry[2]]
+        heapq.heapify(self.heap)
+
+    def rebuild(self, servers):
+        with self.lock:
+            self.heap = []
+            self.versions = {}
+        for s in servers:
+            self.update(s)
+
+LEAST_CONN_INDEX = ScoreIndex(least_connection_score)
+WEIGHTED_RT_INDEX = ScoreIndex(weighted_rt_score, maximize=True)
+PEAK_EWMA_INDEX = ScoreIndex(ewma_score)
+ADAPTIVE_INDEX = ScoreIndex(resource_score)
+SCORE_INDEXES = (LEAST_CONN_INDEX, WEIGHTED_RT_INDEX, PEAK_EWMA_INDEX, ADAPTIVE_INDEX)
+
+def reindex(server):
+    for index in SCORE_INDEXES:
+        index.update(server)
+
+def reset_servers(servers):
+    """Thay toàn bộ danh sách backend (dùng cho benchmark/mô phỏng nhiều server)"""
+    SERVERS[:] = servers
+    for pos, s in enumerate(SERVERS):
+        s.position = pos
+        s.in_rotation = is_routable(s)
+    for index in SCORE_INDEXES:
+        index.rebuild(SERVERS)
+    HASH_RING.rebuild(SERVERS)
+    rebuild_candidates()
+
+reset_servers(list(SERVERS))
+
+def offset_backend_ports(offset):
+    """Dời cổng của mọi backend (nhiều stack LB + backend chạy song song trên một máy)"""
+    servers = []
+    for s in SERVERS:
+        host, port = s.url.rsplit(":", 1)
+        servers.append(BackendState(s.name, f"{host}:{int(port) + offset}", weight=s.weight,
+                                    avg_response_time=s.avg_response_time, pool_size=s.pool_size))
+    reset_servers(servers)
 
 # ============================================================
-# --- 6 THUẬT TOÁN CÂN BẰNG TẢI ---
+# --- 8 THUẬT TOÁN CÂN BẰNG TẢI ---
 # ============================================================
 
 # 1. Round Robin (Cũ) - Chia đều vòng tròn
 def get_server_round_robin():
-    global current_index
     candidates = get_available_servers()
     if not candidates: return None
-    server = candidates[current_index % len(candidates)]
-    current_index += 1
-    return server
+    return candidates[next(RR_COUNTER) % len(candidates)]
 
 # 2. Least Connection (Cũ) - Chọn ai đang ít việc nhất
 def get_server_least_connection():
-    candidates = get_available_servers()
-    if not candidates: return None
-    return min(candidates, key=lambda s: s["active_conns"])
+    return LEAST_CONN_INDEX.best()
 
 # 3. Weighted Response Time (Cũ) - Dựa trên độ trễ trung bình và trọng số
 def get_server_weighted_response_time():
-    candidates = get_available_servers()
-    if not candidates: return None
-    def calculate_score(server):
-        if server["avg_response_time"] == 0: return 9999
-        return server["weight"] / server["avg_response_time"]
-    return max(candidates, key=calculate_score)
+    return WEIGHTED_RT_INDEX.best()
 
 # 4. Peak EWMA (Mới) - Nhạy cảm với độ trễ tăng đột biến
 def get_server_peak_ewma():
-    candidates = get_available_servers()
-    if not candidates: return None
-    def ewma_score(s):
-        # Score = (Kết nối đang xử lý + 1) * Độ trễ EWMA
-        val = s.get('ewma_response_time', 0.1)
-        if val == 0: val = 0.1
-        return (s['active_conns'] + 1) * val
-    return min(candidates, key=ewma_score)
+    return PEAK_EWMA_INDEX.best()
 
 # 5. Power of Two Choices (Mới) - Chọn ngẫu nhiên 2, lấy 1 tốt hơn
 def get_server_p2c():
@@ -111,148 +1167,979 @@ def get_server_p2c():
     # Chọn ngẫu nhiên 2 ứng viên
     c1, c2 = random.sample(candidates, 2)
     # So sánh dựa trên số kết nối (tránh hiệu ứng đám đông)
-    return c1 if c1['active_conns'] < c2['active_conns'] else c2
+    return c1 if c1.active_conns < c2.active_conns else c2
 
 # 6. Adaptive Resource Awareness (Mới) - Dựa trên CPU thực tế
 def get_server_adaptive():
-    candidates = get_available_servers()
-    if not candidates: return None
-    def resource_score(s):
-        # Công thức: (CPU * 0.7) + (Connections * 0.3)
-        cpu_score = s['cpu_usage'] 
-        conn_score = s['active_conns'] * 5 # Quy đổi 1 conn ~ 5 điểm
-        return (cpu_score * 0.7) + (conn_score * 0.3)
-    return min(candidates, key=resource_score)
-
-# --- ROUTER CHÍNH ---
-@app.route('/')
-def router():
-    global TOTAL_REQUESTS, CACHE_HITS
-    TOTAL_REQUESTS += 1
-    request_key = "simulation_data" 
-    
-    # --- 1. XỬ LÝ CACHE ---
-    if request_key in RESPONSE_CACHE:
-        if random.random() < CACHE_PROBABILITY:
-            CACHE_HITS += 1
-            cached_data = RESPONSE_CACHE[request_key].copy()
-            cached_data["status"] = "served_from_cache_lucky" 
-            cached_data["cpu_usage"] = 0 
-            return jsonify(cached_data)
+    return ADAPTIVE_INDEX.best()
+
+# 7. Consistent Hashing (Mới) - Cùng khoá luôn về cùng backend (cache affinity)
+def get_server_consistent_hash(key=None):
+    if not get_available_servers(): return None
+    return HASH_RING.lookup(key if key is not None else random_hash_key())
+
+# 8. Consistent Hashing with Bounded Loads (Mới) - Như trên, backend đầy thì sang backend kế tiếp
+def get_server_bounded_hash(key=None):
+    if not get_available_servers(): return None
+    cap = hash_load_cap()
+    first = None
+    for server in HASH_RING.walk(key if key is not None else random_hash_key()):
+        if not server.in_rotation: continue
+        if first is None: first = server
+        if server.active_conns < cap:
+            if server is not first: HASH_SPILLS.incr()
+            return server
+    return first   # Đang cập nhật dở (mọi backend đều đầy) -> backend của khoá
+
+# --- LÕI XỬ LÝ REQUEST (dùng chung cho engine Flask và asyncio) ---
+ENGINE = 'flask'
+UPSTREAM_TIMEOUT = 30
+
+# Bảng chiến lược: tên thuật toán -> hàm chọn server (thêm thuật toán = thêm một dòng)
+STRATEGIES = {
+    'round_robin': get_server_round_robin,
+    'least_connection': get_server_least_connection,
+    'weighted_response_time': get_server_weighted_response_time,
+    'peak_ewma': get_server_peak_ewma,
+    'p2c': get_server_p2c,
+    'adaptive': get_server_adaptive,
+    'consistent_hash': get_server_consistent_hash,
+    'bounded_load_hash': get_server_bounded_hash,
+}
+KEYED_STRATEGIES = {'consistent_hash', 'bounded_load_hash'}   # Nhận khoá băm của request
+DEFAULT_ALGORITHM = 'round_robin'   # Fallback an toàn khi /config đặt tên không tồn tại
+
+# Chọn thuật toán theo từng request (ưu tiên query param, rồi header, cuối cùng là /config)
+# -> nhiều thí nghiệm chạy đồng thời trên cùng backend, không phải đổi cấu hình toàn cục
+ALGORITHM_HEADER = "X-LB-Algorithm"
+ALGORITHM_PARAM = "lb_algorithm"
+
+def resolve_algorithm(header, params):
+    """
+    Trả về (thuật toán, params đã bỏ lb_algorithm, hợp lệ?).
+    Tên chỉ định trong request mà không có trong STRATEGIES -> không hợp lệ (400).
+    """
+    requested = header
+    if any(k == ALGORITHM_PARAM for k, _ in params):
+        requested = next(v for k, v in params if k == ALGORITHM_PARAM)
+        params = [(k, v) for k, v in params if k != ALGORITHM_PARAM]
+    if requested:
+        requested = requested.strip()
+        return requested, params, requested in STRATEGIES
+    algorithm = CURRENT_ALGORITHM if CURRENT_ALGORITHM in STRATEGIES else DEFAULT_ALGORITHM
+    return algorithm, params, True
+
+def select_server(algorithm=None, key=None):
+    """Chọn backend theo thuật toán của request (mặc định: thuật toán đang cấu hình)"""
+    name = algorithm or CURRENT_ALGORITHM
+    strategy = STRATEGIES.get(name)
+    if strategy is None:
+        return STRATEGIES[DEFAULT_ALGORITHM]()
+    if name in KEYED_STRATEGIES:
+        return strategy(key)
+    return strategy()
+
+def request_hash_key(algorithm, header, path, params):
+    """Khoá băm cho thuật toán consistent hashing: header X-LB-Hash-Key, không có thì path + query"""
+    if algorithm not in KEYED_STRATEGIES:
+        return None
+    return header if header else make_cache_key(path, params)
+
+def unknown_algorithm_response(algorithm):
+    # Request bị từ chối vẫn vào LATENCY_ALL (khối finally của router) -> đếm cả ở đây
+    # để số request trong /stats khớp với số mẫu của percentile
+    TOTAL_REQUESTS.incr()
+    return {"error": f"Unknown algorithm: {algorithm}", "algorithms": list(STRATEGIES)}, 400
+
+def check_cache(path, params, algorithm):
+    """
+    Đếm request và tra cache.
+    Trả về (dữ liệu cache nếu trúng, khoá cache nếu request cacheable - None khi cache tắt).
+    Khoá (dùng cho cả cache lẫn single-flight) gồm thuật toán của request: request của
+    policy A không được trả bằng phản hồi mà policy B đã chọn backend (A/B xen kẽ).
+    """
+    TOTAL_REQUESTS.incr()
+    if not CACHE_ENABLED or any(k in UNCACHEABLE_PARAMS for k, _ in params):
+        return None, None
+    cache_key = f"{algorithm} {make_cache_key(path, params)}"
+    data = RESPONSE_CACHE.get(cache_key)
+    if data is None:
+        return None, cache_key
+    cached_data = dict(data)
+    cached_data["status"] = "served_from_cache" 
+    cached_data["cpu_usage"] = 0 
+    return cached_data, cache_key
+
+def no_server_response():
+    NO_SERVER_TOTAL.incr()
+    return {
+        "error": "System Overload! All servers are down.", 
+        "status": "system_failure"
+    }, 503
+
+def handle_backend_response(target, status_code, data, cache_key=None):
+    """Cập nhật trạng thái backend theo phản hồi, trả về (body, status)"""
+    count_backend_status(target, status_code)
+    if status_code == 200:
+        cpu_usage = data.get("cpu_usage")
+        target.mark_handled(cpu_usage)
+        if cpu_usage is not None and cpu_usage >= ADMISSION_CPU_HIGH: target.limiter.on_overload()
+        if cache_key is not None: RESPONSE_CACHE.put(cache_key, data)
+        return data, 200
+
+    elif status_code == 503:
+        # Server báo crash chủ động
+        target.mark_crashed(cpu_usage=100)
+        target.limiter.on_overload()
+        return data, 503
+
+    # Các lỗi khác (404, 500...): 5xx tính vào tỉ lệ lỗi của circuit breaker,
+    # 4xx là lỗi của request chứ không phải backend -> tính là thành công
+    if status_code >= 500: target.mark_failed()
+    else: target.mark_handled()
+    return data, status_code
+
+def handle_backend_error(target, error):
+    """
+    Từ chối kết nối -> CRASH ngay, trả 502 (được retry sang backend khác);
+    timeout -> lỗi mềm (chậm chưa chắc đã chết, probe sẽ xác nhận), trả 504 (không retry).
+    Chỉ lỗi ở tầng kết nối mới bỏ pool keep-alive: timeout đọc trên backend chậm không làm hỏng
+    các kết nối còn lại.
+    """
+    print(f"⚠️ {target.name} died unexpectedly: {error}")
+    count_backend_status(target)
+    if isinstance(error, (TimeoutError, requests.exceptions.Timeout)):
+        target.mark_failed()
+        target.limiter.on_overload()
+        return {"error": "Upstream timeout"}, 504
+    if isinstance(error, (ConnectionError, requests.exceptions.ConnectionError)):
+        close_backend_session(target) # Bỏ các kết nối keep-alive đã hỏng
+    target.mark_crashed(cpu_usage=0)
+    return {"error": "Connection failed"}, 502
+
+def release_server(target, latency, hold=0.0):
+    """Giải phóng kết nối và cập nhật thống kê độ trễ (hold: thời gian giữ kết nối request tự yêu cầu)"""
+    target.release(latency, hold)
+    get_server_histogram(target).record(latency)
+    target.outlier.record_latency(max(0.0, latency - hold))
+    target.limiter.on_sample(max(0.0, latency - hold))
+    ADMISSION_QUEUE.wake_one()   # Vừa trả một chỗ -> request chờ lâu nhất thử lại
+    if HEDGING_ENABLED: get_hedge_histogram(target).record(max(0.0, latency - hold))
+
+# --- RETRY & HEDGED REQUESTS (CẮT ĐUÔI ĐỘ TRỄ) ---
+# Hedging: backend đầu tiên chưa trả lời sau deadline (= percentile độ trễ gần đây của chính nó)
+# -> gửi bản sao tới backend thứ hai do thuật toán của request chọn; phản hồi 200 nào về trước thắng.
+# Retry: 503 (backend báo crash) / 502 (lỗi kết nối) -> thử lại trên backend khác.
+# Hedge và retry tiêu chung một ngân sách token: khi cả cụm chậm hoặc sập, lượng request
+# nhân bản bị chặn quanh RETRY_BUDGET_RATIO, không tự khuếch đại tải (retry storm).
+HEDGING_ENABLED = False     # Bật qua /config {"hedging": true} hoặc --hedge
+HEDGE_PERCENTILE = 75       # Deadline = percentile này của thời gian xử lý gần đây của backend.
+                            # Phải thấp hơn 100 - tỉ lệ request chậm: backend ở đây spike/freeze
+                            # 20-30% request, nên p95 rơi đúng vào spike và hedge không cắt được gì
+HEDGE_MIN_DELAY = 0.01      # Deadline tối thiểu (giây)
+HEDGE_DEFAULT_DELAY = 1.0   # Deadline khi backend chưa đủ mẫu
+HEDGE_MIN_SAMPLES = 20      # Cần ít nhất chừng này mẫu mới tin percentile
+HEDGE_REFRESH = 1.0         # Giây giữa hai lần tính lại deadline (gộp histogram không rẻ)
+HEDGE_WORKERS = 256         # Thread chạy các lượt gọi backend khi bật hedging (engine Flask)
+MAX_RETRIES = 1             # Số lần thử lại tối đa mỗi request
+RETRY_BUDGET_RATIO = 0.3    # Mỗi request nạp 0.3 token, mỗi retry/hedge tiêu 1 token
+RETRY_BUDGET_BURST = 10     # Số token tích trữ tối đa
+RETRYABLE_STATUS = (502, 503)
+
+class RetryBudget:
+    """Token bucket theo số request (không theo thời gian) -> tỉ lệ nhân bản ≤ ratio khi tải kéo dài"""
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, burst=RETRY_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = float(burst)
+        self.spent = AtomicCounter()
+        self.exhausted = AtomicCounter()
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self.lock:
+            ok = self.tokens >= 1
+            if ok: self.tokens -= 1
+        (self.spent if ok else self.exhausted).incr()
+        return ok
+
+    def stats(self):
+        return {
+            "ratio": self.ratio,
+            "tokens": round(self.tokens, 2),
+            "spent": self.spent.value,
+            "exhausted": self.exhausted.value,
+        }
+
+RETRY_BUDGET = RetryBudget()
+HEDGE_DELAYS = {}                      # server name -> (hết hạn lúc, deadline giây)
+HEDGE_LATENCY = {}                     # server name -> WindowedHistogram (độ trễ trừ thời gian hold)
+HEDGE_POOL = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+# Bộ đếm theo backend: hedge gửi tới nó / hedge của nó thắng / retry gửi tới nó
+RESILIENCE_KINDS = ("hedges", "hedge_wins", "retries")
+RESILIENCE_COUNTERS = {}               # server name -> {loại: AtomicCounter}
+
+def get_resilience_counters(server):
+    counters = RESILIENCE_COUNTERS.get(server.name)
+    if counters is None:
+        with latency_lock:
+            counters = RESILIENCE_COUNTERS.setdefault(
+                server.name, {k: AtomicCounter() for k in RESILIENCE_KINDS})
+    return counters
+
+def get_hedge_histogram(server):
+    hist = HEDGE_LATENCY.get(server.name)
+    if hist is None:
+        with latency_lock:
+            hist = HEDGE_LATENCY.setdefault(server.name, WindowedHistogram())
+    return hist
+
+def request_hold(params):
+    """Thời gian giữ kết nối mà request tự yêu cầu (?duration=...), không tính là chậm"""
+    for k, v in params:
+        if k == "duration":
+            try:
+                return max(0.0, float(v))
+            except ValueError:
+                return 0.0
+    return 0.0
+
+def hedge_delay(target, hold=0.0):
+    """Deadline hedge của backend: percentile thời gian xử lý gần đây (+ hold của request), tính lại mỗi HEDGE_REFRESH giây"""
+    now = CLOCK()
+    cached = HEDGE_DELAYS.get(target.name)
+    if cached is None or cached[0] <= now:
+        hist = get_hedge_histogram(target).merged()
+        if hist.total >= HEDGE_MIN_SAMPLES:
+            delay = max(HEDGE_MIN_DELAY, hist.percentile(HEDGE_PERCENTILE) / 1000)
+        else:
+            delay = HEDGE_DEFAULT_DELAY
+        cached = HEDGE_DELAYS[target.name] = (now + HEDGE_REFRESH, delay)
+    return cached[1] + hold
+
+def extra_backend(algorithm, tried, kind):
+    """
+    Backend cho một lượt gọi thêm (hedge/retry), khác mọi backend trong `tried`.
+    Hỏi lại thuật toán của request; nó vẫn chọn trùng -> lấy ngẫu nhiên trong các ứng viên còn lại.
+    None khi hết ứng viên hoặc hết ngân sách.
+    """
+    server = select_server(algorithm)
+    if server is None:
+        return None
+    if server in tried or (ADMISSION_ENABLED and not has_capacity(server)):
+        others = [s for s in get_available_servers()
+                  if s not in tried and (not ADMISSION_ENABLED or has_capacity(s))]
+        if not others:
+            return None
+        server = random.choice(others)
+    if not RETRY_BUDGET.withdraw():
+        return None
+    get_resilience_counters(server)[kind].incr()
+    tried.append(server)
+    return server
+
+def hedge_outcome(finished, pending, alt):
+    """
+    finished: [(server, (body, status))] vừa xong; pending: còn lượt gọi đang bay không.
+    Trả về (body, status) thắng, hoặc None = chờ tiếp. Lỗi chỉ được trả khi không còn lượt nào.
+    """
+    for server, result in finished:
+        if result[1] == 200:
+            if server is alt: get_resilience_counters(alt)["hedge_wins"].incr()
+            return result
+    return None if pending else finished[-1][1]
+
+def build_resilience_stats():
+    return {
+        "hedging": HEDGING_ENABLED,
+        "hedge_percentile": HEDGE_PERCENTILE,
+        "hedge_delays": {name: round(delay, 4) for name, (_, delay) in list(HEDGE_DELAYS.items())},
+        "max_retries": MAX_RETRIES,
+        "retry_budget": RETRY_BUDGET.stats(),
+        "servers": {s.name: {k: c.value for k, c in get_resilience_counters(s).items()} for s in SERVERS},
+    }
+
+# --- ADMISSION CONTROL (HÀNG ĐỢI CÓ GIỚI HẠN + LOAD SHEDDING) ---
+# Backend đầy (active_conns ≥ limit) thì không gửi thêm: request chờ trong một hàng đợi FIFO
+# có giới hạn tới khi có backend trả chỗ; hàng đợi đầy -> 429 ngay, chờ quá hạn -> 503.
+# Khi mọi backend bão hoà, phần tải dư bị từ chối nhanh ở LB thay vì đẩy CPU backend vào
+# vùng crash (cpu_overload_count) làm cả cụm sụp.
+# Limit là giới hạn mềm: đọc không khoá như các thuật toán, nhiều request cùng qua có thể vượt 1-2.
+class AdmissionQueue:
+    """Hàng đợi FIFO các request đang chờ chỗ trống; mỗi phần tử là hàm đánh thức của request đó"""
+
+    def __init__(self, size=ADMISSION_QUEUE_SIZE):
+        self.size = size
+        self.waiters = deque()
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def push(self, wake, retry=False):
+        """retry=True: request đã chờ rồi, bị đánh thức nhưng mất chỗ -> quay lại đầu hàng"""
+        with self.lock:
+            if retry:
+                self.waiters.appendleft(wake)
+            elif len(self.waiters) >= self.size:
+                return False
+            else:
+                self.waiters.append(wake)
+            self.peak = max(self.peak, len(self.waiters))
+        return True
+
+    def discard(self, wake):
+        with self.lock:
+            try:
+                self.waiters.remove(wake)
+            except ValueError:
+                pass
+
+    def wake_one(self):
+        if not self.waiters: return   # Đường nhanh, không khoá khi không ai chờ
+        with self.lock:
+            wake = self.waiters.popleft() if self.waiters else None
+        if wake is not None: wake()
+
+    def clear(self):
+        with self.lock:
+            self.waiters.clear()
+            self.peak = 0
+
+    def __len__(self):
+        return len(self.waiters)
+
+ADMISSION_QUEUE = AdmissionQueue()
+ADMITTED_AFTER_WAIT = AtomicCounter()
+ADMISSION_REJECTED = {"queue_full": AtomicCounter(), "queue_timeout": AtomicCounter()}
+
+ADMISSION_FALLBACKS = AtomicCounter()   # Backend được chọn đầy -> chuyển sang backend khác còn chỗ
+
+def has_capacity(server):
+    return server.active_conns < server.limiter.limit
+
+def spare_capacity(server):
+    return server.limiter.limit - server.active_conns
+
+def select_with_capacity(algorithm, key=None):
+    """
+    Backend của thuật toán nếu còn chỗ. Nó đầy -> backend khác còn chỗ trước khi phải xếp hàng:
+    thuật toán theo khoá đi tiếp trên vòng băm (backend kế tiếp của khoá), thuật toán khác lấy
+    backend còn nhiều chỗ trống nhất. Chỉ quét O(n) khi backend được chọn đã đầy (đường thường vẫn
+    O(log n)); None -> mọi backend đều đầy, request chờ trong hàng đợi rồi chọn lại.
+    """
+    server = select_server(algorithm, key)
+    if server is None or has_capacity(server):
+        return server
+    if (algorithm or CURRENT_ALGORITHM) in KEYED_STRATEGIES and key is not None:
+        fallback = next((s for s in HASH_RING.walk(key) if s.in_rotation and has_capacity(s)), None)
+    else:
+        fallback = max((s for s in get_available_servers() if has_capacity(s)),
+                       key=spare_capacity, default=None)
+    if fallback is not None:
+        ADMISSION_FALLBACKS.incr()
+    return fallback
+
+def queue_full_response():
+    ADMISSION_REJECTED["queue_full"].incr()
+    return {"error": "Too many requests: admission queue full", "status": "rejected"}, 429
+
+def queue_timeout_response():
+    ADMISSION_REJECTED["queue_timeout"].incr()
+    return {"error": "All backends at their concurrency limit", "status": "rejected"}, 503
+
+def admit_blocking(algorithm, key=None):
+    """
+    Engine Flask: chờ (chặn thread) tới khi có backend còn chỗ.
+    Trả về (server, None) hoặc (None, phản hồi từ chối).
+    """
+    deadline = time.monotonic() + ADMISSION_QUEUE_TIMEOUT
+    woken = threading.Event()
+    retry = False
+    while True:
+        server = select_with_capacity(algorithm, key)
+        if server is not None:
+            if retry: ADMITTED_AFTER_WAIT.incr()
+            return server, None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None, queue_timeout_response()
+        if not ADMISSION_QUEUE.push(woken.set, retry):
+            return None, queue_full_response()
+        woken.wait(remaining)
+        ADMISSION_QUEUE.discard(woken.set)
+        woken.clear()
+        retry = True
+
+def build_admission_stats():
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "queue": {"waiting": len(ADMISSION_QUEUE), "peak": ADMISSION_QUEUE.peak,
+                  "size": ADMISSION_QUEUE.size, "timeout": ADMISSION_QUEUE_TIMEOUT},
+        "admitted_after_wait": ADMITTED_AFTER_WAIT.value,
+        "fallbacks": ADMISSION_FALLBACKS.value,
+        "rejected": {reason: c.value for reason, c in ADMISSION_REJECTED.items()},
+        "limits": {
+            s.name: {
+                "limit": round(s.limiter.limit, 2),
+                "in_flight": s.active_conns,
+                "held": s.held,
+                "baseline_ms": round(s.limiter.baseline * 1000, 1) if s.limiter.baseline is not None else None,
+            }
+            for s in SERVERS
+        },
+    }
+
+def build_stats():
+    return {
+        "engine": ENGINE,
+        "algorithm": CURRENT_ALGORITHM,
+        "algorithms": list(STRATEGIES),
+        "cache_enabled": CACHE_ENABLED,
+        "total_requests": TOTAL_REQUESTS.value,
+        "cache_hits": RESPONSE_CACHE.hits,
+        "cache": RESPONSE_CACHE.stats(),
+        "coalescing": SINGLE_FLIGHT.stats(),
+        "current_cost_per_hour": calculate_current_cost(),
+        "servers": [s.snapshot() for s in SERVERS],
+        "connection_pools": {s.name: get_pool_stats(s) for s in SERVERS},
+        "circuit": {
+            "active_health_checks": HEALTH_CHECKS_RUNNING,
+            "transitions_total": CIRCUIT_TRANSITIONS_TOTAL.value,
+            "events": list(CIRCUIT_EVENTS),
+        },
+        "outliers": build_outlier_stats(),
+        "admission": build_admission_stats(),
+        "resilience": build_resilience_stats(),
+        "hashing": build_hashing_stats(),
+        "policies": {a: {c: n.value for c, n in counters.items()}
+                     for a, counters in list(POLICY_COUNTERS.items())}
+    }
+
+def apply_config(data):
+    global CURRENT_ALGORITHM, CACHE_ENABLED, HEDGING_ENABLED, HEDGE_PERCENTILE, MAX_RETRIES
+    global OUTLIER_DETECTION_ENABLED, ADMISSION_ENABLED
+    if 'algorithm' in data: CURRENT_ALGORITHM = data['algorithm']
+    if 'cache' in data: CACHE_ENABLED = bool(data['cache'])
+    if 'cache_ttl' in data: RESPONSE_CACHE.ttl = float(data['cache_ttl'])
+    if 'cache_max_bytes' in data: RESPONSE_CACHE.resize(int(data['cache_max_bytes']))
+    if 'hedging' in data: HEDGING_ENABLED = bool(data['hedging'])
+    if 'hedge_percentile' in data:
+        HEDGE_PERCENTILE = float(data['hedge_percentile'])
+        HEDGE_DELAYS.clear()
+    if 'max_retries' in data: MAX_RETRIES = int(data['max_retries'])
+    if 'retry_budget_ratio' in data: RETRY_BUDGET.ratio = float(data['retry_budget_ratio'])
+    if 'outlier_detection' in data: OUTLIER_DETECTION_ENABLED = bool(data['outlier_detection'])
+    if 'admission' in data: ADMISSION_ENABLED = bool(data['admission'])
+    return {"status": "updated"}, 200
+
+def apply_toggle(data):
+    server_name = data.get('name')
+    action = data.get('action') 
+    for s in SERVERS:
+        if s.name == server_name:
+            s.set_active(action == 'on')
+            if not s.active: 
+                close_backend_session(s)
+            return {"status": "success"}, 200
+    return {"error": "not found"}, 404
+
+# --- PROMETHEUS /metrics (TEXT FORMAT 0.0.4) ---
+# Chỉ đọc các bộ đếm/histogram có sẵn khi bị scrape; đường đi của request không đổi.
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def prom_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prom_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{prom_label(v)}"' for k, v in labels.items()) + "}"
+
+def prom_number(value):
+    """Số thực đủ độ chính xác (:g chỉ giữ 6 chữ số -> _sum / counter lớn nhảy theo bậc thô)"""
+    if value != value: return "NaN"
+    if math.isinf(value): return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+def prom_metric(lines, name, kind, help_text, samples):
+    """samples: [(labels dict, giá trị)]"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{prom_labels(labels)} {prom_number(value)}" if isinstance(value, float)
+                     else f"{name}{prom_labels(labels)} {value}")
+
+def prom_histogram(lines, name, help_text, series):
+    """series: [(labels dict, WindowedHistogram)]"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, hist in series:
+        counts, total_sum, total = hist.prometheus_buckets(METRICS_BUCKETS)
+        for bound, count in zip(METRICS_BUCKETS, counts):
+            lines.append(f"{name}_bucket{prom_labels({**labels, 'le': f'{bound:g}'})} {count}")
+        lines.append(f"{name}_bucket{prom_labels({**labels, 'le': '+Inf'})} {total}")
+        lines.append(f"{name}_sum{prom_labels(labels)} {prom_number(total_sum)}")
+        lines.append(f"{name}_count{prom_labels(labels)} {total}")
+
+def build_metrics():
+    lines = []
+    servers = [(s, s.snapshot()) for s in SERVERS]
+    cache = RESPONSE_CACHE.stats()
+    coalescing = SINGLE_FLIGHT.stats()
+
+    prom_metric(lines, "lb_requests_total", "counter", "Requests received by the load balancer",
+                [({}, TOTAL_REQUESTS.value)])
+    prom_metric(lines, "lb_no_backend_total", "counter", "Requests rejected because no backend was available",
+                [({}, NO_SERVER_TOTAL.value)])
+    prom_metric(lines, "lb_backend_requests_total", "counter", "Upstream requests by backend and status class",
+                [({"server": s.name, "code": c}, counter.value)
+                 for s, _ in servers for c, counter in get_backend_counters(s).items()])
+    prom_metric(lines, "lb_policy_requests_total", "counter", "Requests by routing algorithm and status class",
+                [({"algorithm": a, "code": c}, counter.value)
+                 for a, counters in list(POLICY_COUNTERS.items()) for c, counter in counters.items()])
+    prom_metric(lines, "lb_backend_active_connections", "gauge", "In-flight requests per backend",
+                [({"server": s.name}, snap["active_conns"]) for s, snap in servers])
+    prom_metric(lines, "lb_backend_ewma_response_seconds", "gauge", "Peak EWMA response time per backend",
+                [({"server": s.name}, float(snap["ewma_response_time"])) for s, snap in servers])
+    prom_metric(lines, "lb_backend_avg_response_seconds", "gauge", "Moving-average response time per backend",
+                [({"server": s.name}, float(snap["avg_response_time"])) for s, snap in servers])
+    prom_metric(lines, "lb_backend_cpu_usage_percent", "gauge", "Last reported backend CPU usage",
+                [({"server": s.name}, float(snap["cpu_usage"])) for s, snap in servers])
+    prom_metric(lines, "lb_backend_enabled", "gauge", "1 if the backend is switched on (/toggle_server)",
+                [({"server": s.name}, int(snap["active"])) for s, snap in servers])
+    prom_metric(lines, "lb_backend_healthy", "gauge", "1 if the last upstream call succeeded",
+                [({"server": s.name}, int(snap["health_status"] == "healthy")) for s, snap in servers])
+    prom_metric(lines, "lb_backend_circuit_open", "gauge", "1 while the backend's circuit breaker is open",
+                [({"server": s.name}, int(snap["circuit_state"] == OPEN)) for s, snap in servers])
+    prom_metric(lines, "lb_backend_circuit_state", "gauge", "Circuit breaker state per backend (1 = current)",
+                [({"server": s.name, "state": state}, int(snap["circuit_state"] == state))
+                 for s, snap in servers for state in (CLOSED, OPEN, HALF_OPEN)])
+    prom_metric(lines, "lb_circuit_transitions_total", "counter", "Circuit breaker state transitions",
+                [({}, CIRCUIT_TRANSITIONS_TOTAL.value)])
+    prom_metric(lines, "lb_backend_ejected", "gauge", "1 while the backend is ejected as a latency/error outlier",
+                [({"server": s.name}, int(snap["ejected"])) for s, snap in servers])
+    prom_metric(lines, "lb_backend_ejections_total", "counter", "Outlier ejections per backend",
+                [({"server": s.name}, s.outlier.ejections) for s, _ in servers])
+    resilience = [(s, get_resilience_counters(s)) for s, _ in servers]
+    prom_metric(lines, "lb_backend_hedges_total", "counter", "Hedged duplicates sent to each backend",
+                [({"server": s.name}, c["hedges"].value) for s, c in resilience])
+    prom_metric(lines, "lb_backend_hedge_wins_total", "counter", "Hedged duplicates that answered first",
+                [({"server": s.name}, c["hedge_wins"].value) for s, c in resilience])
+    prom_metric(lines, "lb_backend_retries_total", "counter", "Retries (after 503 / connection error) sent to each backend",
+                [({"server": s.name}, c["retries"].value) for s, c in resilience])
+    prom_metric(lines, "lb_retry_budget_exhausted_total", "counter", "Hedges/retries skipped for lack of budget",
+                [({}, RETRY_BUDGET.exhausted.value)])
+    prom_metric(lines, "lb_backend_concurrency_limit", "gauge", "Adaptive concurrency limit per backend",
+                [({"server": s.name}, float(snap["concurrency_limit"])) for s, snap in servers])
+    prom_metric(lines, "lb_admission_queue_length", "gauge", "Requests waiting for a backend below its limit",
+                [({}, len(ADMISSION_QUEUE))])
+    prom_metric(lines, "lb_admission_rejected_total", "counter", "Requests shed by admission control",
+                [({"reason": r}, c.value) for r, c in ADMISSION_REJECTED.items()])
+    prom_metric(lines, "lb_admission_fallbacks_total", "counter",
+                "Requests sent to another backend because the selected one was at its limit",
+                [({}, ADMISSION_FALLBACKS.value)])
+    prom_metric(lines, "lb_hash_spills_total", "counter", "Bounded-load hash requests moved past a full backend",
+                [({}, HASH_SPILLS.value)])
+    prom_metric(lines, "lb_backend_in_rotation", "gauge", "1 if the backend can be selected",
+                [({"server": s.name}, int(snap["in_rotation"])) for s, snap in servers])
+    prom_metric(lines, "lb_cache_hits_total", "counter", "Response cache hits", [({}, cache["hits"])])
+    prom_metric(lines, "lb_cache_misses_total", "counter", "Response cache misses", [({}, cache["misses"])])
+    prom_metric(lines, "lb_cache_evictions_total", "counter", "Entries evicted to stay under the byte budget",
+                [({}, cache["evictions"])])
+    prom_metric(lines, "lb_cache_entries", "gauge", "Entries in the response cache", [({}, cache["entries"])])
+    prom_metric(lines, "lb_cache_bytes", "gauge", "Bytes held by the response cache", [({}, cache["bytes"])])
+    prom_metric(lines, "lb_coalesced_requests_total", "counter", "Requests served by joining an in-flight call",
+                [({}, coalescing["coalesced"])])
+    prom_histogram(lines, "lb_request_duration_seconds", "End-to-end latency seen by the load balancer",
+                   [({}, LATENCY_ALL)])
+    prom_histogram(lines, "lb_backend_request_duration_seconds", "Upstream latency per backend",
+                   [({"server": s.name}, get_server_histogram(s)) for s, _ in servers])
+    prom_histogram(lines, "lb_policy_request_duration_seconds", "End-to-end latency per routing algorithm",
+                   [({"algorithm": a}, h) for a, h in list(POLICY_LATENCY.items())])
+    return "\n".join(lines) + "\n"
+
+# --- ROUTER CHÍNH (ENGINE FLASK) ---
+def forward_request(params, cache_key, algorithm=None, hash_key=None):
+    RETRY_BUDGET.deposit()
 
     # --- 2. CHỌN SERVER DỰA TRÊN THUẬT TOÁN ---
-    target = None
-    
-    if CURRENT_ALGORITHM == 'round_robin': 
-        target = get_server_round_robin()
-    elif CURRENT_ALGORITHM == 'least_connection': 
-        target = get_server_least_connection()
-    elif CURRENT_ALGORITHM == 'weighted_response_time': 
-        target = get_server_weighted_response_time()
-    elif CURRENT_ALGORITHM == 'peak_ewma': 
-        target = get_server_peak_ewma()
-    elif CURRENT_ALGORITHM == 'p2c': 
-        target = get_server_p2c()
-    elif CURRENT_ALGORITHM == 'adaptive': 
-        target = get_server_adaptive()
-    else: 
-        # Fallback an toàn
-        target = get_server_round_robin()
+    target = select_server(algorithm, hash_key)
 
     # Nếu không tìm thấy server nào (Tất cả đều tắt hoặc crash)
     if target is None:
-        return jsonify({
-            "error": "System Overload! All servers are down.", 
-            "status": "system_failure"
-        }), 503
+        return no_server_response()
+
+    # Server đã chạm giới hạn đồng thời -> chờ chỗ trống trong hàng đợi (hoặc bị từ chối)
+    if ADMISSION_ENABLED and not has_capacity(target):
+        target, rejected = admit_blocking(algorithm, hash_key)
+        if target is None:
+            return rejected
+
+    # --- 3. GỬI REQUEST (hedge nếu bật; 503 / lỗi kết nối -> retry sang backend khác) ---
+    tried = [target]
+    retries = 0
+    while True:
+        if HEDGING_ENABLED:
+            body, status = call_hedged(target, params, cache_key, algorithm, tried)
+        else:
+            body, status = call_backend(target, params, cache_key)
+        if status not in RETRYABLE_STATUS or retries >= MAX_RETRIES:
+            return body, status
+        target = extra_backend(algorithm, tried, "retries")
+        if target is None:
+            return body, status
+        retries += 1
 
-    # --- 3. GỬI REQUEST ---
-    target["active_conns"] += 1
+def call_hedged(target, params, cache_key, algorithm, tried):
+    """Lượt gọi chạy trong HEDGE_POOL; quá deadline mà chưa xong -> thêm bản sao tới backend khác"""
+    first = HEDGE_POOL.submit(call_backend, target, params, cache_key)
+    try:
+        return first.result(timeout=hedge_delay(target, request_hold(params)))
+    except FutureTimeout:
+        pass
+
+    alt = extra_backend(algorithm, tried, "hedges")
+    if alt is None:
+        return first.result()
+    # Bản thua vẫn chạy nốt trong pool (release + thống kê như bình thường), không ai chờ nó
+    pending = {first: target, HEDGE_POOL.submit(call_backend, alt, params, cache_key): alt}
+    while True:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        finished = [(pending.pop(f), f.result()) for f in done]
+        result = hedge_outcome(finished, pending, alt)
+        if result is not None:
+            return result
+
+def call_backend(target, params, cache_key):
+    """Một lượt gọi upstream tới backend đã chọn: acquire -> GET -> cập nhật trạng thái -> release"""
+    target.acquire(request_hold(params))
     start_time = time.time()
     
     try:
         # [QUAN TRỌNG] Truyền tham số duration xuống backend và Timeout dài
-        forward_params = request.args
-        resp = requests.get(target["url"], params=forward_params, timeout=30)
-        
-        if resp.status_code == 200:
-            data = resp.json()
-            target["total_handled"] += 1
-            target["health_status"] = "healthy" # Đánh dấu sống lại
-            if "cpu_usage" in data: target["cpu_usage"] = data["cpu_usage"]
-            RESPONSE_CACHE[request_key] = data
-            return jsonify(data)
-
-        elif resp.status_code == 503:
-            # Server báo crash chủ động
-            data = resp.json()
-            target["health_status"] = "crashed"
-            target["last_crash_time"] = time.time()
-            target["cpu_usage"] = 100 
-            return jsonify(resp.json()), 503
-            
-        else:
-             # Các lỗi khác (404, 500...)
-            return jsonify(resp.json()), resp.status_code
-
+        session = get_backend_session(target)
+        resp = session.get(target.url, params=params, timeout=UPSTREAM_TIMEOUT)
+        if closes_connection(resp.headers):
+            count_backend_close(target)
+        return handle_backend_response(target, resp.status_code, resp.json(), cache_key)
     except Exception as e:
-        # Lỗi kết nối mạng (Timeout/Refused) -> Đánh dấu CRASH ngay
-        print(f"⚠️ {target['name']} died unexpectedly: {e}")
-        target["health_status"] = "crashed"
-        target["last_crash_time"] = time.time()
-        target["cpu_usage"] = 0 
-        return jsonify({"error": "Connection failed"}), 502
+        return handle_backend_error(target, e)
+    finally:
+        release_server(target, time.time() - start_time, request_hold(params))
+
+@app.route('/')
+def router():
+    start_time = time.time()
+    algorithm, status = None, 500
+    try:
+        params = list(request.args.items(multi=True))
+        algorithm, params, valid = resolve_algorithm(request.headers.get(ALGORITHM_HEADER), params)
+        if not valid:
+            body, status = unknown_algorithm_response(algorithm)
+            return jsonify(body), status
+
+        # --- 1. XỬ LÝ CACHE ---
+        cached_data, cache_key = check_cache(request.path, params, algorithm)
+        if cached_data is not None:
+            status = 200
+            return jsonify(cached_data)
+        hash_key = request_hash_key(algorithm, request.headers.get(HASH_KEY_HEADER), request.path, params)
+
+        # Request cacheable giống hệt nhau đang bay -> chỉ một request lên backend
+        if cache_key is None:
+            body, status = forward_request(params, cache_key, algorithm, hash_key)
+        else:
+            (body, status), _ = SINGLE_FLIGHT.do(
+                cache_key, lambda: forward_request(params, cache_key, algorithm, hash_key))
 
+        return jsonify(body), status
     finally:
-        target["active_conns"] -= 1
         latency = time.time() - start_time
-        
-        # Chỉ cập nhật chỉ số thống kê nếu server khỏe
-        if target.get('health_status') == 'healthy':
-            # Cập nhật Moving Average (cho Weighted RT)
-            target["avg_response_time"] = (target["avg_response_time"] * 0.9) + (latency * 0.1)
-            
-            # Cập nhật Peak EWMA (cho thuật toán mới)
-            if latency > target.get("ewma_response_time", 0):
-                target["ewma_response_time"] = latency
-            else:
-                old_ewma = target.get("ewma_response_time", 0.1)
-                target["ewma_response_time"] = (old_ewma * (1 - EWMA_DECAY)) + (latency * EWMA_DECAY)
+        LATENCY_ALL.record(latency)
+        record_policy(algorithm, status, latency)
 
 # --- API STATS & CONFIG ---
 @app.route('/stats', methods=['GET'])
 def get_stats():
-    return jsonify({
-        "algorithm": CURRENT_ALGORITHM,
-        "cache_probability": CACHE_PROBABILITY,
-        "total_requests": TOTAL_REQUESTS,
-        "cache_hits": CACHE_HITS,
-        "current_cost_per_hour": calculate_current_cost(),
-        "servers": SERVERS
-    })
+    return jsonify(build_stats())
+
+@app.route('/stats/latency', methods=['GET'])
+def get_latency_stats():
+    return jsonify(build_latency_stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(build_metrics(), headers={"Content-Type": METRICS_CONTENT_TYPE})
 
 @app.route('/config', methods=['POST'])
 def update_config():
-    global CURRENT_ALGORITHM, CACHE_PROBABILITY
-    data = request.json
-    if 'algorithm' in data: CURRENT_ALGORITHM = data['algorithm']
-    if 'cache_probability' in data: CACHE_PROBABILITY = float(data['cache_probability']) / 100.0
-    return jsonify({"status": "updated"})
+    body, status = apply_config(request.json)
+    return jsonify(body), status
 
 @app.route('/toggle_server', methods=['POST'])
 def toggle_server():
-    data = request.json
-    server_name = data.get('name')
-    action = data.get('action') 
-    for s in SERVERS:
-        if s['name'] == server_name:
-            s['active'] = (action == 'on')
-            if not s['active']: 
-                s['active_conns'] = 0
-                s['cpu_usage'] = 0
-                s['health_status'] = 'healthy'
-            return jsonify({"status": "success"})
-    return jsonify({"error": "not found"}), 404
+    body, status = apply_toggle(request.json)
+    return jsonify(body), status
+
+# --- ENGINE ASYNCIO (aiohttp) ---
+# Mỗi request đang chờ backend chỉ là một coroutine -> giữ được hàng nghìn request chậm
+# mà không tốn một OS thread cho mỗi request như Flask.
+
+def create_async_session(server):
+    """ClientSession keep-alive cho một backend (tối đa pool_size kết nối), đếm kết nối mở mới/tái sử dụng"""
+    import aiohttp
+
+    stats = ASYNC_POOL_STATS.setdefault(server.name, {
+        "pool_size": server.pool_size,
+        "requests": 0,
+        "connections_opened": 0,
+        "connections_reused": 0,
+        "connections_closed_by_backend": 0,
+        "idle_connections": None,
+    })
+
+    async def on_request_start(session, ctx, params):
+        stats["requests"] += 1
+
+    async def on_connection_create_end(session, ctx, params):
+        stats["connections_opened"] += 1
+
+    async def on_connection_reuseconn(session, ctx, params):
+        stats["connections_reused"] += 1
+
+    async def on_request_end(session, ctx, params):
+        if closes_connection(params.response.headers):
+            stats["connections_closed_by_backend"] += 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_request_start)
+    trace.on_connection_create_end.append(on_connection_create_end)
+    trace.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace.on_request_end.append(on_request_end)
+
+    # Tối đa pool_size kết nối tới backend (đúng con số /stats báo); request thứ pool_size+1
+    # chờ một kết nối rảnh, thời gian chờ tính vào UPSTREAM_TIMEOUT
+    connector = aiohttp.TCPConnector(limit=server.pool_size, limit_per_host=server.pool_size,
+                                     keepalive_timeout=30)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=UPSTREAM_TIMEOUT),
+        trace_configs=[trace],
+    )
+
+def run_asyncio_engine(port):
+    import asyncio
+    import aiohttp
+    from aiohttp import web
+
+    sessions = {}
+
+    def get_async_session(server):
+        session = sessions.get(server.name)
+        if session is None or session.closed:
+            session = create_async_session(server)
+            sessions[server.name] = session
+        return session
+
+    def drop_async_session(server):
+        """close_backend_session cho aiohttp: request sau mở pool mới; session cũ đóng hẳn
+        sau UPSTREAM_TIMEOUT (đóng ngay sẽ cắt cả các lượt gọi khác đang bay trên nó)"""
+        session = sessions.pop(server.name, None)
+        if session is not None:
+            asyncio.get_running_loop().call_later(UPSTREAM_TIMEOUT, lambda: spawn(session.close()))
+
+    background = set()   # Giữ tham chiếu tới các lượt gọi đang bay (bản hedge thua vẫn chạy nốt)
+
+    def spawn(coro):
+        task = asyncio.ensure_future(coro)
+        background.add(task)
+        task.add_done_callback(background.discard)
+        return task
+
+    async def forward_request_async(params, cache_key, algorithm=None, hash_key=None):
+        RETRY_BUDGET.deposit()
+        target = select_server(algorithm, hash_key)
+        if target is None:
+            return no_server_response()
+        if ADMISSION_ENABLED and not has_capacity(target):
+            target, rejected = await admit_async(algorithm, hash_key)
+            if target is None:
+                return rejected
+
+        tried = [target]
+        retries = 0
+        while True:
+            if HEDGING_ENABLED:
+                body, status = await call_hedged_async(target, params, cache_key, algorithm, tried)
+            else:
+                body, status = await call_backend_async(target, params, cache_key)
+            if status not in RETRYABLE_STATUS or retries >= MAX_RETRIES:
+                return body, status
+            target = extra_backend(algorithm, tried, "retries")
+            if target is None:
+                return body, status
+            retries += 1
+
+    async def admit_async(algorithm, key=None):
+        """admit_blocking cho event loop: chờ bằng future thay vì chặn thread"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ADMISSION_QUEUE_TIMEOUT
+        retry = False
+        while True:
+            server = select_with_capacity(algorithm, key)
+            if server is not None:
+                if retry: ADMITTED_AFTER_WAIT.incr()
+                return server, None
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None, queue_timeout_response()
+            woken = loop.create_future()
+            wake = lambda: woken.done() or woken.set_result(None)
+            if not ADMISSION_QUEUE.push(wake, retry):
+                return None, queue_full_response()
+            try:
+                await asyncio.wait_for(woken, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                ADMISSION_QUEUE.discard(wake)
+            retry = True
+
+    async def call_hedged_async(target, params, cache_key, algorithm, tried):
+        first = spawn(call_backend_async(target, params, cache_key))
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay(target, request_hold(params)))
+        if done:
+            return first.result()
+
+        alt = extra_backend(algorithm, tried, "hedges")
+        if alt is None:
+            return await first
+        pending = {first: target, spawn(call_backend_async(alt, params, cache_key)): alt}
+        while True:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            finished = [(pending.pop(t), t.result()) for t in done]
+            result = hedge_outcome(finished, pending, alt)
+            if result is not None:
+                return result
+
+    async def call_backend_async(target, params, cache_key):
+        target.acquire(request_hold(params))
+        start_time = time.time()
+        try:
+            session = get_async_session(target)
+            async with session.get(target.url, params=params) as resp:
+                data = await resp.json(content_type=None)
+                return handle_backend_response(target, resp.status, data, cache_key)
+        except asyncio.CancelledError:
+            raise
+        except aiohttp.ClientConnectionError as e:
+            # Từ chối kết nối / backend ngắt kết nối keep-alive -> bỏ pool như nhánh requests;
+            # ServerTimeoutError (timeout đọc) cũng thuộc nhóm này nhưng không làm hỏng pool
+            if not isinstance(e, TimeoutError):
+                drop_async_session(target)
+            return handle_backend_error(target, e)
+        except Exception as e:
+            return handle_backend_error(target, e)
+        finally:
+            release_server(target, time.time() - start_time, request_hold(params))
+
+    async def async_router(req):
+        start_time = time.time()
+        algorithm, status = None, 500
+        try:
+            params = list(req.query.items())
+            algorithm, params, valid = resolve_algorithm(req.headers.get(ALGORITHM_HEADER), params)
+            if not valid:
+                body, status = unknown_algorithm_response(algorithm)
+                return web.json_response(body, status=status)
+
+            cached_data, cache_key = check_cache(req.path, params, algorithm)
+            if cached_data is not None:
+                status = 200
+                return web.json_response(cached_data)
+            hash_key = request_hash_key(algorithm, req.headers.get(HASH_KEY_HEADER), req.path, params)
+
+            if cache_key is None:
+                body, status = await forward_request_async(params, cache_key, algorithm, hash_key)
+            else:
+                (body, status), _ = await SINGLE_FLIGHT.do_async(
+                    cache_key, lambda: forward_request_async(params, cache_key, algorithm, hash_key))
+
+            return web.json_response(body, status=status)
+        finally:
+            latency = time.time() - start_time
+            LATENCY_ALL.record(latency)
+            record_policy(algorithm, status, latency)
+
+    async def async_stats(req):
+        return web.json_response(build_stats())
+
+    async def async_latency_stats(req):
+        return web.json_response(build_latency_stats())
+
+    async def async_metrics(req):
+        return web.Response(body=build_metrics().encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    async def async_config(req):
+        body, status = apply_config(await req.json())
+        return web.json_response(body, status=status)
+
+    async def async_toggle(req):
+        body, status = apply_toggle(await req.json())
+        return web.json_response(body, status=status)
+
+    async def close_sessions(app):
+        for session in sessions.values():
+            await session.close()
+
+    async_app = web.Application()
+    async_app.router.add_get('/', async_router)
+    async_app.router.add_get('/stats', async_stats)
+    async_app.router.add_get('/stats/latency', async_latency_stats)
+    async_app.router.add_get('/metrics', async_metrics)
+    async_app.router.add_post('/config', async_config)
+    async_app.router.add_post('/toggle_server', async_toggle)
+    async_app.on_cleanup.append(close_sessions)
+
+    print(f"⚡ Asyncio engine listening on :{port}")
+    web.run_app(async_app, port=port, access_log=None, backlog=4096, print=None)
+
+def start_background_tasks():
+    threading.Thread(target=cpu_decay_loop, daemon=True).start()
+    threading.Thread(target=outlier_detection_loop, daemon=True).start()
 
 if __name__ == "__main__":
-    app.run(port=8000)
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Load Balancer")
+    parser.add_argument("--engine", choices=["flask", "asyncio"], default="flask",
+                        help="flask: mỗi request một thread | asyncio: event loop + aiohttp")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backend-port-offset", type=int, default=0,
+                        help="cộng vào cổng của mọi backend (khớp với backend.py --port-offset)")
+    parser.add_argument("--no-health-checks", action="store_true",
+                        help="tắt probe chủ động (open -> half-open sau BACKEND_RECOVERY_TIME)")
+    parser.add_argument("--outlier-detection", action="store_true",
+                        help="đẩy backend chậm/lỗi bất thường ra khỏi rotation một thời gian")
+    parser.add_argument("--admission-control", action="store_true",
+                        help="giới hạn request đồng thời mỗi backend (hàng đợi chờ chỗ, đầy -> 429)")
+    parser.add_argument("--hedge", action="store_true",
+                        help=f"bật hedged request (bản sao sau p{HEDGE_PERCENTILE} độ trễ của backend)")
+    args = parser.parse_args()
+
+    ENGINE = args.engine
+    HEDGING_ENABLED = args.hedge
+    OUTLIER_DETECTION_ENABLED = args.outlier_detection
+    ADMISSION_ENABLED = args.admission_control
+    if args.backend_port_offset:
+        offset_backend_ports(args.backend_port_offset)
+    start_background_tasks()
+    if not args.no_health_checks:
+        start_health_checks()
+    if ENGINE == 'asyncio':
+        run_asyncio_engine(args.port)
+    else:
+        app.run(port=args.port)
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import multiprocessing as mp
+
+import requests
+
+import benchmark
+from results_store import ResultSink, running_summary
+
+# ============================
+# Parallel benchmark over isolated stacks
+# ============================
+# The algorithm is chosen per request, but cells running at the same time on
+# one LB would still share backend load, crashes and circuit/limiter state,
+# so concurrent cells cannot share a stack. Here K independent stacks are started -- one
+# load_balancer.py plus one backend.py cluster each, on their own port range
+# (stack k: LB on BASE_PORT + k * PORT_STRIDE, backends right above it) --
+# and one driver process per stack pulls (algorithm, workload, run) cells
+# from a shared queue. Cells are independent and seeded per cell, so the
+# grid is the same as benchmark.py's sequential one; wall time drops by
+# roughly K. The parent is the only writer of the result store, so
+# --resume works exactly as in benchmark.py.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BASE_PORT = 8000
+PORT_STRIDE = 100             # stack k: LB on 8000 + 100k, backends 8001 + 100k ...
+BACKEND_PORTS = (1, 2, 3)     # backend ports relative to the LB port
+STARTUP_TIMEOUT = 30          # s to wait for a stack's ports to accept connections
+
+# ============================
+# Stack lifecycle
+# ============================
+
+class Stack:
+    def __init__(self, index, engine="flask", backend_mode="threaded", log_dir=None):
+        self.index = index
+        self.offset = index * PORT_STRIDE
+        self.port = BASE_PORT + self.offset
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.engine = engine
+        self.backend_mode = backend_mode
+        self.log_dir = log_dir
+        self.procs = []
+
+    def _spawn(self, name, args):
+        if self.log_dir:
+            out = open(os.path.join(self.log_dir, f"stack{self.index}_{name}.log"), "w")
+        else:
+            out = subprocess.DEVNULL
+        proc = subprocess.Popen([sys.executable, *args], cwd=HERE, stdout=out, stderr=subprocess.STDOUT)
+        self.procs.append(proc)
+
+    def start(self):
+        self._spawn("backend", ["backend.py", "--mode", self.backend_mode,
+                                "--port-offset", str(self.offset)])
+        self._spawn("lb", ["load_balancer.py", "--engine", self.engine, "--port", str(self.port),
+                           "--backend-port-offset", str(self.offset)])
+
+    def wait_ready(self, timeout=STARTUP_TIMEOUT):
+        ports = [self.port] + [self.port + p for p in BACKEND_PORTS]
+        deadline = time.time() + timeout
+        for port in ports:
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                    break
+                except OSError:
+                    if time.time() > deadline or any(p.poll() is not None for p in self.procs):
+                        raise RuntimeError(f"stack {self.index}: port {port} did not come up")
+                    time.sleep(0.2)
+
+    def stop(self):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+# ============================
+# Drivers
+# ============================
+
+def stack_driver(stack_index, lb_url, cells, records, hedging=False):
+    # benchmark.py addresses the LB through module globals
+    benchmark.LB_URL = lb_url
+    benchmark.CONFIG_URL = f"{lb_url}/config"
+    benchmark.HEDGING = hedging
+    benchmark.configure_lb()
+
+    while True:
+        cell = cells.get()
+        if cell is None:
+            break
+        benchmark.seed_cell(*cell)
+        try:
+            batch = benchmark.run_single_experiment(*cell)
+        except requests.RequestException as e:
+            records.put((stack_index, cell, None, repr(e)))
+            continue
+        records.put((stack_index, cell, batch, None))
+
+    records.put((stack_index, None, None, None))    # driver finished
+
+def run_parallel(n_stacks, engine="flask", backend_mode="threaded",
+                 results_dir=benchmark.RESULTS_DIR, resume=False, log_dir=None, interleave=False,
+                 hedging=False):
+    sink = ResultSink(results_dir, resume=resume)
+    pending = [c for c in benchmark.grid_cells(interleave) if not sink.is_done(*c)]
+    if sink.completed:
+        print(f"⏩ Resuming: {len(sink.completed)} cells already in {results_dir}/")
+    n_stacks = max(1, min(n_stacks, len(pending)))
+
+    stacks = [Stack(k, engine, backend_mode, log_dir) for k in range(n_stacks)]
+    drivers = []
+    try:
+        for stack in stacks:
+            stack.start()
+        for stack in stacks:
+            stack.wait_ready()
+            print(f"🚀 Stack {stack.index}: LB :{stack.port}, backends :{stack.port + 1}-{stack.port + len(BACKEND_PORTS)}")
+
+        cells, records = mp.Queue(), mp.Queue()
+        for cell in pending:
+            cells.put(cell)
+        for _ in stacks:
+            cells.put(None)
+
+        for stack in stacks:
+            p = mp.Process(target=stack_driver, args=(stack.index, stack.url, cells, records, hedging),
+                           daemon=True)
+            p.start()
+            drivers.append(p)
+
+        running, done, failed = len(drivers), 0, []
+        while running:
+            stack_index, cell, batch, error = records.get()
+            if cell is None:
+                running -= 1
+                continue
+            if error is not None:
+                failed.append(cell)
+                print(f"❌ Stack {stack_index} | {cell}: {error}")
+                continue
+            sink.write(cell, batch)
+            done += 1
+            print(f"▶ [{done}/{len(pending)}] Stack {stack_index} | Algo={cell[0]} | Workload={cell[1]} | Run={cell[2]}")
+
+        if failed:
+            print(f"⚠ {len(failed)} cells failed; rerun with --resume to retry them")
+    finally:
+        for p in drivers:
+            p.join(timeout=5)
+        for stack in stacks:
+            stack.stop()
+
+    return sink.read()
+
+# ============================
+# Main
+# ============================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark grid across K isolated LB/backend stacks")
+    parser.add_argument("--stacks", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="number of isolated stacks (default: half the CPU cores)")
+    parser.add_argument("--engine", choices=["flask", "asyncio"], default="flask",
+                        help="LB engine of every stack")
+    parser.add_argument("--backend-mode", choices=["threaded", "async"], default="threaded")
+    parser.add_argument("--interleave", action="store_true",
+                        help="run all algorithms interleaved in every cell (A/B on the same backends)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="enable hedged requests on every stack's LB")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"continue an interrupted run from the cells already in {benchmark.RESULTS_DIR}/")
+    parser.add_argument("--logs", metavar="DIR", help="keep each stack's stdout/stderr in DIR")
+    parser.add_argument("--csv", action="store_true",
+                        help=f"also export the raw results to {benchmark.RESULTS_DIR}.csv")
+    args = parser.parse_args()
+    if args.logs:
+        os.makedirs(args.logs, exist_ok=True)
+
+    print(f"=== PARALLEL BENCHMARK: {args.stacks} stacks ===")
+    wall = time.perf_counter()
+    df = run_parallel(args.stacks, args.engine, args.backend_mode,
+                      resume=args.resume, log_dir=args.logs, interleave=args.interleave,
+                      hedging=args.hedge)
+    summary = benchmark.analyze(df, running_summary(benchmark.RESULTS_DIR))
+
+    if args.csv:
+        df.to_csv(f"{benchmark.RESULTS_DIR}.csv", index=False)
+    summary.to_csv("summary_results.csv", index=False)
+
+    print("\n=== SUMMARY (Mean ± Std) ===")
+    print(summary)
+    print(f"\n{len(df)} requests in {time.perf_counter() - wall:.1f}s wall")
+    print(f"✅ Saved: {benchmark.RESULTS_DIR}/" + (f" + {benchmark.RESULTS_DIR}.csv" if args.csv else ""))
+    print("✅ Saved: summary_results.csv")
@@ -50,31 +50,51 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
  
+from analysis import build_tables
+from results_store import load_results
+ 
 # ============================
 # LOAD DATA
 # ============================
  
-CSV_FILE = "benchmark_data.csv"
-df = pd.read_csv(CSV_FILE)
+# Thư mục kết quả dạng cột (đọc memory-mapped); vẫn nhận file .csv cũ
+RESULTS = "raw_results"
+df = load_results(RESULTS)
  
-sns.set_theme(style="whitegrid")
+# Mọi thống kê tính một lần, vector hoá (analysis.py) -> không groupby lại cho từng biểu đồ
+tables = build_tables(df, n_boot=0)
+summary = tables["summary"]
  
-# Lọc timeout để biểu đồ không bị méo
-df_clean = df[df["server"] != "TIMEOUT"]
+sns.set_theme(style="whitegrid")
  
 # ============================
 # 1. BOX PLOT – LATENCY STABILITY
 # ============================
  
-plt.figure(figsize=(14, 6))
-sns.boxplot(
-    x="algorithm",
-    y="latency",
-    hue="workload",
-    data=df_clean,
-    showfliers=False
-)
- 
+# Box đã tính sẵn (timeout bị lọc trong box_stats để biểu đồ không bị méo)
+box = tables["box"]
+algorithms = list(dict.fromkeys(b["algorithm"] for b in box))
+workloads = list(dict.fromkeys(b["workload"] for b in box))
+colors = dict(zip(workloads, sns.color_palette(n_colors=len(workloads))))
+width = 0.8 / len(workloads)
+ 
+fig, ax = plt.subplots(figsize=(14, 6))
+for j, workload in enumerate(workloads):
+    stats = [b for b in box if b["workload"] == workload]
+    positions = [algorithms.index(b["algorithm"]) + (j - (len(workloads) - 1) / 2) * width for b in stats]
+    ax.bxp(
+        stats,
+        positions=positions,
+        widths=width * 0.9,
+        showfliers=False,
+        patch_artist=True,
+        boxprops={"facecolor": colors[workload]},
+        medianprops={"color": "black"}
+    )
+    ax.plot([], [], color=colors[workload], linewidth=8, label=workload)
+ 
+ax.set_xticks(range(len(algorithms)))
+ax.set_xticklabels(algorithms)
 plt.title("Latency Stability across Load Balancing Algorithms", fontsize=14, fontweight="bold")
 plt.ylabel("Latency (ms)")
 plt.xlabel("Algorithm")
@@ -89,18 +109,12 @@ print("✅ Saved: chart_latency_box.png")
 # 2. P95 LATENCY – TAIL PERFORMANCE
 # ============================
  
-p95_df = (
-    df.groupby(["algorithm", "workload"])["latency"]
-    .quantile(0.95)
-    .reset_index(name="p95_latency")
-)
- 
 plt.figure(figsize=(14, 6))
 sns.barplot(
     x="p95_latency",
     y="algorithm",
     hue="workload",
-    data=p95_df
+    data=summary
 )
  
 plt.title("P95 Latency (Tail Performance)", fontsize=14, fontweight="bold")
@@ -117,12 +131,7 @@ print("✅ Saved: chart_p95_latency.png")
 # 3. LOAD DISTRIBUTION – BACKEND AWARENESS
 # ============================
  
-df_success = df[df["status"] == 200]
- 
-load_dist = pd.crosstab(
-    [df_success["algorithm"], df_success["workload"]],
-    df_success["server"]
-)
+load_dist = tables["load"]
  
 plt.figure(figsize=(16, 7))
 load_dist.plot(
@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+
+from histogram import LatencyHistogram
+
+# ============================
+# Columnar result storage
+# ============================
+# A results "file" is a directory with one raw little-endian binary file per
+# column plus meta.json (row count, dtypes, category dictionaries):
+#   - string columns (algorithm, workload, server) are dictionary-encoded
+#     as int16 codes, so a row costs a few bytes instead of the repeated text
+#   - latencies are float32 (sub-microsecond resolution at these scales)
+#   - every append() writes only the new rows to the end of each column file
+# Readers memory-map the column files; nothing is parsed, and only the pages
+# a query touches are read. meta.json is replaced atomically after the data,
+# so its row count is what was fully written -- bytes past it (from a crash
+# mid-append) are ignored by readers and truncated by the next writer.
+
+META_FILE = "meta.json"
+CODE_DTYPE = "<i2"
+FLOAT_DTYPE = "<f4"
+INT_DTYPE = "<i4"
+
+# Narrower types for known columns; anything else is inferred from the data
+COLUMN_DTYPES = {
+    "status": "<i2",
+    "success": "<i1",
+}
+
+class ResultStore:
+    def __init__(self, path, mode="a"):
+        """mode "a": open / create and append, "w": start empty, "r": read only"""
+        self.path = path
+        self.meta_path = os.path.join(path, META_FILE)
+
+        if mode != "r":
+            os.makedirs(path, exist_ok=True)
+        if mode == "w" or (mode == "a" and not os.path.exists(self.meta_path)):
+            for name in os.listdir(path):
+                if name.endswith(".bin"):
+                    os.remove(os.path.join(path, name))
+            self.meta = {"rows": 0, "columns": {}}
+            self._save_meta()
+        else:
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if mode == "a":
+                self._truncate_partial()
+
+    # ---- layout ----
+
+    @property
+    def rows(self):
+        return self.meta["rows"]
+
+    @property
+    def columns(self):
+        return list(self.meta["columns"])
+
+    def _column_file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _save_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.meta_path)
+
+    def _truncate_partial(self):
+        """Drop bytes an interrupted append wrote past the committed row count"""
+        for name, spec in self.meta["columns"].items():
+            size = self.rows * np.dtype(spec["dtype"]).itemsize
+            path = self._column_file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    # ---- writing ----
+
+    def _define_column(self, name, values):
+        if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(values.dtype):
+            spec = {"kind": "category", "dtype": CODE_DTYPE, "categories": []}
+        elif name in COLUMN_DTYPES:
+            spec = {"kind": "number", "dtype": COLUMN_DTYPES[name]}
+        elif pd.api.types.is_float_dtype(values.dtype):
+            spec = {"kind": "number", "dtype": FLOAT_DTYPE}
+        else:
+            spec = {"kind": "number", "dtype": INT_DTYPE}
+        self.meta["columns"][name] = spec
+        return spec
+
+    def _encode(self, spec, values):
+        if spec["kind"] != "category":
+            return values.to_numpy().astype(spec["dtype"])
+
+        categories = spec["categories"]
+        lookup = {c: i for i, c in enumerate(categories)}
+        uniques, inverse = np.unique(values.astype(str).to_numpy(), return_inverse=True)
+        mapping = np.empty(len(uniques), dtype=CODE_DTYPE)
+        for i, value in enumerate(uniques):
+            if value not in lookup:
+                lookup[value] = len(categories)
+                categories.append(value)
+            mapping[i] = lookup[value]
+        return mapping[inverse]
+
+    def append(self, records):
+        """Append a batch (list of dicts or DataFrame) to the end of every column"""
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+        if df.empty:
+            return 0
+
+        if not self.meta["columns"]:
+            for name in df.columns:
+                self._define_column(name, df[name])
+        elif set(df.columns) != set(self.meta["columns"]):
+            raise ValueError(f"columns {sorted(df.columns)} do not match store {sorted(self.columns)}")
+
+        for name, spec in self.meta["columns"].items():
+            data = self._encode(spec, df[name])
+            with open(self._column_file(name), "ab") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.meta["rows"] += len(df)
+        self._save_meta()
+        return len(df)
+
+    # ---- reading ----
+
+    def column(self, name):
+        """Raw column: memory-mapped numbers, or int16 codes for categories"""
+        spec = self.meta["columns"][name]
+        if self.rows == 0:
+            return np.empty(0, dtype=spec["dtype"])
+        return np.memmap(self._column_file(name), dtype=spec["dtype"], mode="r", shape=(self.rows,))
+
+    def read(self, columns=None):
+        """DataFrame over the memory-mapped columns (categories as pd.Categorical)"""
+        data = {}
+        for name in columns or self.columns:
+            spec = self.meta["columns"][name]
+            values = self.column(name)
+            if spec["kind"] == "category":
+                values = pd.Categorical.from_codes(values, categories=spec["categories"])
+            data[name] = values
+        return pd.DataFrame(data, copy=False)
+
+    def to_csv(self, path):
+        self.read().to_csv(path, index=False)
+
+# ============================
+# Streaming sink
+# ============================
+# The benchmarks write one (algorithm, workload, run) cell at a time. After
+# each cell the rows, the list of completed cells and the running summaries
+# are committed together (one meta.json replace), so a crash loses at most
+# the cell in flight and `resume` carries on from the next one. Running
+# summaries are mergeable state -- count / mean / M2 (Chan et al.'s parallel
+# update) and an HDR histogram per (algorithm, workload) -- so the summary
+# table never needs the raw rows back in memory.
+
+RUNNING_COLUMNS = ("latency", "response_time")
+RUNNING_PERCENTILES = (50, 95, 99, 99.9)
+
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.success = 0
+        self.moments = {}            # column -> [mean, m2]
+        self.histograms = {}         # column -> LatencyHistogram
+
+    def update(self, df):
+        n = len(df)
+        if n == 0:
+            return
+        for name in RUNNING_COLUMNS:
+            if name not in df:
+                continue
+            values = df[name].to_numpy(dtype=np.float64)
+            mean_b = values.mean()
+            m2_b = float(((values - mean_b) ** 2).sum())
+            mean_a, m2_a = self.moments.get(name, (0.0, 0.0))
+            delta = mean_b - mean_a
+            total = self.count + n
+            self.moments[name] = [
+                mean_a + delta * n / total,
+                m2_a + m2_b + delta * delta * self.count * n / total,
+            ]
+            self.histograms.setdefault(name, LatencyHistogram()).record_many(values)
+        self.count += n
+        self.success += int(df["success"].sum())
+
+    def row(self):
+        out = {"count": self.count}
+        for name, (mean, m2) in self.moments.items():
+            prefix = "latency" if name == "latency" else "response"
+            out[f"avg_{prefix}"] = mean
+            if name == "latency":
+                out["std_latency"] = (m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float("nan")
+            for q in RUNNING_PERCENTILES:
+                out[f"p{q:g}".replace(".", "") + f"_{prefix}"] = self.histograms[name].percentile(q)
+        out["success_rate"] = self.success / self.count * 100 if self.count else 0.0
+        return out
+
+    def to_dict(self):
+        return {
+            "count": self.count, "success": self.success, "moments": self.moments,
+            "histograms": {k: h.to_dict() for k, h in self.histograms.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        s = cls()
+        s.count = state["count"]
+        s.success = state["success"]
+        s.moments = state["moments"]
+        s.histograms = {k: LatencyHistogram.from_dict(h) for k, h in state["histograms"].items()}
+        return s
+
+class ResultSink:
+    """Streams benchmark cells into a ResultStore; resumable"""
+
+    def __init__(self, path, resume=False, group_columns=("algorithm", "workload")):
+        self.store = ResultStore(path, mode="a" if resume else "w")
+        self.group_columns = list(group_columns)
+        meta = self.store.meta
+        self.cells = meta.setdefault("cells", [])
+        self.completed = {tuple(c) for c in self.cells}
+        self.running = {
+            key: RunningStats.from_dict(state)
+            for key, state in meta.get("running", {}).items()
+        }
+
+    def is_done(self, *cell):
+        return tuple(cell) in self.completed
+
+    def write(self, cell, records):
+        """Commit one cell: its rows, its key and the updated running summaries"""
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+        for key, group in df.groupby(self.group_columns, sort=False):
+            key = "|".join(map(str, key))
+            self.running.setdefault(key, RunningStats()).update(group)
+
+        self.cells.append(list(cell))
+        self.completed.add(tuple(cell))
+        self.store.meta["running"] = {k: s.to_dict() for k, s in self.running.items()}
+        if df.empty:
+            self.store._save_meta()
+        else:
+            self.store.append(df)
+
+    def running_row(self, *key):
+        stats = self.running.get("|".join(map(str, key)))
+        return stats.row() if stats else None
+
+    def summary(self):
+        """Running summary table, one row per group (no raw rows are read)"""
+        return summary_table(self.running, self.group_columns)
+
+    def read(self):
+        return self.store.read()
+
+def summary_table(running, group_columns=("algorithm", "workload")):
+    rows = []
+    for key, stats in running.items():
+        row = dict(zip(group_columns, key.split("|")))
+        row.update(stats.row())
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def running_summary(path, group_columns=("algorithm", "workload")):
+    """Running summary table of a ResultSink directory (None for CSV or missing results)"""
+    if not os.path.isfile(os.path.join(path, META_FILE)):
+        return None
+    meta = ResultStore(path, mode="r").meta
+    running = {key: RunningStats.from_dict(state) for key, state in meta.get("running", {}).items()}
+    return summary_table(running, group_columns)
+
+def load_results(path):
+    """Raw results from a store directory or (older runs) a CSV file;
+    `name` without a store directory falls back to `name.csv`"""
+    if os.path.isdir(path):
+        return ResultStore(path, mode="r").read()
+    if not os.path.exists(path) and os.path.exists(path + ".csv"):
+        path += ".csv"
+    return pd.read_csv(path)
+
+# ============================
+# Main: CSV export
+# ============================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: python results_store.py <store_dir> [out.csv]")
+    store = ResultStore(sys.argv[1], mode="r")
+    out = sys.argv[2] if len(sys.argv) > 2 else sys.argv[1].rstrip("/\\") + ".csv"
+    store.to_csv(out)
+    print(f"✅ Saved: {out} ({store.rows} rows)")
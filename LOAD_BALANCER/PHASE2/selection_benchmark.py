@@ -0,0 +1,129 @@
+import time
+import random
+import pandas as pd
+
+import load_balancer as lb
+
+# ============================
+# Selection cost vs. pool size
+# ============================
+# Runs entirely in-process against simulated BackendState objects (no HTTP):
+# compares the incremental score indexes in load_balancer.py with a plain
+# linear min/max scan over get_available_servers(). The hash ring is compared
+# with rendezvous hashing, the linear scheme with the same minimal remapping.
+
+POOL_SIZES = [3, 10, 100, 1000, 10000]
+REQUESTS_PER_SIZE = 20000
+IN_FLIGHT_RATIO = 0.5      # in-flight requests ≈ 50% of pool size (at least 1)
+CRASH_RATIO = 0.05         # share of backends marked crashed before the run
+
+RANDOM_SEED = 42
+
+# Crashed backends stay quarantined for the whole run (no recovery timers)
+lb.RECOVERY_SCHEDULER = lambda delay, callback: None
+
+LINEAR = {
+    "least_connection": lambda: min(lb.get_available_servers(), key=lb.least_connection_score),
+    "weighted_response_time": lambda: max(lb.get_available_servers(), key=lb.weighted_rt_score),
+    "peak_ewma": lambda: min(lb.get_available_servers(), key=lb.ewma_score),
+    "adaptive": lambda: min(lb.get_available_servers(), key=lb.resource_score),
+}
+
+HASH_KEYS = [f"/?item={i}" for i in range(1000)]   # request keys for the hashing strategies
+
+def rendezvous_order(key):
+    """Highest-random-weight score: every candidate is hashed with the key"""
+    return lambda s: lb.hash_point(f"{key}|{s.name}")
+
+def rendezvous_bounded(key):
+    cap = lb.hash_load_cap()
+    candidates = lb.get_available_servers()
+    under = [s for s in candidates if s.active_conns < cap] or candidates
+    return max(under, key=rendezvous_order(key))
+
+LINEAR.update({
+    "consistent_hash": lambda: max(lb.get_available_servers(), key=rendezvous_order(random.choice(HASH_KEYS))),
+    "bounded_load_hash": lambda: rendezvous_bounded(random.choice(HASH_KEYS)),
+})
+
+INDEXED = {name: lb.STRATEGIES[name] for name in LINEAR}
+INDEXED.update({
+    "consistent_hash": lambda: lb.get_server_consistent_hash(random.choice(HASH_KEYS)),
+    "bounded_load_hash": lambda: lb.get_server_bounded_hash(random.choice(HASH_KEYS)),
+})
+
+# ============================
+# Helpers
+# ============================
+
+def build_pool(size, rng):
+    servers = [
+        lb.BackendState(
+            f"sim-{i}",
+            f"http://sim-{i}",
+            weight=rng.choice([1, 3, 5]),
+            avg_response_time=rng.uniform(0.05, 1.0),
+        )
+        for i in range(size)
+    ]
+    for s in servers:
+        s.cpu_usage = rng.randint(0, 90)
+    lb.reset_servers(servers)
+
+    # Crash a few backends so the indexes also skip quarantined servers
+    for s in rng.sample(servers, int(size * CRASH_RATIO)):
+        s.mark_crashed(cpu_usage=100)
+    return servers
+
+
+def run_case(select, size, mode):
+    rng = random.Random(RANDOM_SEED)
+    build_pool(size, rng)
+    in_flight = []
+    max_in_flight = max(1, int(size * IN_FLIGHT_RATIO))
+
+    select_time = 0.0
+    start = time.perf_counter()
+    for _ in range(REQUESTS_PER_SIZE):
+        t0 = time.perf_counter()
+        target = select()
+        select_time += time.perf_counter() - t0
+
+        target.acquire()
+        in_flight.append(target)
+
+        # Complete a random in-flight request once the window is full
+        if len(in_flight) >= max_in_flight:
+            i = rng.randrange(len(in_flight))
+            in_flight[i], in_flight[-1] = in_flight[-1], in_flight[i]
+            in_flight.pop().release(rng.uniform(0.05, 1.0))
+    total_time = time.perf_counter() - start
+
+    return {
+        "pool_size": size,
+        "mode": mode,
+        "select_us": select_time / REQUESTS_PER_SIZE * 1e6,
+        "request_us": total_time / REQUESTS_PER_SIZE * 1e6,
+    }
+
+# ============================
+# Main
+# ============================
+
+if __name__ == "__main__":
+    rows = []
+    for size in POOL_SIZES:
+        for algo in INDEXED:
+            for mode, table in (("indexed", INDEXED), ("linear", LINEAR)):
+                r = run_case(table[algo], size, mode)
+                r["algorithm"] = algo
+                rows.append(r)
+                print(f"▶ n={size:<6} {algo:<24} {mode:<8} "
+                      f"select={r['select_us']:9.2f}µs  request={r['request_us']:9.2f}µs")
+
+    df = pd.DataFrame(rows)
+    df.to_csv("selection_scaling.csv", index=False)
+
+    print("\n=== SELECTION COST (µs / request) ===")
+    print(df.pivot_table(index=["algorithm", "pool_size"], columns="mode", values="select_us").round(2))
+    print("\n✅ Saved: selection_scaling.csv")
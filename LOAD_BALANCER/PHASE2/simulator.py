@@ -0,0 +1,430 @@
+import time
+import heapq
+import itertools
+import random
+import argparse
+import pandas as pd
+
+import load_balancer as lb
+import backend
+import benchmark
+from results_store import ResultSink, running_summary
+
+# ============================
+# Discrete-event simulation
+# ============================
+# Runs the PHASE2 benchmark grid in virtual time, in-process: the selection
+# strategies and BackendState bookkeeping come from load_balancer.py, the
+# CPU / delay / failure-injection / crash models from backend.py. Nothing
+# sleeps -- each request becomes a few heap events (backend done, client
+# timeout), so the full benchmark grid takes seconds instead of hours.
+#
+# Throughput is bounded by the LB code it reuses, not by the event loop:
+# every request still runs selection, acquire/release, circuit, outlier,
+# limiter and histogram bookkeeping in Python. Expect ~10k simulated
+# requests/s per process (360k in ~35 s); a million-request sweep is
+# minutes, not seconds.
+#
+# Arrivals are open-loop, as in benchmark.py: request i is due at
+# t0 + i / TARGET_RPS whatever happened to earlier requests, and its
+# workload params are drawn for the whole run up front. At most
+# `concurrency` requests are in flight (the benchmark's thread pool); a
+# request that has to wait for a free slot counts the delay in its
+# corrected response time.
+#
+# Output uses the raw_results.csv schema of benchmark.py, so the same
+# analysis and plots apply. The response cache is not simulated (the
+# benchmark runs with the cache off).
+
+NETWORK_RTT = 0.001          # LB <-> backend round trip (s), virtual
+
+RANDOM_SEED = 42
+
+# Initial LB view of the backends (copied before any run mutates it)
+SERVER_SPECS = [
+    (s.name, s.url, s.weight, s.avg_response_time, s.pool_size)
+    for s in lb.SERVERS
+]
+
+# ============================
+# Simulation core
+# ============================
+
+class Simulation:
+    def __init__(self, seed=RANDOM_SEED):
+        self.now = 0.0
+        self.events = []                  # heap of (time, seq, callback, args)
+        self.seq = itertools.count()
+
+        # backend.py and load_balancer.py draw from the global RNG
+        random.seed(seed)
+
+        # Fresh LB state; recovery timers become virtual events
+        servers = [
+            lb.BackendState(name, url, weight=w, avg_response_time=rt, pool_size=pool)
+            for name, url, w, rt, pool in SERVER_SPECS
+        ]
+        lb.reset_servers(servers)
+        lb.RECOVERY_SCHEDULER = self.after
+        lb.CLOCK = self.clock
+        lb.HEDGE_DELAYS.clear()
+        lb.HEDGE_LATENCY.clear()
+        lb.SERVER_LATENCY.clear()
+        lb.RETRY_BUDGET = lb.RetryBudget()
+        lb.RR_COUNTER = itertools.count()
+        lb.ADMISSION_QUEUE.clear()
+
+        # One simulated backend per LB entry, matched by port
+        profiles = {p["port"]: p for p in backend.PROFILES}
+        self.nodes = {}
+        for s in servers:
+            p = profiles[int(s.url.rsplit(":", 1)[1])]
+            node = backend.ServerInstance(p["port"], p["name"], p)
+            node.clock = self.clock
+            node.log = lambda *args, **kwargs: None
+            self.nodes[s.name] = node
+
+        self.after(lb.CPU_DECAY_INTERVAL, self.decay_tick)
+        self.after(lb.OUTLIER_INTERVAL, self.outlier_tick)
+
+    def clock(self):
+        return self.now
+
+    def after(self, delay, callback, *args):
+        heapq.heappush(self.events, (self.now + delay, next(self.seq), callback, args))
+
+    def run_until(self, done):
+        """Process events until done() holds (or nothing is left to do)"""
+        events = self.events
+        while not done() and events:
+            self.now, _, callback, args = heapq.heappop(events)
+            callback(*args)
+
+    def advance(self, seconds):
+        """Let virtual time pass (cooldown): timers fire, in-flight requests finish"""
+        end = self.now + seconds
+        self.run_until(lambda: not self.events or self.events[0][0] > end)
+        self.now = end
+
+    def decay_tick(self):
+        lb.decay_cpu_tick()
+        self.after(lb.CPU_DECAY_INTERVAL, self.decay_tick)
+
+    def outlier_tick(self):
+        lb.detect_outliers()
+        self.after(lb.OUTLIER_INTERVAL, self.outlier_tick)
+
+    # ---- request path (mirrors forward_request + ServerInstance.index) ----
+
+    def forward(self, params, on_reply, algorithm=None):
+        """Route one request with the LB's admission / retry / hedging policy;
+        on_reply fires once, with the winning reply"""
+        lb.RETRY_BUDGET.deposit()
+        key = lb.request_hash_key(algorithm or lb.CURRENT_ALGORITHM, None, "/", list(params.items()))
+        target = lb.select_server(algorithm, key)
+        if target is None:
+            body, status = lb.no_server_response()
+            self.after(0.0, on_reply, status, body)
+            return
+
+        if lb.ADMISSION_ENABLED and not lb.has_capacity(target):
+            self.admit(params, on_reply, algorithm, key, self.now + lb.ADMISSION_QUEUE_TIMEOUT)
+        else:
+            self.route(target, params, on_reply, algorithm)
+
+    def admit(self, params, on_reply, algorithm, key, deadline, retry=False):
+        """lb.admit_blocking in virtual time: wait in lb.ADMISSION_QUEUE for a
+        backend below its concurrency limit, or get rejected"""
+        server = lb.select_with_capacity(algorithm, key)
+        if server is not None:
+            if retry:
+                lb.ADMITTED_AFTER_WAIT.incr()
+            self.route(server, params, on_reply, algorithm)
+            return
+        if self.now >= deadline:
+            body, status = lb.queue_timeout_response()
+            on_reply(status, body)
+            return
+
+        waiting = [True]
+
+        def wake():
+            if waiting[0]:
+                waiting[0] = False
+                self.after(0.0, self.admit, params, on_reply, algorithm, key, deadline, True)
+
+        def expire():
+            if waiting[0]:
+                waiting[0] = False
+                lb.ADMISSION_QUEUE.discard(wake)
+                self.admit(params, on_reply, algorithm, key, deadline, True)
+
+        if not lb.ADMISSION_QUEUE.push(wake, retry):
+            body, status = lb.queue_full_response()
+            on_reply(status, body)
+            return
+        self.after(deadline - self.now, expire)
+
+    def route(self, target, params, on_reply, algorithm):
+        """Upstream calls for an admitted request: retry on 503/502, optional hedge"""
+        tried = [target]
+        hold = backend.parse_duration(params.get("duration"))
+        retries = 0
+
+        def attempt(server):
+            state = {"pending": 1, "done": False, "alt": None}
+
+            def on_attempt(server, status, body):
+                state["pending"] -= 1
+                if state["done"]:
+                    return
+                result = lb.hedge_outcome([(server, (body, status))], state["pending"], state["alt"])
+                if result is not None:
+                    state["done"] = True
+                    on_result(*result)
+
+            def hedge():
+                if state["done"]:
+                    return
+                alt = lb.extra_backend(algorithm, tried, "hedges")
+                if alt is not None:
+                    state["alt"] = alt
+                    state["pending"] += 1
+                    self.dispatch(alt, params, lambda status, body: on_attempt(alt, status, body))
+
+            self.dispatch(server, params, lambda status, body: on_attempt(server, status, body))
+            if lb.HEDGING_ENABLED:
+                self.after(lb.hedge_delay(server, hold), hedge)
+
+        def on_result(body, status):
+            nonlocal retries
+            if status in lb.RETRYABLE_STATUS and retries < lb.MAX_RETRIES:
+                server = lb.extra_backend(algorithm, tried, "retries")
+                if server is not None:
+                    retries += 1
+                    attempt(server)
+                    return
+            on_reply(status, body)
+
+        attempt(target)
+
+    def dispatch(self, target, params, on_reply):
+        """One upstream call to an already selected backend"""
+        start = self.now
+        duration = backend.parse_duration(params.get("duration"))
+        target.acquire(duration)
+        node = self.nodes[target.name]
+
+        crashed = node.check_crashed()
+        if crashed is not None:
+            self.after(NETWORK_RTT, self.reply, target, start, 503, crashed, on_reply, duration)
+            return
+
+        node.active_requests += 1
+        cpu, delay, note = node.plan_request(duration)
+        elapsed = delay + NETWORK_RTT
+
+        if elapsed > lb.UPSTREAM_TIMEOUT:
+            # LB gives up first; the backend still finishes its work later
+            self.after(lb.UPSTREAM_TIMEOUT, self.upstream_timeout, target, start, duration, on_reply)
+            self.after(elapsed, self.finish, node, None, start, cpu, delay, note, duration, on_reply)
+            return
+
+        self.after(elapsed, self.finish, node, target, start, cpu, delay, note, duration, on_reply)
+
+    def finish(self, node, target, start, cpu, delay, note, duration, on_reply):
+        body, status = node.complete_request(cpu, delay, note, duration)
+        node.active_requests -= 1
+        if target is not None:
+            self.reply(target, start, status, body, on_reply, duration)
+
+    def reply(self, target, start, status, body, on_reply, hold=0.0):
+        body, status = lb.handle_backend_response(target, status, body)
+        lb.release_server(target, self.now - start, hold)
+        on_reply(status, body)
+
+    def upstream_timeout(self, target, start, hold, on_reply):
+        body, status = lb.handle_backend_error(target, TimeoutError("upstream timeout"))
+        lb.release_server(target, self.now - start, hold)
+        on_reply(status, body)
+
+    # ---- client (mirrors benchmark.send_request) ----
+
+    def send(self, params, on_result, intended=None, algorithm=None):
+        start = self.now
+        intended = start if intended is None else intended
+        timeout = benchmark.REQUEST_TIMEOUT
+        state = {"done": False}
+
+        def on_reply(status, body):
+            if state["done"]:
+                return
+            state["done"] = True
+            on_result({
+                "latency": (self.now - start) * 1000,
+                "response_time": (self.now - intended) * 1000,
+                "status": status,
+                "server": body.get("server", "unknown"),
+                "success": 1 if status == 200 else 0,
+                "algorithm": algorithm
+            })
+
+        def on_timeout():
+            if state["done"]:
+                return
+            state["done"] = True
+            on_result({
+                "latency": timeout * 1000,
+                "response_time": (self.now - intended) * 1000,
+                "status": 504,
+                "server": "timeout",
+                "success": 0,
+                "algorithm": algorithm
+            })
+
+        self.forward(params, on_reply, algorithm)
+        self.after(timeout, on_timeout)
+
+    def run_requests(self, workload, total, concurrency, rps=None, algorithms=(None,)):
+        """`concurrency` workers, each takes the next request when the last returns
+
+        With `rps`, request i is intended to start at t0 + i / rps (as in
+        benchmark.make_schedule): a free worker waits for that time, a late
+        one counts the delay in response_time. Request i is routed with
+        algorithms[i % len(algorithms)] (None: lb.CURRENT_ALGORITHM)."""
+        results = []
+        issued = 0
+        t0 = self.now + (benchmark.SCHEDULE_LEAD if rps else 0)
+        # Whole run drawn in one batch, like benchmark.run_single_experiment
+        params = [benchmark.workload_params(workload) for _ in range(total)]
+
+        def on_result(r):
+            results.append(r)
+            issue()
+
+        def issue():
+            nonlocal issued
+            if issued < total:
+                intended = t0 + issued / rps if rps else self.now
+                algorithm = algorithms[issued % len(algorithms)]
+                p = params[issued]
+                issued += 1
+                if intended > self.now:
+                    self.after(intended - self.now, self.send, p, on_result, intended, algorithm)
+                else:
+                    self.send(p, on_result, intended, algorithm)
+
+        for _ in range(min(concurrency, total)):
+            issue()
+        self.run_until(lambda: len(results) >= total)
+        return results
+
+# ============================
+# Benchmark grid
+# ============================
+
+def run_single_experiment(sim, algo, workload, run_id, total, concurrency):
+    """One cell, routed per request like benchmark.py (no /config switch,
+    no cooldown); benchmark.INTERLEAVED runs all algorithms interleaved"""
+    algos = benchmark.cell_algorithms(algo)
+    sim.run_requests("constant", benchmark.WARMUP_REQUESTS, 1, algorithms=algos)
+
+    results = sim.run_requests(workload, total * len(algos), concurrency,
+                               benchmark.TARGET_RPS, algorithms=algos)
+    for r in results:
+        r["workload"] = workload
+        r["run_id"] = run_id
+    return results
+
+def run_benchmark(total=benchmark.TOTAL_REQUESTS, repeats=benchmark.REPEATS,
+                  concurrency=benchmark.CONCURRENCY, seed=RANDOM_SEED, verbose=True,
+                  results_dir=None, interleave=False):
+    """Raw results as a DataFrame; with results_dir, each run is streamed to a
+    ResultSink there instead of being kept in memory"""
+    sim = Simulation(seed)
+    sink = ResultSink(results_dir) if results_dir else None
+    all_results = []
+
+    for algo, workload, run in benchmark.grid_cells(interleave, repeats):
+        if verbose:
+            print(f"▶ Algo={algo} | Workload={workload} | Run={run}")
+        batch = run_single_experiment(sim, algo, workload, run, total, concurrency)
+        if sink is not None:
+            sink.write((algo, workload, run), batch)
+        else:
+            all_results.extend(batch)
+
+    return sink.read() if sink is not None else pd.DataFrame(all_results)
+
+def run_sweep(ewma_decays, recovery_times, **kwargs):
+    """Summary per (EWMA_DECAY, BACKEND_RECOVERY_TIME) point of the grid"""
+    saved = lb.EWMA_DECAY, lb.BACKEND_RECOVERY_TIME
+    summaries = []
+    try:
+        for decay in ewma_decays:
+            for recovery in recovery_times:
+                print(f"▶ EWMA_DECAY={decay} | BACKEND_RECOVERY_TIME={recovery}")
+                lb.EWMA_DECAY = decay
+                lb.BACKEND_RECOVERY_TIME = recovery
+                summary = benchmark.analyze(run_benchmark(verbose=False, **kwargs))
+                summary.insert(0, "backend_recovery_time", recovery)
+                summary.insert(0, "ewma_decay", decay)
+                summaries.append(summary)
+    finally:
+        lb.EWMA_DECAY, lb.BACKEND_RECOVERY_TIME = saved
+
+    return pd.concat(summaries, ignore_index=True)
+
+# ============================
+# Main
+# ============================
+
+def parse_floats(text):
+    return [float(x) for x in text.split(",") if x.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Discrete-event LB benchmark (virtual time)")
+    parser.add_argument("--requests", type=int, default=benchmark.TOTAL_REQUESTS,
+                        help="requests per run (default: same as benchmark.py)")
+    parser.add_argument("--repeats", type=int, default=benchmark.REPEATS)
+    parser.add_argument("--concurrency", type=int, default=benchmark.CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    parser.add_argument("--interleave", action="store_true",
+                        help="run all algorithms interleaved in every cell (A/B on the same backends)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="enable the LB's hedged requests (duplicate after the backend's "
+                             f"p{lb.HEDGE_PERCENTILE:g} service time)")
+    parser.add_argument("--sweep-ewma", type=parse_floats, metavar="A,B,...",
+                        help="EWMA_DECAY values to sweep")
+    parser.add_argument("--sweep-recovery", type=parse_floats, metavar="A,B,...",
+                        help="BACKEND_RECOVERY_TIME values (s) to sweep")
+    parser.add_argument("--csv", action="store_true",
+                        help="also export the raw results to sim_raw_results.csv")
+    args = parser.parse_args()
+    lb.HEDGING_ENABLED = args.hedge
+
+    grid = dict(total=args.requests, repeats=args.repeats,
+                concurrency=args.concurrency, seed=args.seed, interleave=args.interleave)
+    wall = time.perf_counter()
+
+    if args.sweep_ewma or args.sweep_recovery:
+        print("=== PARAMETER SWEEP (virtual time) ===")
+        sweep = run_sweep(args.sweep_ewma or [lb.EWMA_DECAY],
+                          args.sweep_recovery or [lb.BACKEND_RECOVERY_TIME], **grid)
+        sweep.to_csv("sim_sweep_results.csv", index=False)
+        print(sweep)
+        print(f"\n✅ Saved: sim_sweep_results.csv ({time.perf_counter() - wall:.1f}s wall)")
+    else:
+        print("=== SIMULATED BENCHMARK (virtual time) ===")
+        df = run_benchmark(results_dir="sim_raw_results", **grid)
+        summary = benchmark.analyze(df, running_summary("sim_raw_results"))
+
+        if args.csv:
+            df.to_csv("sim_raw_results.csv", index=False)
+        summary.to_csv("sim_summary_results.csv", index=False)
+
+        print("\n=== SUMMARY (Mean ± Std) ===")
+        print(summary)
+        print(f"\n{len(df)} requests in {time.perf_counter() - wall:.1f}s wall")
+        print("✅ Saved: sim_raw_results/" + (" + sim_raw_results.csv" if args.csv else ""))
+        print("✅ Saved: sim_summary_results.csv")
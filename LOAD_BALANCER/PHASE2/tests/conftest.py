@@ -0,0 +1,42 @@
+import os
+import sys
+import itertools
+
+import pytest
+
+# The PHASE2 modules are flat scripts imported by name (as the benchmarks do)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import load_balancer as lb
+
+
+@pytest.fixture
+def lb_state(monkeypatch):
+    """Isolate the LB's module globals: anything a test swaps is restored,
+    and the original backend list is reinstated afterwards"""
+    original = list(lb.SERVERS)
+    monkeypatch.setattr(lb, "RECOVERY_SCHEDULER", lambda delay, callback: None)
+    for name in ("CLOCK", "RETRY_BUDGET", "RR_COUNTER", "HEDGING_ENABLED", "ADMISSION_ENABLED",
+                 "OUTLIER_DETECTION_ENABLED"):
+        monkeypatch.setattr(lb, name, getattr(lb, name))
+    yield lb
+    lb.reset_servers(original)
+
+
+def make_servers(n, prefix="node"):
+    return [
+        lb.BackendState(f"{prefix}-{i}", f"http://127.0.0.1:{9000 + i}", weight=1, avg_response_time=0.1)
+        for i in range(n)
+    ]
+
+
+@pytest.fixture
+def servers(lb_state):
+    pool = make_servers(5)
+    lb.reset_servers(pool)
+    lb.RR_COUNTER = itertools.count()
+    yield pool
+    # Requests a test left in flight would still count in the LB-wide totals (hash_load_cap)
+    for s in pool:
+        while s.active_conns:
+            s.release(0.0)
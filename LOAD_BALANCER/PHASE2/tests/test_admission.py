@@ -0,0 +1,42 @@
+import load_balancer as lb
+
+
+def fill(server, hold=0.0):
+    while lb.has_capacity(server):
+        server.acquire(hold)
+
+
+def test_held_requests_count_against_the_limit(servers):
+    s = servers[0]
+    fill(s, hold=2.0)
+    assert s.held == s.active_conns >= s.limiter.limit
+    assert not lb.has_capacity(s)
+
+
+def test_full_backend_falls_back_to_most_spare_capacity(servers):
+    first = lb.select_server("round_robin")
+    lb.RR_COUNTER = iter([0, 0])          # round robin picks `first` again
+    fill(first)
+    servers[3].acquire()                  # less room than the other idle backends
+
+    fallbacks = lb.ADMISSION_FALLBACKS.value
+    chosen = lb.select_with_capacity("round_robin")
+    assert chosen is not first and chosen is not servers[3]
+    assert lb.has_capacity(chosen)
+    assert lb.ADMISSION_FALLBACKS.value - fallbacks == 1
+
+
+def test_keyed_fallback_follows_the_ring(servers):
+    key = "/?item=42"
+    owner = lb.select_server("consistent_hash", key)
+    fill(owner)
+    expected = next(s for s in lb.HASH_RING.walk(key) if s is not owner)
+    assert lb.select_with_capacity("consistent_hash", key) is expected
+
+
+def test_queue_only_when_every_backend_is_full(servers):
+    for s in servers:
+        fill(s)
+    assert lb.select_with_capacity("p2c") is None
+    servers[2].release(0.1)
+    assert lb.select_with_capacity("p2c") is servers[2]
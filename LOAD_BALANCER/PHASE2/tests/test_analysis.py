@@ -0,0 +1,44 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+from results_store import ResultSink, running_summary
+
+
+def make_cell(algorithm, rng, n=2000):
+    return [
+        {
+            "algorithm": algorithm,
+            "workload": "constant",
+            "run_id": 1,
+            "server": "Server_A",
+            "latency": rng.lognormvariate(5, 1),
+            "response_time": rng.lognormvariate(6, 1),
+            "status": 200,
+            "success": 1,
+        }
+        for _ in range(n)
+    ]
+
+
+def test_summary_reports_hdr_percentiles(tmp_path):
+    path = str(tmp_path / "raw")
+    rng = random.Random(1)
+    sink = ResultSink(path)
+    for algorithm in ("p2c", "round_robin"):
+        sink.write((algorithm, "constant", 1), make_cell(algorithm, rng))
+
+    summary = benchmark.analyze(sink.read(), running_summary(path))
+    for name in ("p50_latency", "p95_latency", "p99_response"):
+        # HDR (3 significant digits) against exact interpolated percentiles
+        np.testing.assert_allclose(summary[f"hdr_{name}"], summary[name], rtol=0.01)
+
+
+def test_summary_without_running_state(tmp_path):
+    rng = random.Random(2)
+    df = pd.DataFrame(make_cell("p2c", rng, n=100))
+    assert running_summary(str(tmp_path / "missing")) is None
+    summary = benchmark.analyze(df, None)
+    assert not [c for c in summary.columns if c.startswith("hdr_")]
@@ -0,0 +1,27 @@
+import random
+import time
+
+import benchmark
+
+
+def fake_send(req_id, workload, params=None, intended=None, algo=None):
+    # Finish out of order: later requests often complete first
+    time.sleep(random.random() * 0.01)
+    return {"latency": float(params["i"]), "algorithm": algo, "status": 200}
+
+
+def test_workers_return_records_in_schedule_order(monkeypatch):
+    monkeypatch.setattr(benchmark, "send_request", fake_send)
+    n = 50
+    schedule = [time.time()] * n
+    policies = [("p2c", "round_robin")[i % 2] for i in range(n)]
+    params = [{"i": i} for i in range(n)]
+
+    workers = benchmark.LoadWorkers(3)   # forked after the patch: they see fake_send
+    try:
+        results = workers.run("constant", schedule, 8, policies, params)
+    finally:
+        workers.close()
+
+    assert [r["latency"] for r in results] == list(range(n))
+    assert [r["algorithm"] for r in results] == policies
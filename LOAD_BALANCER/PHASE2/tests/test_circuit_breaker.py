@@ -0,0 +1,106 @@
+import load_balancer as lb
+from load_balancer import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def half_open_breaker():
+    cb = CircuitBreaker()
+    cb.on_failure(hard=True)
+    cb.on_open_timeout(cb.transitions)
+    assert cb.state == HALF_OPEN
+    return cb
+
+
+def test_opens_on_failure_rate():
+    cb = CircuitBreaker()
+    for _ in range(lb.CB_MIN_CALLS // 2):
+        assert cb.on_success() is None
+    transition = None
+    for _ in range(lb.CB_MIN_CALLS // 2):
+        transition = cb.on_failure()
+    assert transition is not None and transition[:2] == (CLOSED, OPEN)
+    assert not cb.allows_traffic()
+
+
+def test_stays_closed_below_min_calls():
+    cb = CircuitBreaker()
+    for _ in range(lb.CB_MIN_CALLS - 1):
+        cb.on_failure()
+    assert cb.state == CLOSED
+
+
+def test_hard_failure_opens_immediately():
+    cb = CircuitBreaker()
+    old, new, _, _ = cb.on_failure(hard=True)
+    assert (old, new) == (CLOSED, OPEN)
+
+
+def test_open_timeout_ignores_stale_token():
+    cb = CircuitBreaker()
+    cb.on_failure(hard=True)
+    stale = cb.transitions - 1
+    assert cb.on_open_timeout(stale) is None
+    assert cb.state == OPEN
+    assert cb.on_open_timeout(cb.transitions)[:2] == (OPEN, HALF_OPEN)
+
+
+def test_half_open_closes_after_successful_trials():
+    cb = half_open_breaker()
+    transition = None
+    for _ in range(lb.CB_HALF_OPEN_CALLS):
+        cb.on_admit()
+        transition = cb.on_success()
+        cb.on_release()
+    assert transition[:2] == (HALF_OPEN, CLOSED)
+
+
+def test_half_open_failure_reopens():
+    cb = half_open_breaker()
+    cb.on_admit()
+    assert cb.on_failure()[:2] == (HALF_OPEN, OPEN)
+
+
+def test_half_open_limits_trials_in_flight():
+    cb = half_open_breaker()
+    for _ in range(lb.CB_HALF_OPEN_CALLS):
+        assert cb.allows_traffic()
+        cb.on_admit()
+    assert not cb.allows_traffic()
+
+    # A trial that ends without a verdict (cancelled hedge, client gone) frees its slot
+    assert cb.on_release()
+    assert cb.allows_traffic()
+    assert cb.state == HALF_OPEN
+
+
+def test_probe_failures_open_a_closed_breaker():
+    cb = CircuitBreaker()
+    for _ in range(lb.CB_PROBE_FAILURES - 1):
+        assert cb.on_probe(False, open_for=0) is None
+    assert cb.on_probe(False, open_for=0)[:2] == (CLOSED, OPEN)
+    assert cb.on_probe(True, open_for=0)[:2] == (OPEN, HALF_OPEN)
+
+
+def test_backend_returns_to_rotation_after_cancelled_trials(servers):
+    s = servers[0]
+    s.mark_crashed(cpu_usage=100)
+    assert not s.in_rotation
+    lb.end_open(s, s.circuit.transitions)
+    assert s.circuit.state == HALF_OPEN and s.in_rotation
+
+    for _ in range(lb.CB_HALF_OPEN_CALLS):
+        s.acquire()
+    assert not s.in_rotation
+    s.release(0.1)
+    assert s.in_rotation
+
+
+def test_client_error_counts_as_trial_success(servers):
+    s = servers[0]
+    s.mark_crashed(cpu_usage=100)
+    lb.end_open(s, s.circuit.transitions)
+    for _ in range(lb.CB_HALF_OPEN_CALLS):
+        s.acquire()
+        lb.handle_backend_response(s, 404, {"error": "not found"})
+        s.release(0.1)
+    assert s.circuit.state == CLOSED
+    assert s.in_rotation
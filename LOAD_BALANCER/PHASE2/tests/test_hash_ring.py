@@ -0,0 +1,76 @@
+import load_balancer as lb
+from conftest import make_servers
+
+KEYS = [f"/?item={i}" for i in range(2000)]
+
+
+def owners(algorithm="consistent_hash"):
+    return {k: lb.select_server(algorithm, k) for k in KEYS}
+
+
+def test_same_key_same_backend(servers):
+    first = owners()
+    assert owners() == first
+    # Keys spread over every backend (100 virtual nodes each)
+    assert set(first.values()) == set(servers)
+
+
+def test_toggle_remaps_only_the_toggled_backends_keys(servers):
+    before = owners()
+    victim = servers[2]
+
+    lb.apply_toggle({"name": victim.name, "action": "off"})
+    during = owners()
+    moved = [k for k in KEYS if during[k] is not before[k]]
+    assert moved == [k for k in KEYS if before[k] is victim]
+    assert victim not in during.values()
+
+    lb.apply_toggle({"name": victim.name, "action": "on"})
+    assert owners() == before
+
+
+def test_adding_a_backend_only_takes_keys_for_itself(servers):
+    before = {k: s.name for k, s in owners().items()}
+    newcomer = make_servers(1, prefix="extra")[0]
+    lb.reset_servers(servers + [newcomer])
+
+    after = {k: s.name for k, s in owners().items()}
+    moved = [k for k in KEYS if after[k] != before[k]]
+    assert moved
+    assert all(after[k] == newcomer.name for k in moved)
+    # Roughly its fair share of the keys, not a reshuffle
+    assert len(moved) < len(KEYS) / 3
+
+
+def test_ring_is_independent_of_backend_order(servers):
+    before = {k: s.name for k, s in owners().items()}
+    lb.reset_servers(list(reversed(servers)))
+    assert {k: s.name for k, s in owners().items()} == before
+
+
+def test_bounded_load_spills_past_a_full_backend(servers):
+    before = owners("bounded_load_hash")
+    assert before == owners()   # idle cluster: same as plain consistent hashing
+
+    hot = servers[0]
+    for _ in range(10):
+        hot.acquire()
+    assert hot.active_conns >= lb.hash_load_cap()
+
+    spills = lb.HASH_SPILLS.value
+    after = owners("bounded_load_hash")
+    hot_keys = [k for k in KEYS if before[k] is hot]
+    assert all(after[k] is not hot for k in hot_keys)
+    assert all(after[k] is before[k] for k in KEYS if before[k] is not hot)
+    assert lb.HASH_SPILLS.value - spills == len(hot_keys)
+
+    for _ in range(10):
+        hot.release(0.1)
+    assert owners("bounded_load_hash") == before
+
+
+def test_no_candidates(servers):
+    for s in servers:
+        lb.apply_toggle({"name": s.name, "action": "off"})
+    assert lb.select_server("consistent_hash", KEYS[0]) is None
+    assert lb.select_server("bounded_load_hash", KEYS[0]) is None
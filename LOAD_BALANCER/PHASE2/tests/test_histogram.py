@@ -0,0 +1,100 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import load_balancer as lb
+from histogram import LatencyHistogram
+
+
+def exact_percentile(values, q):
+    """Nearest-rank percentile, the definition LatencyHistogram follows"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1]
+
+
+@pytest.mark.parametrize("q", [0, 50, 90, 99, 99.9, 100])
+def test_percentiles_within_relative_error(q):
+    rng = random.Random(1)
+    values = [rng.lognormvariate(5, 1.2) for _ in range(20000)]
+    hist = LatencyHistogram.from_values(values)
+
+    exact = exact_percentile(values, q)
+    # 3 significant digits: never below the exact value, at most 0.1% above
+    assert exact - 1e-3 <= hist.percentile(q) <= exact * 1.001 + 1e-3
+
+
+def test_summary_counts_mean_and_max():
+    values = [1.0, 2.0, 3.0, 4.0, 1000.0]
+    s = LatencyHistogram.from_values(values).summary()
+    assert s["count"] == 5
+    assert s["mean"] == pytest.approx(np.mean(values))
+    assert s["max"] == 1000.0
+    assert s["p50"] == pytest.approx(3.0, rel=1e-3)
+
+
+def test_empty_histogram():
+    hist = LatencyHistogram()
+    assert hist.percentile(99) == 0.0
+    assert hist.mean() == 0.0
+
+
+def test_merge_matches_recording_everything():
+    rng = random.Random(2)
+    a_values = [rng.uniform(1, 500) for _ in range(3000)]
+    b_values = [rng.uniform(100, 5000) for _ in range(3000)]
+    merged = LatencyHistogram.from_values(a_values)
+    merged.merge(LatencyHistogram.from_values(b_values))
+    both = LatencyHistogram.from_values(a_values + b_values)
+
+    assert merged.counts == both.counts
+    assert (merged.total, merged.sum, merged.min, merged.max) == (both.total, both.sum, both.min, both.max)
+
+
+def test_dict_round_trip():
+    hist = LatencyHistogram.from_values([0.5, 12.25, 12.25, 3000.0])
+    restored = LatencyHistogram.from_dict(hist.to_dict())
+    assert restored.counts == hist.counts
+    assert restored.summary() == hist.summary()
+
+
+def test_cumulative_counts():
+    hist = LatencyHistogram.from_values([1, 2, 3, 10, 100])
+    assert hist.cumulative_counts([0.5, 3.5, 20, 1000]) == [0, 3, 4, 5]
+
+
+def test_record_many_matches_record():
+    rng = random.Random(3)
+    values = [rng.lognormvariate(5, 2) for _ in range(20000)] + [0.0, 0.0004, 12.25, 5e6, -1.0]
+    one_by_one = LatencyHistogram.from_values(values)
+    bulk = LatencyHistogram()
+    bulk.record_many(np.array(values[:7000]))
+    bulk.record_many(values[7000:])
+    bulk.record_many([])
+
+    assert bulk.counts == one_by_one.counts
+    assert (bulk.total, bulk.sum, bulk.min, bulk.max) == \
+        (one_by_one.total, one_by_one.sum, one_by_one.min, one_by_one.max)
+
+
+def test_windowed_histogram_slides_on_lb_clock(lb_state):
+    now = [0.0]
+    lb.CLOCK = lambda: now[0]
+    hist = lb.WindowedHistogram(window=60, slots=6)
+
+    hist.record(0.2)
+    now[0] = 30.0
+    hist.record(0.4)
+    assert hist.merged().total == 2
+
+    # First sample's slot leaves the window, the second one is still inside
+    now[0] = 65.0
+    assert hist.merged().total == 1
+    now[0] = 200.0
+    assert hist.merged().total == 0
+
+    # Lifetime counts (/metrics) never slide
+    _, total_sum, total = hist.prometheus_buckets([1.0])
+    assert total == 2
+    assert total_sum == pytest.approx(0.6)
@@ -0,0 +1,30 @@
+import load_balancer as lb
+from conftest import make_servers
+
+# PHASE1's deliberately uneven backends: Fast / Medium / Slow base delay
+BASE_DELAYS = (0.10, 0.35, 0.90)
+
+
+def heterogeneous_interval():
+    servers = make_servers(3)
+    lb.reset_servers(servers)
+    for s, delay in zip(servers, BASE_DELAYS):
+        for i in range(50):
+            s.outlier.record_latency(delay * (1.6 if i == 49 else 1.0))
+    return servers
+
+
+def test_off_by_default(lb_state):
+    assert lb.OUTLIER_DETECTION_ENABLED is False
+    servers = heterogeneous_interval()
+    lb.detect_outliers()
+    assert not any(s.ejected for s in servers)
+    assert all(s.in_rotation for s in servers)
+
+
+def test_enabled_ejects_the_slow_backend(lb_state):
+    lb.OUTLIER_DETECTION_ENABLED = True
+    servers = heterogeneous_interval()
+    lb.detect_outliers()
+    assert [s.ejected for s in servers] == [False, False, True]
+    assert not servers[2].in_rotation
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from results_store import ResultSink, ResultStore, load_results
+
+
+def make_records(algorithm, workload, n, run_id=0, offset=0.0):
+    return [
+        {
+            "algorithm": algorithm,
+            "workload": workload,
+            "run_id": run_id,
+            "server": f"Server_{'ABC'[i % 3]}",
+            "latency": 100.0 + offset + i * 0.5,
+            "response_time": 110.0 + offset + i * 0.5,
+            "status": 200 if i % 10 else 503,
+            "success": 1 if i % 10 else 0,
+        }
+        for i in range(n)
+    ]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "store")
+    records = make_records("p2c", "constant", 50) + make_records("round_robin", "burst", 30)
+    store = ResultStore(path, mode="w")
+    store.append(records[:50])
+    store.append(records[50:])
+
+    df = ResultStore(path, mode="r").read()
+    expected = pd.DataFrame(records)
+    assert len(df) == 80
+    assert list(df.columns) == list(expected.columns)
+    for name in ("algorithm", "workload", "server"):
+        assert df[name].astype(str).tolist() == expected[name].tolist()
+    for name in ("run_id", "status", "success"):
+        assert df[name].tolist() == expected[name].tolist()
+    np.testing.assert_allclose(df["latency"], expected["latency"], rtol=1e-6)
+
+
+def test_column_mismatch_is_rejected(tmp_path):
+    store = ResultStore(str(tmp_path / "store"), mode="w")
+    store.append(make_records("p2c", "constant", 5))
+    with pytest.raises(ValueError):
+        store.append([{"algorithm": "p2c", "latency": 1.0}])
+
+
+def test_partial_append_is_truncated(tmp_path):
+    path = str(tmp_path / "store")
+    ResultStore(path, mode="w").append(make_records("p2c", "constant", 10))
+
+    # A crash mid-append leaves bytes past the committed row count
+    with open(os.path.join(path, "latency.bin"), "ab") as f:
+        f.write(b"\x00" * 12)
+    assert len(ResultStore(path, mode="r").read()) == 10
+
+    store = ResultStore(path, mode="a")
+    store.append(make_records("p2c", "constant", 4))
+    df = ResultStore(path, mode="r").read()
+    assert len(df) == 14
+    assert df["latency"].iloc[10] == pytest.approx(100.0)
+
+
+def test_sink_resume(tmp_path):
+    path = str(tmp_path / "sink")
+    sink = ResultSink(path)
+    sink.write(("p2c", "constant", 0), make_records("p2c", "constant", 20, run_id=0))
+
+    # Reopened after an interruption: done cells and running summaries survive
+    resumed = ResultSink(path, resume=True)
+    assert resumed.is_done("p2c", "constant", 0)
+    assert not resumed.is_done("p2c", "constant", 1)
+    assert resumed.running_row("p2c", "constant")["count"] == 20
+
+    resumed.write(("p2c", "constant", 1), make_records("p2c", "constant", 20, run_id=1, offset=50.0))
+    row = resumed.running_row("p2c", "constant")
+    df = resumed.read()
+    assert len(df) == 40
+    assert row["count"] == 40
+    assert row["avg_latency"] == pytest.approx(df["latency"].mean(), rel=1e-6)
+    assert row["success_rate"] == pytest.approx(90.0)
+
+
+def test_sink_without_resume_starts_empty(tmp_path):
+    path = str(tmp_path / "sink")
+    ResultSink(path).write(("p2c", "constant", 0), make_records("p2c", "constant", 5))
+    fresh = ResultSink(path)
+    assert not fresh.is_done("p2c", "constant", 0)
+    assert len(fresh.read()) == 0
+
+
+def test_load_results_falls_back_to_csv(tmp_path):
+    pd.DataFrame(make_records("p2c", "constant", 5)).to_csv(tmp_path / "raw_results.csv", index=False)
+    assert len(load_results(str(tmp_path / "raw_results"))) == 5
+    assert len(load_results(str(tmp_path / "raw_results.csv"))) == 5
@@ -0,0 +1,16 @@
+import load_balancer as lb
+
+
+def test_unknown_algorithm_is_counted_like_any_request(lb_state):
+    client = lb.app.test_client()
+    requests_before = lb.TOTAL_REQUESTS.value
+    samples_before = lb.LATENCY_ALL.merged().total
+
+    resp = client.get("/", headers={lb.ALGORITHM_HEADER: "no_such_policy"})
+    assert resp.status_code == 400
+    assert "no_such_policy" in resp.get_json()["error"]
+
+    # Same request on both sides of /stats: the counter and the percentiles
+    assert lb.TOTAL_REQUESTS.value - requests_before == 1
+    assert lb.LATENCY_ALL.merged().total - samples_before == 1
+    assert "no_such_policy" not in lb.POLICY_LATENCY
@@ -0,0 +1,39 @@
+import pytest
+
+import load_balancer as lb
+import simulator
+
+FIELDS = ("server", "status", "latency", "response_time", "algorithm")
+
+
+def run(seed, workload="burst", algorithms=("p2c", "round_robin", "peak_ewma")):
+    sim = simulator.Simulation(seed)
+    results = sim.run_requests(workload, 600, 40, rps=100, algorithms=algorithms)
+    return [tuple(r[f] for f in FIELDS) for r in results]
+
+
+def test_same_seed_same_results(lb_state):
+    assert run(seed=3) == run(seed=3)
+
+
+def test_different_seed_different_results(lb_state):
+    assert run(seed=3) != run(seed=4)
+
+
+@pytest.mark.parametrize("workload", ["constant", "heavy_tail"])
+def test_hedged_runs_are_reproducible(lb_state, workload):
+    lb.HEDGING_ENABLED = True
+    first = run(seed=5, workload=workload)
+    assert run(seed=5, workload=workload) == first
+    assert sum(c["hedges"].value for c in lb.RESILIENCE_COUNTERS.values()) > 0
+
+
+def test_admission_runs_are_reproducible(lb_state):
+    lb.ADMISSION_ENABLED = True
+    assert run(seed=6, workload="heavy_tail") == run(seed=6, workload="heavy_tail")
+
+
+def test_every_request_gets_one_result(lb_state):
+    results = run(seed=7)
+    assert len(results) == 600
+    assert {r[-1] for r in results} == {"p2c", "round_robin", "peak_ewma"}